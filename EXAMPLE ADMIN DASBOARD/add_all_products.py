@@ -3,138 +3,655 @@
 Script to add all products from shop.html to the database
 """
 
-import re
-import psycopg2
+import argparse
+import io
+import itertools
+import json
 import os
-from dotenv import load_dotenv
+import sys
+import time
+import psycopg2
+import psycopg2.extras
+
+import catalog_search
+import catalog_snapshot
+import category_summary
+import db_access
+import instrumentation
+import staged_reload
+from catalog_load import (
+    ACQUIRE_IMPORT_LOCK, ADOPT_UNKEYED_ROWS, ANALYZE_PRODUCTS, CLEAR_PRODUCTS, DELETE_REMOVED_PRODUCTS,
+    DELETE_UNKEYED_PRODUCTS, HAS_UNKEYED_ROWS, IMPORT_LOCK, INSERT_PRODUCT, PRODUCT_COLUMNS, STORED_HASHES,
+    UPSERT_PRODUCT, ProductSync, hashes_by_key, keyed_batch, product_row, require_load_columns,
+    require_sync_columns
+)
+from catalog_pipeline import (
+    DEFAULT_BATCH_SIZE, DEFAULT_QUEUE_SIZE, SHOP_PAGE, catalog_batches, multi_source_batches,
+    dedupe_stage, normalize_product, product_stream, validate_product
+)
+from js_literal_parser import iter_array_objects
 
-# Load environment variables
-load_dotenv()
+# product_images (as in database/schema.sql) plus the derivative metadata written by --images
+PRODUCT_IMAGES_DDL = (
+    """CREATE TABLE IF NOT EXISTS product_images (
+        id SERIAL PRIMARY KEY,
+        product_id INTEGER REFERENCES products(id) ON DELETE CASCADE,
+        image_url VARCHAR(500) NOT NULL,
+        alt_text VARCHAR(255),
+        sort_order INTEGER DEFAULT 0,
+        is_primary BOOLEAN DEFAULT FALSE,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )""",
+    "ALTER TABLE product_images ADD COLUMN IF NOT EXISTS width INTEGER",
+    "ALTER TABLE product_images ADD COLUMN IF NOT EXISTS height INTEGER",
+    "ALTER TABLE product_images ADD COLUMN IF NOT EXISTS byte_size INTEGER",
+    "ALTER TABLE product_images ADD COLUMN IF NOT EXISTS content_hash CHAR(64)",
+    "ALTER TABLE product_images ADD COLUMN IF NOT EXISTS variants JSONB",
+)
 
-def extract_products_from_html():
+# Rough COPY/execute_values throughput used by --plan to estimate load time
+ESTIMATED_LOAD_BYTES_PER_SECOND = 5 * 1024 * 1024
+
+def extract_products_from_html(path=SHOP_PAGE):
     """Extract product data from shop.html"""
+    metrics = instrumentation.current()
     products = []
-    
-    with open('pages/shop.html', 'r', encoding='utf-8') as f:
-        content = f.read()
-    
-    # Find the allProducts array
-    pattern = r"const allProducts = \[(.*?)\];"
-    match = re.search(pattern, content, re.DOTALL)
-    
-    if not match:
-        print("Could not find allProducts array in shop.html")
-        return []
-    
-    products_text = match.group(1)
-    
-    # Use a more sophisticated regex that properly handles escaped apostrophes
-    # This pattern matches content between quotes, including escaped apostrophes
-    product_pattern = r"\{\s*image:\s*'((?:[^'\\]|\\.)*)',\s*title:\s*'((?:[^'\\]|\\.)*)',\s*collection:\s*'((?:[^'\\]|\\.)*)',\s*price:\s*'((?:[^'\\]|\\.)*)',\s*rating:\s*'((?:[^'\\]|\\.)*)'\s*\}"
-    product_matches = re.findall(product_pattern, products_text, re.DOTALL)
-    
-    for i, match in enumerate(product_matches):
-        image_path, title, collection, price, rating = match
-        
-        # Convert image path to database format
-        if image_path.startswith('../etsy_images/'):
-            image_path = image_path.replace('../etsy_images/', 'etsy_images/')
-        
-        # Extract price as number
-        price_str = price.replace('$', '').replace(',', '')
-        try:
-            price_value = float(price_str)
-            original_price = price_value * 1.2  # 20% markup for original price
-        except ValueError:
-            price_value = 22.00
-            original_price = 26.40
-        
-        # Use the exact title from frontend (including apostrophes)
-        # Convert escaped apostrophes back to regular ones
-        product_name = title.replace("\\'", "'")
-        
-        product = {
-            'name': product_name,  # Exact name from frontend
-            'description': f"Quality printed design - {product_name}",
-            'price': price_value,
-            'original_price': original_price,
-            'image_url': image_path,
-            'category': collection.replace(' Collection', ''),
-            'subcategory': 'Featured',
-            'tags': ['custom', 'printed', 'quality'],
-            'stock_quantity': 50,
-            'is_featured': True,
-            'is_on_sale': True,
-            'sale_percentage': 15
-        }
+    for product in product_stream(path):
         products.append(product)
-        print(f"Extracted product {len(products)}: {product_name}")
+        metrics.count('products_extracted')
+        metrics.progress('products_extracted', 'products extracted')
+    
+    if not products:
+        print(f"Could not find any products in the allProducts array of {path}")
     
     return products
 
-def add_products_to_database(products):
-    """Add products to the database"""
+def _copy_text(value):
+    """Escape a single text value for COPY ... FROM STDIN (text format)"""
+    return (value.replace('\\', '\\\\')
+                 .replace('\t', '\\t')
+                 .replace('\n', '\\n')
+                 .replace('\r', '\\r'))
+
+def _copy_array_element(value):
+    """Quote one element of a PostgreSQL array literal"""
+    value = str(value).replace('\\', '\\\\').replace('"', '\\"')
+    return f'"{value}"'
+
+def _copy_value(value):
+    """Format a Python value as a COPY text-format field"""
+    if value is None:
+        return '\\N'
+    if isinstance(value, bool):
+        return 't' if value else 'f'
+    if isinstance(value, (list, tuple)):
+        return _copy_text('{' + ','.join(_copy_array_element(v) for v in value) + '}')
+    return _copy_text(str(value))
+
+def _copy_line(product):
+    """Format a product as one line of COPY input"""
+    return '\t'.join(_copy_value(value) for value in product_row(product)) + '\n'
+
+class CopyStream(io.RawIOBase):
+    """File-like object that feeds COPY FROM STDIN lazily from an iterable of products
+
+    Rows are encoded batch_size at a time, so the whole catalog is sent in a single
+    COPY round-trip without ever being held in memory as one big string.
+    """
+
+    def __init__(self, products, batch_size=DEFAULT_BATCH_SIZE):
+        self._products = iter(products)
+        self._batch_size = batch_size
+        self._buffer = b''
+        self.rows = 0
+
+    def readable(self):
+        return True
+
+    def _fill(self):
+        lines = []
+        for product in self._products:
+            lines.append(_copy_line(product))
+            if len(lines) >= self._batch_size:
+                break
+        self.rows += len(lines)
+        data = ''.join(lines).encode('utf-8')
+        metrics = instrumentation.current()
+        metrics.count('rows', len(lines))
+        metrics.count('copy_bytes', len(data))
+        metrics.progress('rows', 'rows copied')
+        return data
+
+    def read(self, size=-1):
+        if size is None or size < 0:
+            chunks = [self._buffer]
+            self._buffer = b''
+            while True:
+                chunk = self._fill()
+                if not chunk:
+                    return b''.join(chunks)
+                chunks.append(chunk)
+        while len(self._buffer) < size:
+            chunk = self._fill()
+            if not chunk:
+                break
+            self._buffer += chunk
+        data, self._buffer = self._buffer[:size], self._buffer[size:]
+        return data
+
+def copy_products(cursor, products, batch_size=DEFAULT_BATCH_SIZE, table='products'):
+    """Stream products into the products table (or `table`) with a single COPY FROM STDIN"""
+    stream = CopyStream(products, batch_size)
+    cursor.copy_expert(
+        f"COPY {table} ({', '.join(PRODUCT_COLUMNS)}) FROM STDIN",
+        stream,
+        size=64 * 1024
+    )
+    return stream.rows
+
+def insert_products_in_pages(cursor, batches, batch_size=DEFAULT_BATCH_SIZE, table='products'):
+    """Insert batches of products with execute_values, batch_size rows per statement"""
+    metrics = instrumentation.current()
+    count = 0
+    for batch in batches:
+        psycopg2.extras.execute_values(
+            cursor,
+            f"INSERT INTO {table} ({', '.join(PRODUCT_COLUMNS)}) VALUES %s",
+            [product_row(product) for product in batch],
+            page_size=batch_size
+        )
+        count += len(batch)
+        metrics.count('rows', len(batch))
+        metrics.progress('rows', 'rows inserted')
+    return count
+
+def copy_supported(cursor, table='products'):
+    """Probe whether this connection may COPY into products (or `table`), without sending any rows"""
+    cursor.execute("SAVEPOINT copy_probe")
     try:
-        # Connect to database
-        conn = psycopg2.connect(os.getenv('DATABASE_URL'))
-        cursor = conn.cursor()
-        
-        # Clear existing products
-        cursor.execute("DELETE FROM products")
-        print("Cleared existing products from database")
-        
-        # Insert new products
-        for i, product in enumerate(products, 1):
-            cursor.execute("""
-                INSERT INTO products (name, description, price, original_price, image_url, category, subcategory, tags, stock_quantity, is_featured, is_on_sale, sale_percentage)
-                VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-            """, (
-                product['name'],
-                product['description'],
-                product['price'],
-                product['original_price'],
-                product['image_url'],
-                product['category'],
-                product['subcategory'],
-                product['tags'],
-                product['stock_quantity'],
-                product['is_featured'],
-                product['is_on_sale'],
-                product['sale_percentage']
-            ))
-            print(f"Added product {i}: {product['name']}")
-        
-        conn.commit()
-        print(f"\nSuccessfully added {len(products)} products to database")
-        
-    except Exception as e:
-        print(f"Error adding products to database: {e}")
-        if conn:
-            conn.rollback()
+        copy_products(cursor, [], table=table)
+    except psycopg2.Error as e:
+        print(f"COPY unavailable ({e})")
+        cursor.execute("ROLLBACK TO SAVEPOINT copy_probe")
+        return False
+    cursor.execute("RELEASE SAVEPOINT copy_probe")
+    return True
+
+def bulk_load_products(cursor, batches, batch_size=DEFAULT_BATCH_SIZE, table='products'):
+    """Load batches with one COPY, falling back to paged execute_values if COPY is refused
+
+    COPY support is probed up front, so `batches` may be a one-shot iterator that is
+    still being produced while the load runs.
+    """
+    if copy_supported(cursor, table):
+        count = copy_products(cursor, itertools.chain.from_iterable(batches), batch_size, table)
+        print(f"Copied {count} products with COPY FROM STDIN")
+    else:
+        print(f"Falling back to execute_values in pages of {batch_size}")
+        count = insert_products_in_pages(cursor, batches, batch_size, table)
+        print(f"Inserted {count} products with execute_values")
+    return count
+
+def acquire_import_lock(cursor):
+    """Take the catalog's import lock until the transaction ends; False if another import holds it"""
+    db_access.prepare(cursor, *ACQUIRE_IMPORT_LOCK)
+    db_access.execute_prepared(cursor, ACQUIRE_IMPORT_LOCK[0], (IMPORT_LOCK,))
+    return cursor.fetchone()[0]
+
+def has_unkeyed_rows(cursor):
+    """Whether the table still holds rows loaded before --sync existed"""
+    cursor.execute(HAS_UNKEYED_ROWS)
+    return cursor.fetchone()[0]
+
+def adopt_unkeyed_rows(cursor, keyed):
+    """Attach import keys to rows loaded before --sync existed, matching them by exact name
+
+    Adopted rows keep their id (and therefore their edit pages); their content_hash
+    stays NULL so the following upsert refreshes them once.
+    """
+    if not keyed:
+        return 0
+    db_access.prepare(cursor, *ADOPT_UNKEYED_ROWS)
+    db_access.execute_prepared(cursor, ADOPT_UNKEYED_ROWS[0], ProductSync.adopt_params(keyed))
+    return cursor.rowcount
+
+def stored_hashes(cursor):
+    """import_key -> content_hash for every synced product"""
+    cursor.execute(STORED_HASHES)
+    return hashes_by_key(cursor.fetchall())
+
+def upsert_products(cursor, changed, batch_size=DEFAULT_BATCH_SIZE):
+    """INSERT ... ON CONFLICT (import_key) DO UPDATE for new and changed products"""
+    if not changed:
+        return 0
+    db_access.prepare(cursor, *UPSERT_PRODUCT)
+    db_access.execute_prepared_batch(cursor, UPSERT_PRODUCT[0], ProductSync.upsert_rows(changed),
+                                     page_size=batch_size)
+    return len(changed)
+
+def delete_removed_products(cursor, sync):
+    """Delete products that disappeared from the source, plus rows that were never keyed"""
+    removed = sync.removed_keys()
+    if removed:
+        db_access.prepare(cursor, *DELETE_REMOVED_PRODUCTS)
+        db_access.execute_prepared(cursor, DELETE_REMOVED_PRODUCTS[0], (removed,))
+        sync.record_deleted(cursor.fetchall())
+    cursor.execute(DELETE_UNKEYED_PRODUCTS)
+    sync.record_deleted(cursor.fetchall())
+    return sync.deleted
+
+def sync_products(cursor, batches, batch_size=DEFAULT_BATCH_SIZE):
+    """Diff-based sync: upsert only changed products and delete removed ones
+
+    Batches are diffed and upserted as they arrive; deletions wait for the last
+    batch. A re-import of an unchanged catalog writes zero rows. Returns the
+    catalog_load.ProductSync, whose `categories` are the summary keys of the
+    categories the written rows were or are in.
+    """
+    metrics = instrumentation.current()
+    require_sync_columns(cursor)
+    sync = ProductSync(stored_hashes(cursor), has_unkeyed_rows(cursor))
+    for batch in batches:
+        keyed, changed = sync.diff(batch)
+        if sync.adopt:
+            sync.adopted += adopt_unkeyed_rows(cursor, keyed)
+        if changed:
+            sync.record_categories(category_summary.stored_categories(cursor, ProductSync.changed_keys(changed)))
+        upsert_products(cursor, changed, batch_size)
+        metrics.count('rows', len(batch))
+        metrics.progress('rows', 'products diffed')
+    if sync.adopted:
+        print(f"Adopted {sync.adopted} existing products into sync tracking")
+    delete_removed_products(cursor, sync)
+    metrics.count('rows_upserted', sync.upserted)
+    metrics.count('rows_deleted', sync.deleted)
+    metrics.count('duplicates_skipped', sync.duplicates)
+    print(f"Sync: {sync.upserted} inserted/updated, {sync.deleted} deleted, {sync.unchanged} unchanged")
+    if sync.duplicates:
+        print(f"Skipped {sync.duplicates} duplicate products")
+    return sync
+
+def tap_product_images(batches, images):
+    """Pass batches through, handing each product's image to the ImageDeriver as it goes by"""
+    for batch in batches:
+        images.submit_products(batch)
+        yield batch
+
+def store_product_images(cursor, infos, batch_size=DEFAULT_BATCH_SIZE):
+    """Record dimensions, byte sizes and variants of each product's image in product_images
+
+    Updates the product's row for that image, or adds one (primary if the product
+    has none yet). Rows whose image content is unchanged are left alone.
+    """
+    for statement in PRODUCT_IMAGES_DDL:
+        cursor.execute(statement)
+    cursor.execute("SELECT id, image_url FROM products WHERE image_url = ANY(%s)", (list(infos),))
+    rows = [
+        (product_id, image_url, infos[image_url].width, infos[image_url].height,
+         infos[image_url].byte_size, infos[image_url].sha256, json.dumps(infos[image_url].variants))
+        for product_id, image_url in cursor.fetchall()
+    ]
+    values = "(VALUES %s) AS v (product_id, image_url, width, height, byte_size, content_hash, variants)"
+    psycopg2.extras.execute_values(cursor, f"""
+        UPDATE product_images AS pi SET width = v.width, height = v.height, byte_size = v.byte_size,
+               content_hash = v.content_hash, variants = v.variants::jsonb
+        FROM {values}
+        WHERE pi.product_id = v.product_id AND pi.image_url = v.image_url
+          AND (pi.content_hash IS DISTINCT FROM v.content_hash OR pi.variants IS DISTINCT FROM v.variants::jsonb)
+    """, rows, page_size=batch_size)
+    psycopg2.extras.execute_values(cursor, f"""
+        INSERT INTO product_images (product_id, image_url, alt_text, is_primary, sort_order,
+                                    width, height, byte_size, content_hash, variants)
+        SELECT v.product_id, v.image_url, p.name,
+               NOT EXISTS (SELECT 1 FROM product_images x WHERE x.product_id = v.product_id AND x.is_primary),
+               0, v.width, v.height, v.byte_size, v.content_hash, v.variants::jsonb
+        FROM {values} JOIN products p ON p.id = v.product_id
+        WHERE NOT EXISTS (SELECT 1 FROM product_images pi WHERE pi.product_id = v.product_id AND pi.image_url = v.image_url)
+    """, rows, page_size=batch_size)
+    return len(rows)
+
+def add_product_images(cursor, images, batch_size=DEFAULT_BATCH_SIZE):
+    """Wait for the image derivatives and record them for the loaded products"""
+    with instrumentation.current().stage('images'):
+        infos = images.results()
+        stored = store_product_images(cursor, infos, batch_size) if infos else 0
+    print(f"Images: {images.processed} processed, {images.cached} unchanged, {len(images.missing)} not found; "
+          f"recorded for {stored} products")
+
+def refresh_search_index(cursor):
+    """Re-tokenize the products this import inserted or changed for catalog_search"""
+    with instrumentation.current().stage('search index'):
+        refreshed = catalog_search.refresh_search_vectors(cursor)
+    print(f"Search index refreshed for {refreshed} products")
+
+def swap_load_products(cursor, batches, batch_size=DEFAULT_BATCH_SIZE):
+    """Full reload through a staging table that replaces products once it is indexed
+
+    See staged_reload: indexes are built once over the loaded rows instead of
+    being maintained per row, and the swap ends with ANALYZE.
+    """
+    metrics = instrumentation.current()
+    definition = staged_reload.describe_table(cursor, 'products')
+    staging = staged_reload.create_staging_table(cursor, 'products', definition)
+    count = bulk_load_products(cursor, batches, batch_size, table=staging)
+    with metrics.stage('index build'):
+        # Before the indexes exist, so the vectors are written once and indexed in bulk
+        catalog_search.refresh_search_vectors(cursor, staging)
+        staged_reload.build_indexes(cursor, 'products', staging, definition)
+    with metrics.stage('swap'):
+        staged_reload.swap_in(cursor, 'products', staging, definition)
+    print(f"Swapped in {count} products with {len(definition.indexes)} indexes rebuilt and fresh statistics")
+    return count
+
+def update_category_summary(cursor, categories=None):
+    """Recompute the category_summary rows of `categories`, or of every category after a full reload"""
+    with instrumentation.current().stage('category summary'):
+        if categories is None:
+            count = category_summary.rebuild_category_summary(cursor)
+        else:
+            count = category_summary.refresh_categories(cursor, categories)
+    print(f"Category summary refreshed for {count} categories")
+
+def add_products_to_database(batches, bulk=False, sync=False, batch_size=DEFAULT_BATCH_SIZE, images=None,
+                             snapshot_dir=None, page_size=catalog_snapshot.DEFAULT_PAGE_SIZE, swap=False):
+    """Add products to the database, consuming batches as the pipeline produces them
+
+    With `images` (an image_derivatives.ImageDeriver), product images are derived
+    in its process pool while the rows load, and recorded in product_images
+    before the transaction commits. With `snapshot_dir`, the committed catalog
+    is then exported there as sharded catalog_snapshot files.
+
+    Raises when the load fails (after rolling it back) or another import holds the lock.
+    """
+    if images:
+        batches = tap_product_images(batches, images)
+    try:
+        with db_access.transaction() as cursor:
+            if not acquire_import_lock(cursor):
+                raise RuntimeError("Another import of the products catalog is running; "
+                                   "try again once it has finished")
+            require_load_columns(cursor)
+            catalog_search.require_search_index(cursor)
+            category_summary.ensure_category_summary(cursor)
+            categories = None
+            if sync:
+                categories = sync_products(cursor, batches, batch_size).categories
+            elif swap:
+                count = swap_load_products(cursor, batches, batch_size)
+            else:
+                # Clear existing products
+                cursor.execute(CLEAR_PRODUCTS)
+                print("Cleared existing products from database")
+
+                if bulk:
+                    count = bulk_load_products(cursor, batches, batch_size)
+                else:
+                    # Insert new products
+                    metrics = instrumentation.current()
+                    db_access.prepare(cursor, *INSERT_PRODUCT)
+                    count = 0
+                    for product in itertools.chain.from_iterable(batches):
+                        db_access.execute_prepared(cursor, INSERT_PRODUCT[0], product_row(product))
+                        count += 1
+                        metrics.count('rows')
+                        metrics.progress('rows', 'products added')
+                cursor.execute(ANALYZE_PRODUCTS)
+
+            refresh_search_index(cursor)
+            update_category_summary(cursor, categories)
+            if images:
+                add_product_images(cursor, images, batch_size)
+
+        if not sync:
+            print(f"\nSuccessfully added {count} products to database")
+
+        if snapshot_dir:
+            with instrumentation.current().stage('snapshot'), db_access.transaction() as cursor:
+                catalog_snapshot.export_snapshot(cursor, snapshot_dir, page_size)
     finally:
-        if cursor:
-            cursor.close()
-        if conn:
-            conn.close()
+        if images:
+            images.close()
+
+class TimedReader:
+    """Text file wrapper that records how long read() calls take and how much they return"""
+
+    def __init__(self, handle):
+        self.handle = handle
+        self.seconds = 0.0
+        self.chars = 0
+
+    def read(self, size=-1):
+        start = time.perf_counter()
+        data = self.handle.read(size)
+        self.seconds += time.perf_counter() - start
+        self.chars += len(data)
+        return data
+
+def plan_products(paths):
+    """Parse, normalize and validate every source without the pipeline thread
+
+    Returns (products, timings) where timings holds file read, parse and
+    normalization seconds measured separately.
+    """
+    timings = {'file read': 0.0, 'parse': 0.0, 'normalization': 0.0}
+    products = []
+    chars = 0
+    for path in paths:
+        if catalog_snapshot.is_snapshot(path):
+            # Already structured: reading the shards is the whole parse
+            start = time.perf_counter()
+            products.extend(product for product in catalog_snapshot.snapshot_products(path)
+                            if not validate_product(product))
+            timings['parse'] += time.perf_counter() - start
+            continue
+        with open(path, 'r', encoding='utf-8') as f:
+            reader = TimedReader(f)
+            raws = iter_array_objects(reader, 'allProducts')
+            while True:
+                start = time.perf_counter()
+                raw = next(raws, None)
+                timings['parse'] += time.perf_counter() - start
+                if raw is None:
+                    break
+                start = time.perf_counter()
+                product = normalize_product(raw)
+                if product and not validate_product(product):
+                    products.append(product)
+                timings['normalization'] += time.perf_counter() - start
+            # Reads happen inside the parser; report them on their own line
+            timings['file read'] += reader.seconds
+            timings['parse'] -= reader.seconds
+            chars += reader.chars
+    if len(paths) > 1:
+        start = time.perf_counter()
+        products = list(dedupe_stage(products))
+        timings['normalization'] += time.perf_counter() - start
+    timings['chars read'] = chars
+    return products, timings
+
+def round_trip_seconds(cursor, samples=3):
+    """Best observed latency of a trivial query"""
+    best = None
+    for _ in range(samples):
+        start = time.perf_counter()
+        cursor.execute("SELECT 1")
+        cursor.fetchone()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+def sync_columns_exist(cursor):
+    cursor.execute("""
+        SELECT count(*) FROM information_schema.columns
+        WHERE table_name = 'products' AND column_name IN ('import_key', 'content_hash')
+    """)
+    return cursor.fetchone()[0] == 2
+
+def diff_plan(cursor, products, sync):
+    """Count the rows an import would insert, update, delete and leave alone"""
+    seen = set()
+    keyed = keyed_batch(products, seen)
+    if not sync:
+        cursor.execute("SELECT count(*) FROM products")
+        return {'insert': len(keyed), 'update': 0, 'delete': cursor.fetchone()[0], 'unchanged': 0}
+    if sync_columns_exist(cursor):
+        stored = stored_hashes(cursor)
+        cursor.execute("SELECT count(*) FROM products WHERE import_key IS NULL")
+        unkeyed = cursor.fetchone()[0]
+    else:
+        stored = {}
+        cursor.execute("SELECT count(*) FROM products")
+        unkeyed = cursor.fetchone()[0]
+    plan = {'insert': 0, 'update': 0, 'unchanged': 0}
+    for key, (digest, _) in keyed.items():
+        if key not in stored:
+            plan['insert'] += 1
+        elif stored[key] != digest:
+            plan['update'] += 1
+        else:
+            plan['unchanged'] += 1
+    plan['delete'] = unkeyed + sum(1 for key in stored if key not in seen)
+    return plan
+
+def estimate_load_seconds(products, plan, round_trip, bulk, sync, batch_size):
+    """Estimate how long writing the planned changes would take"""
+    writes = plan['insert'] + plan['update']
+    payload = sum(len(_copy_line(product)) for product in products)
+    payload = payload * writes // max(len(products), 1)
+    transfer = payload / ESTIMATED_LOAD_BYTES_PER_SECOND
+    if sync:
+        round_trips = -(-writes // batch_size) + 2
+    elif bulk:
+        round_trips = 3
+    else:
+        round_trips = writes + 1
+    return round_trips * round_trip + transfer
+
+def plan_import(paths, bulk=False, sync=False, batch_size=DEFAULT_BATCH_SIZE):
+    """Report what an import would change and where its time goes, writing nothing"""
+    products, timings = plan_products(paths)
+    with db_access.transaction() as cursor:
+        cursor.execute("SET TRANSACTION READ ONLY")
+        round_trip = round_trip_seconds(cursor)
+        start = time.perf_counter()
+        plan = diff_plan(cursor, products, sync)
+        timings['DB diff query'] = time.perf_counter() - start
+    timings['estimated load'] = estimate_load_seconds(products, plan, round_trip, bulk, sync, batch_size)
+
+    mode = 'sync' if sync else 'bulk' if bulk else 'row-by-row'
+    print(f"\nImport plan ({mode}, nothing written):")
+    print(f"  Products parsed: {len(products)}")
+    print(f"  Would insert:    {plan['insert']}")
+    print(f"  Would update:    {plan['update']}")
+    print(f"  Would delete:    {plan['delete']}")
+    print(f"  Unchanged:       {plan['unchanged']}")
+    print(f"\nStage timings (round-trip latency {round_trip * 1000:.1f} ms):")
+    print(f"  file read       {timings['file read']:8.3f}s  ({timings['chars read'] / 1e6:.1f} M chars)")
+    for stage in ('parse', 'normalization', 'DB diff query'):
+        print(f"  {stage:<15} {timings[stage]:8.3f}s")
+    print(f"  estimated load  {timings['estimated load']:8.3f}s")
+    return plan, timings
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Add all products from shop.html to the database")
+    mode = parser.add_mutually_exclusive_group()
+    mode.add_argument('--bulk', action='store_true',
+                      help="load all rows in one COPY FROM STDIN round-trip instead of one INSERT per product")
+    mode.add_argument('--sync', action='store_true',
+                      help="upsert only changed products and delete removed ones instead of reloading the table")
+    mode.add_argument('--swap', action='store_true',
+                      help="reload into a staging table, build its indexes in bulk and swap it in "
+                           "atomically, then ANALYZE")
+    parser.add_argument('--plan', action='store_true',
+                        help="parse, normalize and diff against the database, report counts and timings, write nothing")
+    parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE,
+                        help=f"rows per pipeline batch, COPY chunk and execute_values page (default: {DEFAULT_BATCH_SIZE})")
+    parser.add_argument('--queue-size', type=int, default=DEFAULT_QUEUE_SIZE,
+                        help=f"batches buffered between the parser and the loader (default: {DEFAULT_QUEUE_SIZE})")
+    parser.add_argument('--source', action='append', dest='sources', metavar='PATH',
+                        help=f"listing page containing an allProducts array, or a catalog snapshot manifest.json; "
+                             f"repeat to import several pages in parallel (default: {SHOP_PAGE})")
+    parser.add_argument('--jobs', type=int, default=None,
+                        help="worker processes for multi-page imports (default: one per page, up to CPU count)")
+    parser.add_argument('--images', action='store_true',
+                        help="derive thumbnails and WebP variants of the product images and record them in product_images")
+    parser.add_argument('--image-root', default='.',
+                        help="directory image_url paths, and the derivatives' URLs, are relative to (default: current directory)")
+    parser.add_argument('--image-jobs', type=int, default=None,
+                        help="worker processes deriving images (default: CPU count)")
+    parser.add_argument('--snapshot-dir', default=catalog_snapshot.SNAPSHOT_DIR,
+                        help=f"where the catalog snapshot is exported after the import "
+                             f"(default: {catalog_snapshot.SNAPSHOT_DIR})")
+    parser.add_argument('--no-snapshot', action='store_true',
+                        help="do not export a catalog snapshot after the import")
+    parser.add_argument('--page-size', type=int, default=catalog_snapshot.DEFAULT_PAGE_SIZE,
+                        help=f"products per snapshot shard (default: {catalog_snapshot.DEFAULT_PAGE_SIZE})")
+    instrumentation.add_arguments(parser)
+    args = parser.parse_args()
+    if args.batch_size < 1:
+        parser.error("--batch-size must be at least 1")
+    if args.queue_size < 1:
+        parser.error("--queue-size must be at least 1")
+    if args.jobs is not None and args.jobs < 1:
+        parser.error("--jobs must be at least 1")
+    if args.image_jobs is not None and args.image_jobs < 1:
+        parser.error("--image-jobs must be at least 1")
+    if args.page_size < 1:
+        parser.error("--page-size must be at least 1")
+    args.sources = args.sources or [SHOP_PAGE]
+    return args
 
 def main():
-    print("Extracting products from shop.html...")
-    products = extract_products_from_html()
+    args = parse_args()
+
+    if args.plan:
+        try:
+            plan_import(args.sources, bulk=args.bulk, sync=args.sync, batch_size=args.batch_size)
+        finally:
+            db_access.close_pool()
+        return
+
+    metrics = instrumentation.begin('add_all_products', args.progress_interval)
+    metrics.count('bytes_read', sum(os.path.getsize(path) for path in args.sources if os.path.exists(path)))
+    print(f"Extracting products from {', '.join(args.sources)}...")
+    if len(args.sources) > 1:
+        batches = multi_source_batches(args.sources, args.batch_size, args.queue_size, args.jobs)
+    else:
+        batches = catalog_batches(args.sources[0], args.batch_size, args.queue_size)
+    with metrics.stage('first batch'):
+        first_batch = next(batches, None)
     
-    if not products:
+    if not first_batch:
         print("No products found to add")
         return
     
-    print(f"Found {len(products)} products to add")
-    
     # Show first few products as preview
     print("\nPreview of first 5 products:")
-    for i, product in enumerate(products[:5], 1):
+    for i, product in enumerate(first_batch[:5], 1):
         print(f"{i}. {product['name']} - ${product['price']}")
     
-    # Add to database
+    images = None
+    if args.images:
+        # Needs Pillow, so only imported when the stage is used
+        from image_derivatives import ImageDeriver
+        images = ImageDeriver(args.image_root, jobs=args.image_jobs)
+    
+    # Add to database while the rest of the catalog is still being parsed
     print("\nAdding products to database...")
-    add_products_to_database(products)
+    try:
+        with metrics.stage('load'):
+            add_products_to_database(
+                itertools.chain([first_batch], batches),
+                bulk=args.bulk, sync=args.sync, batch_size=args.batch_size, images=images,
+                snapshot_dir=None if args.no_snapshot else args.snapshot_dir, page_size=args.page_size,
+                swap=args.swap
+            )
+    except Exception as e:
+        print(f"Error adding products to database: {e}")
+        sys.exit(1)
+    finally:
+        db_access.close_pool()
+        instrumentation.finish(args.metrics_file)
 
 if __name__ == "__main__":
     main() 
\ No newline at end of file
@@ -2,23 +2,24 @@
 """
 Add size chart section to all existing product edit pages
 """
+import argparse
+import contextlib
+import io
 import os
-import re
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
 
-def add_size_chart_to_edit_page(file_path):
-    """Add size chart section to a product edit page"""
-    print(f"Processing: {file_path}")
-    
-    with open(file_path, 'r', encoding='utf-8') as f:
-        content = f.read()
-    
-    # Check if size chart already exists
-    if 'Size Chart Configuration' in content:
-        print(f"  ✅ Size chart already exists in {file_path}")
-        return
-    
-    # Size chart HTML to insert
-    size_chart_html = '''
+import instrumentation
+from extract_size_chart_js import BUNDLE_TAG_PREFIX
+from html_injection import Injector, InjectionRule
+from page_patterns import FEATURES_POPULATED, FORM_DATA_BODY, SCRIPT_END, TAGS_SECTION
+from page_writer import write_if_changed
+from precompress import DEFAULT_INDEX, precompress_pages
+from size_chart_presets import presets_js
+from patch_manifest import DEFAULT_MANIFEST, PatchManifest, definition_version
+
+# Size chart HTML to insert
+SIZE_CHART_HTML = '''
                     <!-- Size Chart Configuration -->
                     <div class="space-y-4">
                         <label class="block text-sm font-medium text-text-primary mb-2">Size Chart (inches)</label>
@@ -97,26 +98,9 @@ def add_size_chart_to_edit_page(file_path):
                         </div>
                     </div>
 '''
-    
-    # Find where to insert the size chart (before Custom Input Options)
-    custom_input_pattern = r'(\s*<!-- Custom Input Options -->)'
-    
-    if re.search(custom_input_pattern, content):
-        # Insert before Custom Input Options
-        content = re.sub(custom_input_pattern, size_chart_html + r'\1', content)
-        print(f"  ✅ Added size chart section before Custom Input Options")
-    else:
-        # Fallback: look for other patterns
-        tags_pattern = r'(\s*<!-- Tags -->|\s*<[^>]*>Tags</)'
-        if re.search(tags_pattern, content):
-            content = re.sub(tags_pattern, size_chart_html + r'\1', content)
-            print(f"  ✅ Added size chart section before Tags")
-        else:
-            print(f"  ❌ Could not find insertion point in {file_path}")
-            return
-    
-    # Add JavaScript functions if they don't exist
-    js_functions = '''
+
+# Size chart JavaScript functions
+SIZE_CHART_JS = '''
         // Size Chart Functions
         function getSizeChartData() {
             return {
@@ -147,36 +131,7 @@ def add_size_chart_to_edit_page(file_path):
         }
 
         function applySizeChartPreset(garmentType) {
-            const presets = {
-                'adult-tshirt': {
-                    S: { chest: '18', length: '28' },
-                    M: { chest: '20', length: '29' },
-                    L: { chest: '22', length: '30' },
-                    XL: { chest: '24', length: '31' },
-                    '2XL': { chest: '26', length: '32' }
-                },
-                'adult-hoodie': {
-                    S: { chest: '20', length: '27' },
-                    M: { chest: '22', length: '28' },
-                    L: { chest: '24', length: '29' },
-                    XL: { chest: '26', length: '30' },
-                    '2XL': { chest: '28', length: '31' }
-                },
-                'kids-tshirt': {
-                    S: { chest: '14', length: '19' },
-                    M: { chest: '15', length: '20' },
-                    L: { chest: '16', length: '21' },
-                    XL: { chest: '17', length: '22' },
-                    '2XL': { chest: '18', length: '23' }
-                },
-                'kids-hoodie': {
-                    S: { chest: '16', length: '18' },
-                    M: { chest: '17', length: '19' },
-                    L: { chest: '18', length: '20' },
-                    XL: { chest: '19', length: '21' },
-                    '2XL': { chest: '20', length: '22' }
-                }
-            };
+            const presets = ''' + presets_js('            ') + ''';
 
             const preset = presets[garmentType];
             if (preset) {
@@ -213,16 +168,9 @@ def add_size_chart_to_edit_page(file_path):
             }
         }
 '''
-    
-    # Add JavaScript functions before the closing </script> tag
-    if 'getSizeChartData' not in content:
-        script_pattern = r'(\s*</script>\s*</body>)'
-        if re.search(script_pattern, content):
-            content = re.sub(script_pattern, js_functions + r'\1', content)
-            print(f"  ✅ Added size chart JavaScript functions")
-    
-    # Add event listener for garment type dropdown
-    event_listener = '''
+
+# Event listener for garment type dropdown
+GARMENT_TYPE_LISTENER = '''
         // Add event listener for garment type dropdown
         document.addEventListener('DOMContentLoaded', function() {
             const garmentType = document.getElementById('garment-type');
@@ -235,66 +183,180 @@ def add_size_chart_to_edit_page(file_path):
             }
         });
 '''
+
+# Every edit the patcher makes, located in a single scan of each page
+SIZE_CHART_RULES = [
+    # Insert the size chart before Custom Input Options, falling back to Tags
+    InjectionRule('html', '<!-- Custom Input Options -->', SIZE_CHART_HTML,
+                  position='before-space', group='html'),
+    InjectionRule('html-tags', TAGS_SECTION, SIZE_CHART_HTML,
+                  position='before-space', group='html'),
+    InjectionRule('listener', SCRIPT_END, GARMENT_TYPE_LISTENER,
+                  position='before-space', marker='applySizeChartPreset(this.value)'),
+    InjectionRule('js', SCRIPT_END, SIZE_CHART_JS, position='before-space',
+                  marker=('getSizeChartData', BUNDLE_TAG_PREFIX)),
+    # Include the size chart in the submitted form data
+    InjectionRule('form-object', FORM_DATA_BODY,
+                  ',\n                size_chart: getSizeChartData()',
+                  position='after', marker='size_chart: getSizeChartData()', group='form'),
+    # Populate the size chart when the product loads
+    InjectionRule('populate-function', FEATURES_POPULATED,
+                  '\n\n            // Size Chart\n            populateSizeChartFromData(productData.size_chart);',
+                  position='after', marker='populateSizeChartFromData(productData.size_chart)', group='populate'),
+]
+
+RULE_MESSAGES = {
+    'html': "Added size chart section before Custom Input Options",
+    'html-tags': "Added size chart section before Tags",
+    'listener': "Added garment type event listener",
+    'js': "Added size chart JavaScript functions",
+    'form-object': "Updated form submission to include size chart",
+    'populate-function': "Updated populateForm to load size chart data",
+}
+
+_injector = Injector(SIZE_CHART_RULES)
+
+# Changes whenever the rules or payloads change, so every page gets re-checked
+PATCH_VERSION = definition_version(SIZE_CHART_RULES)
+
+def add_size_chart_to_edit_page(file_path):
+    """Add size chart section to a product edit page"""
+    metrics = instrumentation.current()
+    print(f"Processing: {file_path}")
     
-    if 'garment-type' in content and 'addEventListener' not in content:
-        content = re.sub(script_pattern, event_listener + js_functions + r'\1', content)
-        print(f"  ✅ Added garment type event listener")
+    with open(file_path, 'r', encoding='utf-8') as f:
+        content = f.read()
+        metrics.count('bytes_read', os.fstat(f.fileno()).st_size)
     
-    # Update form submission to include size chart
-    if 'getSizeChartData()' not in content:
-        # Look for form data collection patterns
-        form_patterns = [
-            r'(const formData = \{[^}]*)\}',
-            r'(formData\s*=\s*\{[^}]*)\}',
-        ]
-        
-        for pattern in form_patterns:
-            if re.search(pattern, content):
-                content = re.sub(pattern, r'\1,\n                size_chart: getSizeChartData()}', content)
-                print(f"  ✅ Updated form submission to include size chart")
-                break
+    # Check if size chart already exists
+    if 'Size Chart Configuration' in content:
+        print(f"  ✅ Size chart already exists in {file_path}")
+        return 'unchanged'
     
-    # Update populateForm function to populate size chart
-    if 'populateForm' in content and 'populateSizeChartFromData' not in content:
-        populate_pattern = r'(function populateForm\(productData\) \{[^}]*)(productData\.size_chart\)\;)?(\s*\})'
-        if re.search(populate_pattern, content):
-            content = re.sub(populate_pattern, r'\1\n            populateSizeChartFromData(productData.size_chart);\3', content)
-            print(f"  ✅ Updated populateForm to load size chart data")
+    with metrics.timer('regex'):
+        result = _injector.apply(content)
+    if 'html' in result.missing:
+        print(f"  ❌ Could not find insertion point in {file_path}")
+        return 'failed'
+    for name in result.applied:
+        print(f"  ✅ {RULE_MESSAGES[name]}")
     
     # Write updated content
-    with open(file_path, 'w', encoding='utf-8') as f:
-        f.write(content)
+    if write_if_changed(file_path, result.text):
+        metrics.count('bytes_written', os.path.getsize(file_path))
     
     print(f"  ✅ Successfully updated {file_path}")
+    return 'updated'
+
+def patch_page(page):
+    """Worker: patch one page, capturing its output and counters for the parent
+
+    Returns (page, status, log, counters) where status is updated, unchanged,
+    failed or error.
+    """
+    log = io.StringIO()
+    with contextlib.redirect_stdout(log), instrumentation.scoped() as metrics:
+        try:
+            status = add_size_chart_to_edit_page(page)
+        except Exception as e:
+            print(f"  ❌ Error updating {page}: {e}")
+            status = 'error'
+    return page, status, log.getvalue(), metrics.counters
+
+def patch_pages(pages, jobs=1):
+    """Patch pages serially or across `jobs` processes, yielding patch_page() results in page order"""
+    if jobs <= 1:
+        for page in pages:
+            yield patch_page(page)
+        return
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        yield from pool.map(patch_page, pages, chunksize=max(1, len(pages) // (jobs * 8)))
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Add the size chart section to every product edit page")
+    parser.add_argument('--jobs', type=int, default=1,
+                        help="worker processes patching pages in parallel (default: 1)")
+    parser.add_argument('--manifest', default=DEFAULT_MANIFEST,
+                        help=f"patch manifest used to skip unchanged pages (default: {DEFAULT_MANIFEST})")
+    parser.add_argument('--force', action='store_true',
+                        help="check every page, even those the manifest lists as already patched")
+    parser.add_argument('--no-compress', action='store_true',
+                        help=f"don't write .gz/.br siblings of the updated pages (indexed in {DEFAULT_INDEX})")
+    parser.add_argument('--verbose', action='store_true',
+                        help="print every page's log instead of periodic progress and failures only")
+    instrumentation.add_arguments(parser)
+    args = parser.parse_args()
+    if args.jobs < 1:
+        parser.error("--jobs must be at least 1")
+    return args
 
 def main():
     """Add size chart to all product edit pages"""
+    args = parse_args()
+    metrics = instrumentation.begin('add_size_chart_to_all_edit_pages', args.progress_interval)
     pages_dir = 'pages'
     
     # Find all product edit pages
-    edit_pages = []
-    for filename in os.listdir(pages_dir):
-        if filename.startswith('product-edit-product-') and filename.endswith('.html'):
-            edit_pages.append(os.path.join(pages_dir, filename))
+    with metrics.stage('scan'):
+        edit_pages = []
+        for filename in os.listdir(pages_dir):
+            if filename.startswith('product-edit-product-') and filename.endswith('.html'):
+                edit_pages.append(os.path.join(pages_dir, filename))
     
     if not edit_pages:
         print("No product edit pages found!")
         return
     
-    print(f"Found {len(edit_pages)} product edit pages to update:")
-    for page in edit_pages:
-        print(f"  - {page}")
+    print(f"Found {len(edit_pages)} product edit pages to update")
+    if args.verbose:
+        for page in edit_pages:
+            print(f"  - {page}")
     
-    print("\nUpdating pages...")
-    for page in edit_pages:
-        try:
-            add_size_chart_to_edit_page(page)
-        except Exception as e:
-            print(f"  ❌ Error updating {page}: {e}")
+    with metrics.stage('scan'):
+        manifest = PatchManifest('add_size_chart', PATCH_VERSION, args.manifest)
+        if args.force:
+            pending = edit_pages
+        else:
+            pending = [page for page in edit_pages if not manifest.is_current(page)]
+    
+    print(f"\nUpdating {len(pending)} changed pages with {args.jobs} worker(s)...")
+    results = Counter(skipped=len(edit_pages) - len(pending))
+    failures = []
+    updated = []
+    try:
+        with metrics.stage('patch'):
+            for page, status, log, counters in patch_pages(pending, args.jobs):
+                metrics.merge(counters)
+                metrics.count('files')
+                if args.verbose or status in ('failed', 'error'):
+                    print(log, end='')
+                else:
+                    metrics.progress('files', 'pages checked', len(pending))
+                results[status] += 1
+                if status == 'updated':
+                    updated.append(page)
+                if status in ('failed', 'error'):
+                    failures.append(page)
+                    manifest.forget(page)
+                else:
+                    manifest.record(page)
+    finally:
+        manifest.save()
+    
+    if updated and not args.no_compress:
+        print(f"\nPrecompressing {len(updated)} updated pages...")
+        with metrics.stage('precompress'):
+            precompress_pages(updated, args.jobs)
     
     print(f"\n✅ Finished updating {len(edit_pages)} product edit pages!")
+    print(f"   Updated: {results['updated']}, already had size chart: {results['unchanged']}, "
+          f"no insertion point: {results['failed']}, errors: {results['error']}, "
+          f"unchanged since last run: {results['skipped']}")
+    for page in failures:
+        print(f"   ❌ {page}")
     print("Now every existing product edit page has the size chart section.")
     print("You can choose which products to add size charts to!")
+    instrumentation.finish(args.metrics_file)
 
 if __name__ == '__main__':
     main()
@@ -3,8 +3,17 @@
 Apply size chart functionality to specific edit pages
 """
 
+import argparse
+import hashlib
 import os
-import re
+from collections import namedtuple
+from functools import lru_cache
+
+import instrumentation
+from extract_size_chart_js import BUNDLE_TAG_PREFIX
+from html_injection import InjectionRule, Injector
+from page_writer import write_if_changed
+from precompress import precompress_pages
 
 # List of edit pages that need to be updated
 EDIT_PAGES = [
@@ -15,8 +24,101 @@ EDIT_PAGES = [
     'pages/product-edit-product-52_dont_be_a_basic_pitch_baseball_shirt_printed_desig.html'
 ]
 
-def apply_size_chart_functionality(file_path):
-    """Apply size chart functionality to a single edit page"""
+# Size chart preset dropdown wiring, added after setupSizeSelection()
+GARMENT_TYPE_SETUP = '''            
+            // Setup size chart preset dropdown
+            const garmentTypeSelect = document.getElementById('garment-type');
+            if (garmentTypeSelect) {
+                garmentTypeSelect.addEventListener('change', function() {
+                    if (this.value !== 'custom') {
+                        applySizeChartPreset(this.value);
+                    }
+                });
+            }'''
+
+MASTER_PAGE = 'pages/product-edit-product-1_just_a_little_boost.html'
+
+MasterFragments = namedtuple('MasterFragments', ['size_chart_html', 'size_chart_js', 'digest'])
+
+# path -> ((st_mtime_ns, st_size), MasterFragments)
+_master_cache = {}
+
+def extract_master_fragments(master_content, digest=None):
+    """Slice the size chart HTML and JS sections out of the master edit page"""
+    size_chart_html = None
+    size_chart_js = None
+    
+    # Extract the size chart HTML section
+    size_chart_start = master_content.find('<!-- Size Chart Configuration -->')
+    size_chart_end = master_content.find('<!-- Tags -->', size_chart_start)
+    if size_chart_start != -1 and size_chart_end != -1:
+        size_chart_html = master_content[size_chart_start:size_chart_end]
+    
+    # Extract the JavaScript functions
+    js_start = master_content.find('// Size Chart Management Functions')
+    js_end = master_content.find('// Initialize after authentication', js_start)
+    if js_start != -1 and js_end != -1:
+        size_chart_js = master_content[js_start:js_end]
+    
+    return MasterFragments(size_chart_html, size_chart_js, digest)
+
+def master_fragments(path=MASTER_PAGE):
+    """Master page fragments, read once and reused until the master file changes
+    
+    The file is only re-read when its mtime or size changes, and only re-sliced
+    when its content hash differs from the cached one (e.g. a touch without edits).
+    """
+    stat = os.stat(path)
+    key = (stat.st_mtime_ns, stat.st_size)
+    cached = _master_cache.get(path)
+    if cached and cached[0] == key:
+        return cached[1]
+    
+    with open(path, 'rb') as f:
+        data = f.read()
+    digest = hashlib.sha256(data).hexdigest()
+    if cached and cached[1].digest == digest:
+        fragments = cached[1]
+    else:
+        fragments = extract_master_fragments(data.decode('utf-8'), digest)
+    _master_cache[path] = (key, fragments)
+    return fragments
+
+@lru_cache(maxsize=4)
+def size_chart_injector(fragments):
+    """Compiled injection rules for one version of the master fragments"""
+    rules = [
+        # Insert the size chart before the Tags section
+        InjectionRule('html', '                        <!-- Tags -->', fragments.size_chart_html, every=True),
+    ]
+    if fragments.size_chart_js is not None:
+        # Add before initializeEditPage function, unless extract_size_chart_js.py moved them to the bundle
+        rules.append(InjectionRule(
+            'js', '        // Initialize after authentication\n        function initializeEditPage()',
+            '        ' + fragments.size_chart_js,
+            marker=('Size Chart Management Functions', BUNDLE_TAG_PREFIX)
+        ))
+    rules += [
+        # Add size_chart to formData
+        InjectionRule('form', 'size_stock: sizeStock,', '\n                size_chart: getSizeChartData(),',
+                      position='after', marker='size_chart: getSizeChartData(),', every=True),
+        # Add size chart population to populateForm
+        InjectionRule('populate', "document.getElementById('feature-soft-touch').checked = features.soft_touch !== false;",
+                      '\n\n            // Size Chart\n            populateSizeChartFromData(productData.size_chart);',
+                      position='after', marker='populateSizeChartFromData(productData.size_chart);', every=True),
+        # Add event listener to initializeEditPage
+        InjectionRule('listener', 'setupSizeSelection();', GARMENT_TYPE_SETUP,
+                      position='after', marker='garmentTypeSelect.addEventListener', every=True),
+    ]
+    return Injector(rules)
+
+def apply_size_chart_functionality(file_path, fragments=None):
+    """Apply size chart functionality to a single edit page
+    
+    `fragments` lets a caller (or a worker process) reuse master fragments it
+    already holds; by default they come from the memoized master page.
+    """
+    metrics = instrumentation.current()
     print(f"Processing {file_path}...")
     
     if not os.path.exists(file_path):
@@ -26,84 +128,30 @@ def apply_size_chart_functionality(file_path):
     try:
         with open(file_path, 'r', encoding='utf-8') as f:
             content = f.read()
+            metrics.count('bytes_read', os.fstat(f.fileno()).st_size)
+        metrics.count('files')
         
         # Check if already updated
         if 'Size Chart Configuration' in content:
             print(f"  ✅ Already updated: {file_path}")
             return True
         
-        # Copy the size chart functionality from the master edit page
-        with open('pages/product-edit-product-1_just_a_little_boost.html', 'r', encoding='utf-8') as f:
-            master_content = f.read()
-        
-        # Extract the size chart HTML section
-        size_chart_start = master_content.find('<!-- Size Chart Configuration -->')
-        size_chart_end = master_content.find('<!-- Tags -->', size_chart_start)
-        
-        if size_chart_start == -1 or size_chart_end == -1:
+        # The size chart functionality comes from the master edit page
+        fragments = fragments or master_fragments()
+        if fragments.size_chart_html is None:
             print(f"  ❌ Could not extract size chart section from master file")
             return False
         
-        size_chart_html = master_content[size_chart_start:size_chart_end]
-        
-        # Find insertion point in target file (before Tags section)
-        if '<!-- Tags -->' in content:
-            content = content.replace('                        <!-- Tags -->', 
-                                    size_chart_html + '                        <!-- Tags -->')
-        else:
+        with metrics.timer('regex'):
+            result = size_chart_injector(fragments).apply(content)
+        if 'html' in result.missing:
             print(f"  ⚠️ Could not find Tags section in {file_path}")
             return False
-        
-        # Extract and add JavaScript functions
-        js_start = master_content.find('// Size Chart Management Functions')
-        js_end = master_content.find('// Initialize after authentication', js_start)
-        
-        if js_start != -1 and js_end != -1:
-            js_functions = master_content[js_start:js_end]
-            
-            # Add before initializeEditPage function
-            if 'function initializeEditPage()' in content and 'Size Chart Management Functions' not in content:
-                content = content.replace(
-                    '        // Initialize after authentication\n        function initializeEditPage()',
-                    '        ' + js_functions + '        // Initialize after authentication\n        function initializeEditPage()'
-                )
-        
-        # Add size_chart to formData
-        if 'size_stock: sizeStock,' in content and 'size_chart: getSizeChartData(),' not in content:
-            content = content.replace(
-                'size_stock: sizeStock,',
-                'size_stock: sizeStock,\n                size_chart: getSizeChartData(),'
-            )
-        
-        # Add size chart population to populateForm
-        if 'document.getElementById(\'feature-soft-touch\').checked = features.soft_touch !== false;' in content:
-            if 'populateSizeChartFromData(productData.size_chart);' not in content:
-                content = content.replace(
-                    'document.getElementById(\'feature-soft-touch\').checked = features.soft_touch !== false;',
-                    'document.getElementById(\'feature-soft-touch\').checked = features.soft_touch !== false;\n\n            // Size Chart\n            populateSizeChartFromData(productData.size_chart);'
-                )
-        
-        # Add event listener to initializeEditPage
-        if 'setupSizeSelection();' in content and 'garmentTypeSelect.addEventListener' not in content:
-            setup_code = '''            
-            // Setup size chart preset dropdown
-            const garmentTypeSelect = document.getElementById('garment-type');
-            if (garmentTypeSelect) {
-                garmentTypeSelect.addEventListener('change', function() {
-                    if (this.value !== 'custom') {
-                        applySizeChartPreset(this.value);
-                    }
-                });
-            }'''
-            
-            content = content.replace(
-                'setupSizeSelection();',
-                'setupSizeSelection();' + setup_code
-            )
+        content = result.text
         
         # Save the updated file
-        with open(file_path, 'w', encoding='utf-8') as f:
-            f.write(content)
+        if write_if_changed(file_path, content):
+            metrics.count('bytes_written', os.path.getsize(file_path))
         
         print(f"  ✅ Successfully updated: {file_path}")
         return True
@@ -112,16 +160,37 @@ def apply_size_chart_functionality(file_path):
         print(f"  ❌ Error updating {file_path}: {e}")
         return False
 
+def parse_args():
+    parser = argparse.ArgumentParser(description="Copy the size chart section of the master edit page into the other edit pages")
+    instrumentation.add_arguments(parser)
+    return parser.parse_args()
+
 def main():
     """Apply size chart functionality to all edit pages"""
+    args = parse_args()
+    metrics = instrumentation.begin('apply_size_chart_to_edit_pages', args.progress_interval)
     print("🚀 Applying size chart functionality to edit pages...")
     
-    success_count = 0
-    for page in EDIT_PAGES:
-        if apply_size_chart_functionality(page):
-            success_count += 1
+    try:
+        with metrics.stage('master'):
+            fragments = master_fragments()
+    except OSError as e:
+        print(f"❌ Could not read master file {MASTER_PAGE}: {e}")
+        return
+    
+    updated_pages = []
+    with metrics.stage('patch'):
+        for page in EDIT_PAGES:
+            if apply_size_chart_functionality(page, fragments):
+                updated_pages.append(page)
+    success_count = len(updated_pages)
+    
+    # Refresh the .gz/.br siblings; pages whose content is unchanged keep theirs
+    with metrics.stage('precompress'):
+        precompress_pages(updated_pages)
     
     print(f"\n✅ Successfully updated {success_count} out of {len(EDIT_PAGES)} edit pages")
+    instrumentation.finish(args.metrics_file)
 
 if __name__ == "__main__":
     main()
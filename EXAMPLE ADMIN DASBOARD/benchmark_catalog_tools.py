@@ -0,0 +1,391 @@
+#!/usr/bin/env python3
+"""
+Benchmark harness for the catalog importer and the page patchers
+
+Generates synthetic shop.html pages and edit page corpora at several sizes and
+times each stage in a fresh process, so every measurement gets its own peak RSS:
+
+  parse        js_literal_parser over the allProducts array
+  pipeline     parse -> normalize -> validate -> batch
+  load-<mode>  add_products_to_database into a scratch schema (needs --database-url)
+  patch        add_size_chart_to_all_edit_pages over a pristine corpus
+  patch-rerun  the same run again, which the patch manifest should make near-free
+
+Results are written as JSON. With --baseline, the run exits non-zero when a
+stage's throughput drops, or its peak RSS grows, by more than --threshold.
+"""
+
+import argparse
+import contextlib
+import datetime
+import io
+import json
+import multiprocessing
+import os
+import platform
+import random
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+DEFAULT_SIZES = (100, 10_000, 100_000)
+DEFAULT_LOAD_MODES = ('bulk', 'sync')
+LOAD_MODES = ('rows', 'bulk', 'sync')
+
+# Edit pages are ~60 KB each, so corpora stop growing at this many pages
+DEFAULT_MAX_PAGES = 1000
+
+DEFAULT_THRESHOLD = 0.25
+DEFAULT_OUTPUT = 'benchmark_results.json'
+
+BENCH_SCHEMA = 'catalog_bench'
+
+# Same columns as the products table the importer writes to
+BENCH_PRODUCTS_TABLE = f"""
+    CREATE TABLE {BENCH_SCHEMA}.products (
+        id SERIAL PRIMARY KEY,
+        name VARCHAR(255) NOT NULL,
+        description TEXT,
+        price DECIMAL(10,2),
+        original_price DECIMAL(10,2),
+        image_url TEXT,
+        category VARCHAR(100),
+        subcategory VARCHAR(100),
+        tags TEXT[],
+        stock_quantity INTEGER,
+        is_featured BOOLEAN,
+        is_on_sale BOOLEAN,
+        sale_percentage INTEGER,
+        size_chart JSONB
+    )
+"""
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+_GARMENTS = ('Shirt', 'T-Shirt', 'Hoodie', 'Kids Tee', 'Youth Hoodie', 'Sweatshirt')
+_THEMES = ('Dad', 'Mom', 'Christmas', 'Halloween', 'Coffee', 'Guitar', 'Baseball', 'Motorcycle')
+
+
+def synthetic_products(count, seed=0):
+    """Deterministic allProducts entries with unique titles and images"""
+    rng = random.Random(seed)
+    for index in range(count):
+        theme = rng.choice(_THEMES)
+        yield {
+            'title': f"{theme} {rng.choice(_GARMENTS)} It's Design #{index}",
+            'image': f"../etsy_images/{theme.lower()}_{index}.jpg",
+            'collection': f"{theme} Collection",
+            'price': f"${rng.randint(15, 45)}.{rng.choice(('00', '50', '99'))}",
+            'rating': str(rng.randint(3, 5)),
+        }
+
+
+def _js_string(value):
+    return "'" + value.replace('\\', '\\\\').replace("'", "\\'") + "'"
+
+
+def write_shop_page(path, count):
+    """A shop.html with `count` products in its allProducts array, written incrementally"""
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write('<!DOCTYPE html>\n<html>\n<head><title>Shop</title></head>\n<body>\n<script>\n')
+        f.write('        const allProducts = [\n')
+        for product in synthetic_products(count):
+            fields = ', '.join(f"{key}: {_js_string(value)}" for key, value in product.items())
+            f.write(f"            {{ {fields} }},\n")
+        f.write('        ];\n</script>\n</body>\n</html>\n')
+    return os.path.getsize(path)
+
+
+def prototype_edit_page(workdir):
+    """Render one edit page with create_edit_page_for_product.js; None if node is unavailable"""
+    node_dir = os.path.join(workdir, 'node-prototype')
+    os.makedirs(os.path.join(node_dir, 'pages'), exist_ok=True)
+    shutil.copy(os.path.join(SCRIPT_DIR, 'create_edit_page_for_product.js'), node_dir)
+    try:
+        subprocess.run(
+            ['node', '-e', "require('./create_edit_page_for_product.js').createEditPageForProduct(1, 'Benchmark Product')"],
+            cwd=node_dir, check=True, capture_output=True, timeout=60
+        )
+    except (OSError, subprocess.SubprocessError) as e:
+        print(f"⚠️ Could not render a prototype edit page with node ({e}); skipping patch benchmarks")
+        return None
+    pages_dir = os.path.join(node_dir, 'pages')
+    with open(os.path.join(pages_dir, os.listdir(pages_dir)[0]), 'r', encoding='utf-8') as f:
+        return f.read()
+
+
+def write_edit_corpus(directory, prototype, count):
+    """`count` edit pages in directory/pages, each a copy of the prototype for a different product"""
+    pages_dir = os.path.join(directory, 'pages')
+    os.makedirs(pages_dir, exist_ok=True)
+    for product_id in range(1, count + 1):
+        content = prototype.replace('Benchmark Product', f"Benchmark Product {product_id}")
+        content = content.replace('const productId = 1;', f"const productId = {product_id};")
+        path = os.path.join(pages_dir, f"product-edit-product-{product_id}_benchmark_product_{product_id}.html")
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(content)
+
+
+def _peak_rss_kb():
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak // 1024 if sys.platform == 'darwin' else peak
+
+
+def _measure(stage, args):
+    """Child process: run one stage and report its duration and this process's peak RSS"""
+    sys.path.insert(0, SCRIPT_DIR)
+    start = time.perf_counter()
+    items = STAGES[stage](*args)
+    return {'seconds': time.perf_counter() - start, 'items': items, 'peak_rss_kb': _peak_rss_kb()}
+
+
+def run_isolated(stage, *args):
+    """Run a stage in a freshly spawned interpreter"""
+    context = multiprocessing.get_context('spawn')
+    with context.Pool(1) as pool:
+        return pool.apply(_measure, (stage, args))
+
+
+def stage_parse(shop_page):
+    from js_literal_parser import iter_array_objects
+    with open(shop_page, 'r', encoding='utf-8') as f:
+        return sum(1 for _ in iter_array_objects(f))
+
+
+def stage_pipeline(shop_page):
+    from catalog_pipeline import batch_stage, product_stream
+    with contextlib.redirect_stdout(io.StringIO()):
+        return sum(len(batch) for batch in batch_stage(product_stream(shop_page)))
+
+
+def stage_load(shop_page, mode, database_url):
+    os.environ['DATABASE_URL'] = database_url
+    import add_all_products
+    import db_access
+    from catalog_pipeline import catalog_batches
+    try:
+        # Raises, and so fails the benchmark, when the load does
+        with contextlib.redirect_stdout(io.StringIO()):
+            add_all_products.add_products_to_database(
+                catalog_batches(shop_page), bulk=(mode == 'bulk'), sync=(mode == 'sync')
+            )
+    finally:
+        db_access.close_pool()
+    with db_access.transaction() as cursor:
+        cursor.execute("SELECT count(*) FROM products")
+        count = cursor.fetchone()[0]
+    db_access.close_pool()
+    return count
+
+
+def stage_patch(corpus_dir):
+    import add_size_chart_to_all_edit_pages as patcher
+    os.chdir(corpus_dir)
+    sys.argv = ['add_size_chart_to_all_edit_pages.py', '--no-compress']
+    with contextlib.redirect_stdout(io.StringIO()):
+        patcher.main()
+    return sum(1 for filename in os.listdir('pages') if filename.endswith('.html'))
+
+
+STAGES = {
+    'parse': stage_parse,
+    'pipeline': stage_pipeline,
+    'load': stage_load,
+    'patch': stage_patch,
+    'patch-rerun': stage_patch,
+}
+
+
+def bench_schema_url(database_url):
+    """Create an empty scratch products table, set up for search and --sync, and return a DSN resolving `products` to it"""
+    import psycopg2
+    import psycopg2.extensions
+    from catalog_load import setup_products_table
+    from catalog_search import ensure_search_index
+    conn = psycopg2.connect(database_url)
+    try:
+        with conn, conn.cursor() as cursor:
+            cursor.execute(f"DROP SCHEMA IF EXISTS {BENCH_SCHEMA} CASCADE")
+            cursor.execute(f"CREATE SCHEMA {BENCH_SCHEMA}")
+            cursor.execute(BENCH_PRODUCTS_TABLE)
+            cursor.execute(f"SET LOCAL search_path = {BENCH_SCHEMA}")
+            ensure_search_index(cursor)
+            setup_products_table(cursor)
+    finally:
+        conn.close()
+    return psycopg2.extensions.make_dsn(database_url, options=f"-csearch_path={BENCH_SCHEMA}")
+
+
+def drop_bench_schema(database_url):
+    import psycopg2
+    conn = psycopg2.connect(database_url)
+    try:
+        with conn, conn.cursor() as cursor:
+            cursor.execute(f"DROP SCHEMA IF EXISTS {BENCH_SCHEMA} CASCADE")
+    finally:
+        conn.close()
+
+
+def record(results, stage, size, measured, input_bytes=None):
+    seconds = measured['seconds']
+    entry = {
+        'stage': stage,
+        'size': size,
+        'items': measured['items'],
+        'seconds': round(seconds, 4),
+        'items_per_second': round(measured['items'] / seconds, 1) if seconds else None,
+        'peak_rss_kb': measured['peak_rss_kb'],
+    }
+    if input_bytes is not None and seconds:
+        entry['mb_per_second'] = round(input_bytes / seconds / (1024 * 1024), 2)
+    results.append(entry)
+    throughput = f"{entry['items_per_second']:,.0f} items/s" if entry['items_per_second'] else "n/a"
+    print(f"  {stage:<12} {size:>8,}  {seconds:8.3f}s  {throughput:>18}  peak RSS {entry['peak_rss_kb'] / 1024:7.1f} MB")
+
+
+def run_benchmarks(args, workdir):
+    results = []
+    prototype = prototype_edit_page(workdir)
+    if not args.database_url:
+        print("ℹ️ No --database-url given; skipping DB load benchmarks")
+    try:
+        for size in args.sizes:
+            print(f"\n📦 {size:,} products")
+            shop_page = os.path.join(workdir, f"shop-{size}.html")
+            shop_bytes = write_shop_page(shop_page, size)
+            record(results, 'parse', size, run_isolated('parse', shop_page), shop_bytes)
+            record(results, 'pipeline', size, run_isolated('pipeline', shop_page), shop_bytes)
+
+            if args.database_url:
+                for mode in args.load_modes:
+                    # Every load starts from an empty scratch table
+                    bench_url = bench_schema_url(args.database_url)
+                    record(results, f"load-{mode}", size, run_isolated('load', shop_page, mode, bench_url), shop_bytes)
+
+            if prototype is not None:
+                pages = min(size, args.max_pages)
+                corpus_dir = os.path.join(workdir, f"corpus-{pages}")
+                if os.path.exists(corpus_dir):
+                    shutil.rmtree(corpus_dir)
+                write_edit_corpus(corpus_dir, prototype, pages)
+                record(results, 'patch', pages, run_isolated('patch', corpus_dir))
+                record(results, 'patch-rerun', pages, run_isolated('patch-rerun', corpus_dir))
+                shutil.rmtree(corpus_dir)
+            os.remove(shop_page)
+    finally:
+        if args.database_url:
+            drop_bench_schema(args.database_url)
+    return results
+
+
+def compare(results, baseline, threshold):
+    """Regressions against a baseline: slower throughput or higher peak RSS beyond threshold"""
+    previous = {(entry['stage'], entry['size']): entry for entry in baseline.get('results', [])}
+    regressions = []
+    for entry in results:
+        old = previous.get((entry['stage'], entry['size']))
+        if not old:
+            continue
+        if old.get('items_per_second') and entry['items_per_second'] is not None:
+            drop = 1 - entry['items_per_second'] / old['items_per_second']
+            if drop > threshold:
+                regressions.append(f"{entry['stage']} @ {entry['size']:,}: throughput "
+                                   f"{old['items_per_second']:,.0f} -> {entry['items_per_second']:,.0f} items/s "
+                                   f"(-{drop:.0%})")
+        if old.get('peak_rss_kb'):
+            growth = entry['peak_rss_kb'] / old['peak_rss_kb'] - 1
+            if growth > threshold:
+                regressions.append(f"{entry['stage']} @ {entry['size']:,}: peak RSS "
+                                   f"{old['peak_rss_kb'] / 1024:.1f} -> {entry['peak_rss_kb'] / 1024:.1f} MB "
+                                   f"(+{growth:.0%})")
+    return regressions
+
+
+def parse_sizes(value):
+    try:
+        sizes = [int(part.replace('_', '')) for part in value.split(',') if part.strip()]
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"expected comma-separated product counts, got {value!r}")
+    if not sizes or min(sizes) < 1:
+        raise argparse.ArgumentTypeError("product counts must be positive")
+    return sizes
+
+
+def parse_modes(value):
+    modes = [part.strip() for part in value.split(',') if part.strip()]
+    unknown = [mode for mode in modes if mode not in LOAD_MODES]
+    if unknown:
+        raise argparse.ArgumentTypeError(f"unknown load mode(s) {', '.join(unknown)}; choose from {', '.join(LOAD_MODES)}")
+    return modes
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark the catalog importer and page patchers on synthetic data")
+    parser.add_argument('--sizes', type=parse_sizes, default=list(DEFAULT_SIZES),
+                        help="comma-separated product counts (default: 100,10000,100000)")
+    parser.add_argument('--database-url',
+                        help=f"scratch Postgres to time loads against; a {BENCH_SCHEMA} schema is created and dropped "
+                             "(DB stages are skipped without it)")
+    parser.add_argument('--load-modes', type=parse_modes, default=list(DEFAULT_LOAD_MODES),
+                        help="comma-separated importer modes to time: rows, bulk, sync (default: bulk,sync)")
+    parser.add_argument('--max-pages', type=int, default=DEFAULT_MAX_PAGES,
+                        help=f"largest edit page corpus to generate (default: {DEFAULT_MAX_PAGES})")
+    parser.add_argument('--workdir',
+                        help="where synthetic inputs are generated (default: a temporary directory)")
+    parser.add_argument('--output', default=DEFAULT_OUTPUT,
+                        help=f"results file (default: {DEFAULT_OUTPUT})")
+    parser.add_argument('--baseline',
+                        help="previous results file to compare against")
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD,
+                        help=f"allowed throughput drop / peak RSS growth as a fraction (default: {DEFAULT_THRESHOLD})")
+    args = parser.parse_args()
+    if args.max_pages < 1:
+        parser.error("--max-pages must be at least 1")
+    if args.threshold < 0:
+        parser.error("--threshold cannot be negative")
+    return args
+
+
+def main():
+    """Run the benchmarks, save the results and check them against the baseline"""
+    args = parse_args()
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+
+    print("🚀 Benchmarking catalog and page tooling...")
+    if args.workdir:
+        os.makedirs(args.workdir, exist_ok=True)
+        results = run_benchmarks(args, os.path.abspath(args.workdir))
+    else:
+        with tempfile.TemporaryDirectory(prefix='catalog-bench-') as workdir:
+            results = run_benchmarks(args, workdir)
+
+    report = {
+        'created': datetime.datetime.now(datetime.timezone.utc).isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'results': results,
+    }
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2)
+    print(f"\n✅ Saved {len(results)} results to {args.output}")
+
+    if baseline is not None:
+        regressions = compare(results, baseline, args.threshold)
+        if regressions:
+            print(f"\n❌ {len(regressions)} regression(s) beyond {args.threshold:.0%} against {args.baseline}:")
+            for regression in regressions:
+                print(f"   {regression}")
+            sys.exit(1)
+        print(f"✅ No regressions beyond {args.threshold:.0%} against {args.baseline}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmark of the patchers' page patterns on large, adversarial pages
+
+Builds pages of each size (up to 1 MB by default) that are hostile to one
+pattern each: long inline scripts full of `<` comparisons, object literals
+whose closing brace never comes, whitespace after
+</script>, and injected size chart sections without their closing divs. Every
+pattern of page_patterns, both patchers' injectors and remove_sections run over
+every page. Each target's scaling exponent (the slope of log time over log
+page size: 1 for linear, 2 for quadratic) must stay under --max-exponent, or
+the run exits non-zero.
+"""
+
+import argparse
+import math
+import sys
+import time
+
+import page_patterns
+from add_size_chart_to_all_edit_pages import _injector as add_size_chart_injector
+from complete_size_chart_implementation import _injector as complete_size_chart_injector
+
+DEFAULT_SIZES = (128 * 1024, 256 * 1024, 512 * 1024, 1024 * 1024)
+DEFAULT_REPEAT = 5
+DEFAULT_MAX_EXPONENT = 1.5
+
+# Times below this are too noisy to judge growth by
+MIN_MEASURABLE_SECONDS = 0.002
+
+# Unit repeated to fill each adversarial page
+PAGE_UNITS = {
+    'lt-comparisons': 'if (i < items.length) total += items[i].price;\n',
+    'open-form-data': 'const formData = { name: name, price: price,\n',
+    'script-end-whitespace': '</script>' + ' ' * 4096 + '\n',
+    'open-size-chart-sections': '<!-- Size Chart Configuration --><div class="size-chart"></div>\n',
+    'unclosed-size-chart-sections': '<!-- Size Chart Configuration -->\n<div class="size-chart">\n',
+    'tags-labels': '<label class="block text-sm font-medium" for="product-tags">Tags</label>\n',
+}
+
+
+def adversarial_page(kind, size):
+    unit = PAGE_UNITS[kind]
+    return unit * max(1, size // len(unit))
+
+
+def targets():
+    """name -> function(text) for everything the patchers run over whole pages"""
+    patterns = {
+        name: getattr(page_patterns, name)
+        for name in ('SCRIPT_END', 'TAGS_SECTION', 'FORM_DATA_BODY')
+    }
+    found = {name: (lambda text, pattern=pattern: sum(1 for _ in pattern.finditer(text)))
+             for name, pattern in patterns.items()}
+    found['add_size_chart injector'] = add_size_chart_injector.apply
+    found['complete_size_chart injector'] = complete_size_chart_injector.apply
+    found['remove_sections'] = lambda text: page_patterns.remove_sections(
+        text, page_patterns.SIZE_CHART_SECTION_START, page_patterns.size_chart_section_end)
+    return found
+
+
+def best_time(function, text, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function(text)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def scaling_exponent(sizes, seconds):
+    """Least-squares slope of log(seconds) over log(size): ~1 when linear, ~2 when quadratic"""
+    if seconds[-1] < MIN_MEASURABLE_SECONDS:
+        return 1.0
+    xs = [math.log(size) for size in sizes]
+    ys = [math.log(max(s, 1e-9)) for s in seconds]
+    mean_x = sum(xs) / len(xs)
+    mean_y = sum(ys) / len(ys)
+    return (sum((x - mean_x) * (y - mean_y) for x, y in zip(xs, ys))
+            / sum((x - mean_x) ** 2 for x in xs))
+
+
+def run(sizes, repeat, max_exponent):
+    """Print the timing table; return the (target, page kind, exponent) triples over max_exponent"""
+    failures = []
+    header = ''.join(f"{size // 1024:>9} KB" for size in sizes)
+    for kind in PAGE_UNITS:
+        pages = [adversarial_page(kind, size) for size in sizes]
+        print(f"\n📄 {kind}")
+        print(f"  {'target':<30}{header}   exponent")
+        for name, function in targets().items():
+            seconds = [best_time(function, page, repeat) for page in pages]
+            exponent = scaling_exponent([len(page) for page in pages], seconds)
+            mark = '❌' if exponent > max_exponent else '  '
+            timings = ''.join(f"{s * 1000:9.2f} ms" for s in seconds)
+            print(f"  {name:<30}{timings}   {exponent:5.2f} {mark}")
+            if exponent > max_exponent:
+                failures.append((name, kind, exponent))
+    return failures
+
+
+def parse_sizes(value):
+    try:
+        sizes = sorted(int(part) * 1024 for part in value.split(','))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"expected comma-separated sizes in KB, got {value!r}")
+    if len(sizes) < 2 or sizes[0] < 1:
+        raise argparse.ArgumentTypeError("give at least two positive sizes")
+    return sizes
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Check that the patchers' page patterns scale linearly with page size")
+    parser.add_argument('--sizes', type=parse_sizes, default=list(DEFAULT_SIZES),
+                        help="comma-separated page sizes in KB (default: 128,256,512,1024)")
+    parser.add_argument('--repeat', type=int, default=DEFAULT_REPEAT,
+                        help=f"runs per measurement, the fastest is kept (default: {DEFAULT_REPEAT})")
+    parser.add_argument('--max-exponent', type=float, default=DEFAULT_MAX_EXPONENT,
+                        help=f"highest allowed scaling exponent; 1 is linear, 2 quadratic "
+                             f"(default: {DEFAULT_MAX_EXPONENT})")
+    args = parser.parse_args()
+    if args.repeat < 1:
+        parser.error("--repeat must be at least 1")
+    return args
+
+
+def main():
+    args = parse_args()
+    print(f"🚀 Timing page patterns on {', '.join(f'{size // 1024} KB' for size in args.sizes)} pages...")
+    failures = run(args.sizes, args.repeat, args.max_exponent)
+    if failures:
+        print(f"\n❌ {len(failures)} target(s) grew faster than linearly:")
+        for name, kind, exponent in failures:
+            print(f"   {name} on {kind}: exponent {exponent:.2f}")
+        sys.exit(1)
+    print("\n✅ Every target scaled linearly")
+
+
+if __name__ == '__main__':
+    main()
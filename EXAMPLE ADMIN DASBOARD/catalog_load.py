@@ -0,0 +1,292 @@
+#!/usr/bin/env python3
+"""
+What a load of the products table writes, shared by both importers
+
+add_all_products.py runs these statements through psycopg2 and import_service.py
+through asyncpg, so every statement that takes parameters uses $1 placeholders
+(psycopg2 PREPAREs them through db_access) and the bookkeeping of a --sync load
+lives in ProductSync rather than in either driver. Each importer only moves
+rows and results between the database and the objects here.
+
+The columns a load writes beyond the original products table are declared in
+database/schema.sql; for a database created before them, run this file with
+--setup once. Imports only check that they exist: ALTER TABLE would hold an
+exclusive lock on products, blocking the storefront, until the load commits.
+"""
+
+import argparse
+import hashlib
+import json
+
+import db_access
+from category_summary import CATEGORY_KEY_INDEX_DDL, summary_key
+
+# Column order shared by the row-by-row INSERT, COPY and execute_values loaders
+PRODUCT_COLUMNS = (
+    'name', 'description', 'price', 'original_price', 'image_url', 'category',
+    'subcategory', 'tags', 'stock_quantity', 'is_featured', 'is_on_sale', 'sale_percentage',
+    'size_chart'
+)
+
+SYNC_COLUMNS = PRODUCT_COLUMNS + ('import_key', 'content_hash')
+
+
+def _placeholders(count):
+    return ', '.join(f"${i}" for i in range(1, count + 1))
+
+
+# Transaction-level advisory lock held by every load of the products catalog, so
+# add_all_products.py and import_service.py never load it at the same time
+IMPORT_LOCK = 'catalog_import:products'
+ACQUIRE_IMPORT_LOCK = ('acquire_import_lock', "SELECT pg_try_advisory_xact_lock(hashtext($1))")
+
+# One-time setup of a products table created before database/schema.sql declared these
+SIZE_CHART_COLUMN_DDL = "ALTER TABLE products ADD COLUMN IF NOT EXISTS size_chart JSONB"
+SYNC_COLUMNS_DDL = (
+    "ALTER TABLE products ADD COLUMN IF NOT EXISTS import_key VARCHAR(255)",
+    "ALTER TABLE products ADD COLUMN IF NOT EXISTS content_hash CHAR(64)",
+    "CREATE UNIQUE INDEX IF NOT EXISTS idx_products_import_key ON products (import_key)",
+)
+
+
+def _missing_columns(columns):
+    """Query for which of `columns` the products table the connection resolves lacks"""
+    names = ', '.join(f"'{column}'" for column in columns)
+    return f"""
+    SELECT column_name FROM unnest(ARRAY[{names}]) AS column_name
+    WHERE NOT EXISTS (SELECT 1 FROM pg_attribute
+                      WHERE attrelid = to_regclass('products') AND attname = column_name AND NOT attisdropped)
+"""
+
+
+# Columns every load writes; what else --sync needs is checked separately
+MISSING_LOAD_COLUMNS = _missing_columns(('size_chart',))
+MISSING_SYNC_COLUMNS = _missing_columns(('import_key', 'content_hash'))
+
+# ON CONFLICT (import_key) needs a unique index on exactly that column
+IMPORT_KEY_INDEX_EXISTS = """
+    SELECT EXISTS (SELECT 1 FROM pg_index x
+                   JOIN pg_attribute a ON a.attrelid = x.indrelid AND a.attnum = x.indkey[0]
+                   WHERE x.indrelid = to_regclass('products') AND x.indisunique AND x.indnkeyatts = 1
+                     AND x.indpred IS NULL AND a.attname = 'import_key')
+"""
+IMPORT_KEY_INDEX = 'unique index on import_key'
+
+
+def setup_hint(missing):
+    """Error message for a products table lacking the `missing` columns and indexes"""
+    return (f"products has no {', '.join(missing)}; apply database/schema.sql "
+            f"or run catalog_load.py --setup once")
+
+
+# Full reloads
+CLEAR_PRODUCTS = "DELETE FROM products"
+ANALYZE_PRODUCTS = "ANALYZE products"
+
+# Server-side prepared statements, PREPAREd once per pooled connection
+INSERT_PRODUCT = (
+    'insert_product',
+    f"INSERT INTO products ({', '.join(PRODUCT_COLUMNS)}) VALUES ({_placeholders(len(PRODUCT_COLUMNS))})"
+)
+UPSERT_PRODUCT = (
+    'upsert_product',
+    f"""INSERT INTO products ({', '.join(SYNC_COLUMNS)}) VALUES ({_placeholders(len(SYNC_COLUMNS))})
+        ON CONFLICT (import_key) DO UPDATE SET
+        {', '.join(f"{column} = EXCLUDED.{column}" for column in PRODUCT_COLUMNS + ('content_hash',))},
+        search_vector = NULL
+        WHERE products.content_hash IS DISTINCT FROM EXCLUDED.content_hash"""
+)
+
+# --sync
+# One-time migration, run by --setup: rows synced while import_key was the
+# lower-cased name take their exact name as key
+REKEY_PRODUCTS = "UPDATE products SET import_key = name WHERE import_key <> name"
+REKEY_HINT = "products still has rows keyed by lower-cased name; run catalog_load.py --setup once to re-key them"
+# The third column is false for rows REKEY_PRODUCTS has yet to migrate
+STORED_HASHES = "SELECT import_key, content_hash, import_key = name FROM products WHERE import_key IS NOT NULL"
+HAS_UNKEYED_ROWS = "SELECT EXISTS (SELECT 1 FROM products WHERE import_key IS NULL)"
+
+# Takes the text[] of import keys and the text[] of the matching names
+ADOPT_UNKEYED_ROWS = (
+    'adopt_unkeyed_rows',
+    """UPDATE products SET import_key = v.import_key
+        FROM unnest($1::text[], $2::text[]) AS v (import_key, name)
+        WHERE products.import_key IS NULL AND products.name = v.name
+          AND NOT EXISTS (SELECT 1 FROM products p WHERE p.import_key = v.import_key)
+          AND products.id = (SELECT min(id) FROM products p2 WHERE p2.import_key IS NULL AND p2.name = v.name)"""
+)
+
+# Both return the summary key of each deleted row's category
+DELETE_REMOVED_PRODUCTS = (
+    'delete_removed_products',
+    "DELETE FROM products WHERE import_key = ANY($1::text[]) RETURNING coalesce(category, '')"
+)
+DELETE_UNKEYED_PRODUCTS = "DELETE FROM products WHERE import_key IS NULL RETURNING coalesce(category, '')"
+
+
+def product_row(product):
+    """Return a product dict as a tuple in PRODUCT_COLUMNS order"""
+    return tuple(product[column] for column in PRODUCT_COLUMNS)
+
+
+def hashes_by_key(rows):
+    """import_key -> content_hash of the STORED_HASHES rows; raises RuntimeError if any need re-keying"""
+    if not all(current for _, _, current in rows):
+        raise RuntimeError(REKEY_HINT)
+    return {key: digest for key, digest, _ in rows}
+
+
+def import_key(product):
+    """Stable identity of an imported product: its exact name, as a full reload stores it"""
+    return product['name']
+
+
+def content_hash(product):
+    """Hash of every imported column, used to detect products that changed since the last sync"""
+    payload = json.dumps(product_row(product), default=str, ensure_ascii=False)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def keyed_batch(batch, seen):
+    """Map import_key -> (content_hash, product) for one batch
+
+    Keys already in `seen` (from earlier batches) are duplicates and are skipped;
+    new keys are added to it.
+    """
+    keyed = {}
+    for product in batch:
+        key = import_key(product)
+        if key in seen:
+            continue
+        seen.add(key)
+        keyed[key] = (content_hash(product), product)
+    return keyed
+
+
+def changed_products(keyed, stored):
+    """The (key, hash, product) triples whose hash differs from the stored one"""
+    return [
+        (key, digest, product)
+        for key, (digest, product) in keyed.items()
+        if stored.get(key) != digest
+    ]
+
+
+class ProductSync:
+    """Bookkeeping of one --sync load, whichever driver runs its statements
+
+    Start from the stored import_key -> content_hash map (hashes_by_key() of
+    STORED_HASHES) and whether HAS_UNKEYED_ROWS. For each batch, diff() it,
+    ADOPT_UNKEYED_ROWS with adopt_params() while `adopt` is set, record the
+    STORED_CATEGORIES of the changed keys, then UPSERT_PRODUCT the upsert_rows().
+    After the last batch,
+    DELETE_REMOVED_PRODUCTS removed_keys() and DELETE_UNKEYED_PRODUCTS, recording
+    them with record_deleted(); `categories` is then what category_summary refreshes.
+    """
+
+    def __init__(self, stored, adopt):
+        self.stored = stored
+        self.adopt = adopt
+        self.seen = set()
+        self.categories = set()
+        self.duplicates = 0
+        self.upserted = 0
+        self.adopted = 0
+        self.deleted = 0
+
+    def diff(self, batch):
+        """(keyed, changed) for one batch: products under keys not seen before, and those that changed"""
+        keyed = keyed_batch(batch, self.seen)
+        self.duplicates += len(batch) - len(keyed)
+        changed = changed_products(keyed, self.stored)
+        self.categories.update(summary_key(product['category']) for _, _, product in changed)
+        self.upserted += len(changed)
+        return keyed, changed
+
+    @staticmethod
+    def adopt_params(keyed):
+        return [key for key in keyed], [product['name'] for _, product in keyed.values()]
+
+    @staticmethod
+    def changed_keys(changed):
+        return [key for key, _, _ in changed]
+
+    @staticmethod
+    def upsert_rows(changed, row=product_row):
+        """UPSERT_PRODUCT parameters of the changed products; `row` turns a product into its columns"""
+        return [row(product) + (key, digest) for key, digest, product in changed]
+
+    def record_categories(self, rows):
+        """Add the single-column category rows a statement returned to `categories`"""
+        self.categories.update(row[0] for row in rows)
+
+    def record_deleted(self, rows):
+        """Count the rows a DELETE ... RETURNING category removed and remember their categories"""
+        self.record_categories(rows)
+        self.deleted += len(rows)
+
+    def removed_keys(self):
+        """Stored keys the source no longer lists"""
+        return [key for key in self.stored if key not in self.seen]
+
+    @property
+    def unchanged(self):
+        return len(self.seen) - self.upserted
+
+
+def setup_products_table(cursor):
+    """One-time setup: add the columns and indexes imports use to an older products table, and re-key it"""
+    cursor.execute(SIZE_CHART_COLUMN_DDL)
+    for statement in SYNC_COLUMNS_DDL:
+        cursor.execute(statement)
+    cursor.execute(CATEGORY_KEY_INDEX_DDL)
+    cursor.execute(REKEY_PRODUCTS)
+    return cursor.rowcount
+
+
+def _missing(cursor, query):
+    cursor.execute(query)
+    return [f"{row[0]} column" for row in cursor.fetchall()]
+
+
+def require_load_columns(cursor):
+    """Raise RuntimeError unless the products table has every column a load writes"""
+    missing = _missing(cursor, MISSING_LOAD_COLUMNS)
+    if missing:
+        raise RuntimeError(setup_hint(missing))
+
+
+def require_sync_columns(cursor):
+    """Raise RuntimeError unless the products table has the --sync columns and import_key index"""
+    missing = _missing(cursor, MISSING_SYNC_COLUMNS)
+    cursor.execute(IMPORT_KEY_INDEX_EXISTS)
+    if not cursor.fetchone()[0]:
+        missing.append(IMPORT_KEY_INDEX)
+    if missing:
+        raise RuntimeError(setup_hint(missing))
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Check that the products table is ready for imports")
+    parser.add_argument('--setup', action='store_true',
+                        help="add the columns and indexes imports use to a table created before schema.sql "
+                             "declared them, and re-key rows synced under the old import key")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    try:
+        with db_access.transaction() as cursor:
+            if args.setup:
+                rekeyed = setup_products_table(cursor)
+                print(f"🔧 Import columns are in place; re-keyed {rekeyed} products")
+            require_load_columns(cursor)
+            require_sync_columns(cursor)
+    finally:
+        db_access.close_pool()
+    print("✅ products is ready for imports")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,273 @@
+#!/usr/bin/env python3
+"""
+Generator pipeline feeding the catalog importer
+
+parse -> normalize -> validate -> batch stages are chained generators. prefetch()
+runs the chain in a background thread and hands finished batches to the loader
+through a bounded queue, so the database load overlaps with parsing and a slow
+loader throttles the parser instead of letting batches pile up in memory.
+
+merged_products() parses several listing pages in a process pool and merges them
+into one de-duplicated stream for the same loaders.
+"""
+
+import os
+import queue
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+from catalog_snapshot import is_snapshot, snapshot_products
+from js_literal_parser import iter_array_objects
+from size_chart_presets import product_size_chart
+
+DEFAULT_BATCH_SIZE = 1000
+
+# Batches buffered between the parser thread and the loader
+DEFAULT_QUEUE_SIZE = 4
+
+SHOP_PAGE = 'pages/shop.html'
+
+# Longest value the products.name column accepts
+MAX_NAME_LENGTH = 255
+
+
+def parse_stage(path, array_name='allProducts'):
+    """Yield raw product objects from the allProducts array of a listing page"""
+    with open(path, 'r', encoding='utf-8') as f:
+        yield from iter_array_objects(f, array_name)
+
+
+def normalize_product(raw):
+    """Turn a raw allProducts entry into a products table row; None if it has no title"""
+    title = raw.get('title')
+    if not title:
+        return None
+    image_path = str(raw.get('image') or '')
+
+    # Convert image path to database format
+    if image_path.startswith('../etsy_images/'):
+        image_path = image_path.replace('../etsy_images/', 'etsy_images/')
+
+    # Extract price as number
+    price_str = str(raw.get('price', '')).replace('$', '').replace(',', '')
+    try:
+        price_value = float(price_str)
+        original_price = price_value * 1.2  # 20% markup for original price
+    except ValueError:
+        price_value = 22.00
+        original_price = 26.40
+
+    # The parser has already unescaped the title, so this is the exact name from the frontend
+    product_name = str(title)
+
+    product = {
+        'name': product_name,  # Exact name from frontend
+        'description': f"Quality printed design - {product_name}",
+        'price': price_value,
+        'original_price': original_price,
+        'image_url': image_path,
+        'category': str(raw.get('collection') or '').replace(' Collection', ''),
+        'subcategory': 'Featured',
+        'tags': ['custom', 'printed', 'quality'],
+        'stock_quantity': 50,
+        'is_featured': True,
+        'is_on_sale': True,
+        'sale_percentage': 15
+    }
+    # Ready-made size chart for the product's garment type, so pages don't compute it
+    product['size_chart'] = product_size_chart(product)
+    return product
+
+
+def normalize_stage(raws):
+    """Yield normalized products, dropping entries without a title"""
+    for raw in raws:
+        product = normalize_product(raw)
+        if product:
+            yield product
+
+
+def validate_product(product):
+    """Return why a normalized product cannot be loaded, or None if it is valid"""
+    name = product['name'].strip()
+    if not name:
+        return "empty name"
+    if len(name) > MAX_NAME_LENGTH:
+        return f"name longer than {MAX_NAME_LENGTH} characters"
+    if not product['image_url']:
+        return "missing image"
+    if product['price'] <= 0:
+        return f"invalid price {product['price']}"
+    return None
+
+
+def validate_stage(products):
+    """Yield valid products, reporting and skipping the rest"""
+    for product in products:
+        problem = validate_product(product)
+        if problem:
+            print(f"Skipping product {product['name'][:60]!r}: {problem}")
+            continue
+        yield product
+
+
+def batch_stage(products, batch_size=DEFAULT_BATCH_SIZE):
+    """Group products into lists of at most batch_size"""
+    batch = []
+    for product in products:
+        batch.append(product)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def product_stream(path=SHOP_PAGE):
+    """parse -> normalize -> validate for one listing page, or validate for a catalog snapshot manifest"""
+    if is_snapshot(path):
+        return validate_stage(snapshot_products(path))
+    return validate_stage(normalize_stage(parse_stage(path)))
+
+
+def normalized_name(product):
+    """Product name, case- and whitespace-normalized"""
+    return ' '.join(product['name'].lower().split())
+
+
+def normalized_image(product):
+    """Image file name without directory or query string, lower-cased
+
+    Different pages reference the same file as ../etsy_images/x.jpg, etsy_images/x.jpg
+    or a full URL, so only the file name identifies the image.
+    """
+    path = product['image_url'].split('?', 1)[0].split('#', 1)[0]
+    return path.replace('\\', '/').rsplit('/', 1)[-1].lower()
+
+
+def parse_source(path):
+    """Process-pool worker: every valid product of one listing page, as a list"""
+    return list(product_stream(path))
+
+
+def dedupe_stage(products):
+    """Drop products whose normalized name or image file was already seen"""
+    names = set()
+    images = set()
+    for product in products:
+        name = normalized_name(product)
+        image = normalized_image(product)
+        if name in names or (image and image in images):
+            continue
+        names.add(name)
+        if image:
+            images.add(image)
+        yield product
+
+
+def merged_products(paths, workers=None):
+    """Parse listing pages in parallel processes and yield their products de-duplicated
+
+    Pages are merged in the order given, so when two pages list the same product the
+    earlier page wins.
+    """
+    workers = workers or min(len(paths), os.cpu_count() or 1)
+
+    def parsed():
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            for path, products in zip(paths, pool.map(parse_source, paths)):
+                if not products:
+                    print(f"No products found in {path}")
+                else:
+                    print(f"Parsed {len(products)} products from {path}")
+                yield from products
+
+    return dedupe_stage(parsed())
+
+
+_ITEM, _DONE, _ERROR = range(3)
+
+
+def _put(items, stop, entry):
+    """Queue `entry` unless the consumer stops first; whether it was queued"""
+    while not stop.is_set():
+        try:
+            items.put(entry, timeout=0.1)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+
+def _produce(iterable, items, stop):
+    try:
+        for item in iterable:
+            if not _put(items, stop, (_ITEM, item)):
+                break
+        else:
+            _put(items, stop, (_DONE, None))
+    except BaseException as e:
+        _put(items, stop, (_ERROR, e))
+    finally:
+        # This thread is the only one that ever runs the stages, so it closes them too
+        close = getattr(iterable, 'close', None)
+        if close:
+            close()
+
+
+class Prefetch:
+    """Iterator over `iterable`, run in a background thread and handed over through a bounded queue
+
+    The producer blocks once `maxsize` items are waiting, which is what gives the
+    pipeline backpressure. Exceptions raised by the producer are re-raised in the
+    consumer. Unlike closing a generator, close() may be called from any thread,
+    even while another one is waiting in next(); that next() then ends the
+    iteration, and close() returns once the producer thread has exited.
+    """
+
+    def __init__(self, iterable, maxsize=DEFAULT_QUEUE_SIZE):
+        self._items = queue.Queue(maxsize)
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=_produce, args=(iterable, self._items, self._stop),
+                                        name='catalog-pipeline', daemon=True)
+        self._thread.start()
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        while not self._stop.is_set():
+            try:
+                kind, value = self._items.get(timeout=0.1)
+            except queue.Empty:
+                continue
+            if kind == _ITEM:
+                return value
+            self._stop.set()
+            if kind == _ERROR:
+                raise value
+        raise StopIteration
+
+    def close(self):
+        """Stop the producer and wait for its thread to exit"""
+        self._stop.set()
+        self._thread.join()
+
+    def __del__(self):
+        # An abandoned pipeline must not keep its producer waiting forever
+        self._stop.set()
+
+
+def prefetch(iterable, maxsize=DEFAULT_QUEUE_SIZE):
+    """Run `iterable` in a background thread; see Prefetch"""
+    return Prefetch(iterable, maxsize)
+
+
+def catalog_batches(path=SHOP_PAGE, batch_size=DEFAULT_BATCH_SIZE, queue_size=DEFAULT_QUEUE_SIZE):
+    """Batches of validated products, produced concurrently with whoever consumes them"""
+    return prefetch(batch_stage(product_stream(path), batch_size), queue_size)
+
+
+def multi_source_batches(paths, batch_size=DEFAULT_BATCH_SIZE, queue_size=DEFAULT_QUEUE_SIZE, workers=None):
+    """Batches of the merged, de-duplicated products of several listing pages"""
+    return prefetch(batch_stage(merged_products(paths, workers), batch_size), queue_size)
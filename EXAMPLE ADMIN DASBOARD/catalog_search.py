@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+"""
+Full-text and partial-name search over the products table
+
+Every import keeps a weighted search_vector column (name, then category, tags
+and description) with a GIN index, and a trigram index on name for partial
+matches such as "mustan". Inserted rows and rows the --sync upsert rewrites
+start with a NULL search_vector; refresh_search_vectors() fills in just those,
+through a small partial index, so an import that changes ten products
+re-tokenizes ten rows instead of the whole catalog. Rows edited outside the
+importer keep their previous vector until the next import touches them.
+
+The column, the indexes and the pg_trgm extension are created once, by
+database/schema.sql or by running this file with --setup as a role that may
+create extensions; imports only refresh vectors and refuse to run without them.
+
+search_products() ranks matches from both indexes in one query; run this file
+to try it: python catalog_search.py "red mustang"
+"""
+
+import argparse
+import time
+from collections import namedtuple
+
+import db_access
+
+SEARCH_CONFIG = 'english'
+
+# Schema pg_trgm is installed in; its objects are qualified so a different search_path still finds them
+TRGM_SCHEMA = 'public'
+
+# Weighted document: a hit in the name outranks one in the category, tags or description
+SEARCH_VECTOR_EXPRESSION = f"""
+    setweight(to_tsvector('{SEARCH_CONFIG}', coalesce(name, '')), 'A') ||
+    setweight(to_tsvector('{SEARCH_CONFIG}', coalesce(category, '')), 'B') ||
+    setweight(to_tsvector('{SEARCH_CONFIG}', coalesce(array_to_string(tags, ' '), '')), 'C') ||
+    setweight(to_tsvector('{SEARCH_CONFIG}', coalesce(description, '')), 'D')"""
+
+SEARCH_INDEX_DDL = (
+    f"CREATE EXTENSION IF NOT EXISTS pg_trgm WITH SCHEMA {TRGM_SCHEMA}",
+    "ALTER TABLE products ADD COLUMN IF NOT EXISTS search_vector TSVECTOR",
+    "CREATE INDEX IF NOT EXISTS idx_products_search_vector ON products USING GIN (search_vector)",
+    f"CREATE INDEX IF NOT EXISTS idx_products_name_trgm ON products USING GIN (name {TRGM_SCHEMA}.gin_trgm_ops)",
+    # Finds the rows still to refresh without scanning the catalog
+    "CREATE INDEX IF NOT EXISTS idx_products_search_stale ON products (id) WHERE search_vector IS NULL",
+)
+
+SEARCH_VECTOR_UPDATE = f"UPDATE {{table}} SET search_vector = {SEARCH_VECTOR_EXPRESSION} WHERE search_vector IS NULL"
+
+# No parameters, so the asyncpg import service runs it as is
+REFRESH_SEARCH_VECTORS = SEARCH_VECTOR_UPDATE.format(table='products')
+
+# Whether the products table the connection resolves has been set up for search
+SEARCH_VECTOR_EXISTS = """
+    SELECT EXISTS (SELECT 1 FROM pg_attribute
+                   WHERE attrelid = to_regclass('products') AND attname = 'search_vector' AND NOT attisdropped)
+"""
+
+SETUP_HINT = ("products has no search_vector column; create it with database/schema.sql "
+              "or run catalog_search.py --setup once")
+
+# Trigram matching needs at least one full trigram to use its index
+MIN_PARTIAL_MATCH_LENGTH = 3
+
+DEFAULT_LIMIT = 20
+
+SEARCH_PRODUCTS = f"""
+    SELECT id, name, category, price, image_url,
+           ts_rank_cd(search_vector, query, 32) + {TRGM_SCHEMA}.similarity(name, %(text)s) AS rank
+    FROM products, websearch_to_tsquery('{SEARCH_CONFIG}', %(text)s) AS query
+    WHERE search_vector @@ query
+       OR (%(pattern)s IS NOT NULL AND name ILIKE %(pattern)s)
+    ORDER BY rank DESC, id
+    LIMIT %(limit)s OFFSET %(offset)s
+"""
+
+SearchResult = namedtuple('SearchResult', ['id', 'name', 'category', 'price', 'image_url', 'rank'])
+
+
+def ensure_search_index(cursor):
+    """One-time setup: add the search_vector column and the full-text, trigram and refresh indexes"""
+    for statement in SEARCH_INDEX_DDL:
+        cursor.execute(statement)
+
+
+def require_search_index(cursor):
+    """Raise RuntimeError unless the products table has been set up for search"""
+    cursor.execute(SEARCH_VECTOR_EXISTS)
+    if not cursor.fetchone()[0]:
+        raise RuntimeError(SETUP_HINT)
+
+
+def refresh_search_vectors(cursor, table='products'):
+    """Compute search_vector for the rows inserted or changed since the last refresh; returns the count
+
+    `table` may be a staging copy of products being loaded.
+    """
+    cursor.execute(SEARCH_VECTOR_UPDATE.format(table=table))
+    return cursor.rowcount
+
+
+def _like_pattern(text):
+    """ILIKE pattern matching `text` anywhere in a name, or None when it is too short to use the index"""
+    text = text.strip()
+    if len(text) < MIN_PARTIAL_MATCH_LENGTH:
+        return None
+    escaped = text.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+    return f"%{escaped}%"
+
+
+def search_products(cursor, text, limit=DEFAULT_LIMIT, offset=0):
+    """Products matching `text`, best first
+
+    `text` takes web search syntax ("quoted phrases", -excluded, or); names that
+    merely contain it, e.g. a half-typed word, match too. Rank is the cover
+    density rank of the weighted vector plus the name's trigram similarity.
+    """
+    if not text.strip():
+        return []
+    cursor.execute(SEARCH_PRODUCTS, {
+        'text': text, 'pattern': _like_pattern(text), 'limit': limit, 'offset': offset,
+    })
+    return [SearchResult(*row) for row in cursor.fetchall()]
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Search the products table like the shop does")
+    parser.add_argument('text', help="search text, e.g. 'red mustang' or '\"dad collection\" -mug'")
+    parser.add_argument('--limit', type=int, default=DEFAULT_LIMIT,
+                        help=f"results to show (default: {DEFAULT_LIMIT})")
+    parser.add_argument('--setup', action='store_true',
+                        help="create pg_trgm, the search_vector column and the search indexes first (one-time)")
+    parser.add_argument('--refresh', action='store_true',
+                        help="refresh stale rows first")
+    args = parser.parse_args()
+    if args.limit < 1:
+        parser.error("--limit must be at least 1")
+    return args
+
+
+def main():
+    args = parse_args()
+    try:
+        with db_access.transaction() as cursor:
+            if args.setup:
+                ensure_search_index(cursor)
+                print("🔧 Search column and indexes are in place")
+            if args.setup or args.refresh:
+                print(f"🔄 Refreshed search vectors of {refresh_search_vectors(cursor)} products")
+            start = time.perf_counter()
+            results = search_products(cursor, args.text, args.limit)
+            elapsed = time.perf_counter() - start
+    finally:
+        db_access.close_pool()
+
+    print(f"🔍 {len(results)} results for {args.text!r} in {elapsed * 1000:.1f} ms")
+    for result in results:
+        print(f"  {result.rank:6.3f}  #{result.id} {result.name} ({result.category}) - ${result.price}")
+
+
+if __name__ == '__main__':
+    main()
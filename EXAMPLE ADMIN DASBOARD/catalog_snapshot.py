@@ -0,0 +1,235 @@
+#!/usr/bin/env python3
+"""
+Sharded, content-hashed catalog snapshots for the storefront
+
+pages/shop.html embeds the whole catalog as one allProducts literal, so every
+visit downloads and parses every product. After an import the products table
+is exported here instead, one category at a time, in pages of --page-size
+products: each shard is a compact JSON array named `<category>-<page>.<hash>.json`
+after its content, with .gz/.br siblings like the precompressed pages, so it
+can be cached as immutable and an unchanged page keeps its name (and its cache
+entries) across imports. manifest.json lists every category with its pages,
+product counts and sizes; the storefront can fetch it and then only the shard
+of the page it shows.
+
+Shards of the previous export stay for one more export, so a client still
+holding the old manifest can finish loading. add_all_products.py also accepts a
+manifest as --source, reading the products back without scraping HTML.
+"""
+
+import argparse
+import hashlib
+import itertools
+import json
+import os
+import re
+
+import db_access
+from page_writer import atomic_write_bytes, write_if_changed
+from precompress import HASH_LENGTH, compressors
+from size_chart_presets import product_size_chart
+
+SNAPSHOT_DIR = 'pages/catalog'
+MANIFEST_NAME = 'manifest.json'
+SNAPSHOT_FORMAT = 1
+
+DEFAULT_PAGE_SIZE = 48
+
+# Product fields a shard carries; size_chart is derived from name and tags when read back
+SNAPSHOT_FIELDS = (
+    'id', 'name', 'description', 'price', 'original_price', 'image_url', 'category',
+    'subcategory', 'tags', 'stock_quantity', 'is_featured', 'is_on_sale', 'sale_percentage'
+)
+
+# Rows grouped by category, in the order shards are cut
+SNAPSHOT_QUERY = f"SELECT {', '.join(SNAPSHOT_FIELDS)} FROM products ORDER BY category, name, id"
+
+UNCATEGORIZED = 'uncategorized'
+
+_NON_SLUG = re.compile(r'[^a-z0-9]+')
+
+
+def is_snapshot(path):
+    """Whether an import source is a snapshot manifest rather than a listing page"""
+    return path.endswith('.json')
+
+
+def category_slug(category):
+    return _NON_SLUG.sub('-', (category or '').lower()).strip('-') or UNCATEGORIZED
+
+
+def _pages(records, page_size):
+    records = iter(records)
+    while True:
+        page = list(itertools.islice(records, page_size))
+        if not page:
+            return
+        yield page
+
+
+def write_shard(output_dir, slug, number, records):
+    """Write one page of products and its compressed siblings unless they exist; returns (entry, written)"""
+    data = json.dumps(records, separators=(',', ':'), ensure_ascii=False, default=float).encode('utf-8')
+    digest = hashlib.sha256(data).hexdigest()[:HASH_LENGTH]
+    name = f"{slug}-{number}.{digest}.json"
+    path = os.path.join(output_dir, name)
+    written = not os.path.exists(path)
+    if written:
+        atomic_write_bytes(path, data)
+    for suffix, compress in compressors().values():
+        if not os.path.exists(path + suffix):
+            atomic_write_bytes(path + suffix, compress(data))
+    return {'file': name, 'count': len(records), 'bytes': len(data)}, written
+
+
+def load_manifest(manifest_path):
+    """The manifest at `manifest_path`, or None if there is none"""
+    try:
+        with open(manifest_path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def manifest_files(manifest):
+    """Every shard and sibling file name a manifest refers to"""
+    suffixes = [''] + list(manifest.get('encodings', {}).values())
+    return {
+        page['file'] + suffix
+        for category in manifest.get('categories', [])
+        for page in category['pages']
+        for suffix in suffixes
+    }
+
+
+def write_manifest(manifest_path, manifest):
+    """Write the manifest and its compressed siblings; the name stays fixed so clients always find it"""
+    data = json.dumps(manifest, separators=(',', ':'), ensure_ascii=False).encode('utf-8')
+    if write_if_changed(manifest_path, data):
+        for suffix, compress in compressors().values():
+            atomic_write_bytes(manifest_path + suffix, compress(data))
+
+
+def write_snapshot(rows, output_dir=SNAPSHOT_DIR, page_size=DEFAULT_PAGE_SIZE):
+    """Export product rows (dicts of SNAPSHOT_FIELDS, sorted by category) as shards plus manifest
+
+    Returns (manifest, number of shards written); shards already on disk are reused.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    manifest_path = os.path.join(output_dir, MANIFEST_NAME)
+    try:
+        previous = load_manifest(manifest_path) or {}
+    except (OSError, ValueError) as e:
+        print(f"⚠️ Replacing unreadable snapshot manifest {manifest_path}: {e}")
+        previous = {}
+
+    categories = []
+    slugs = set()
+    written = 0
+    for category, group in itertools.groupby(rows, key=lambda row: row['category']):
+        slug = base = category_slug(category)
+        for n in itertools.count(2):
+            if slug not in slugs:
+                break
+            slug = f"{base}-{n}"
+        slugs.add(slug)
+        pages = []
+        for number, records in enumerate(_pages(group, page_size), 1):
+            entry, new = write_shard(output_dir, slug, number, records)
+            pages.append(entry)
+            written += new
+        categories.append({
+            'name': category, 'slug': slug,
+            'count': sum(page['count'] for page in pages), 'pages': pages,
+        })
+
+    manifest = {
+        'format': SNAPSHOT_FORMAT,
+        # Every shard `file` also exists as `file + suffix`, compressed with that encoding
+        'encodings': {encoding: suffix for encoding, (suffix, _) in compressors().items()},
+        'page_size': page_size,
+        'product_count': sum(category['count'] for category in categories),
+        'categories': categories,
+    }
+    current = manifest_files(manifest)
+    manifest['retired'] = sorted(manifest_files(previous) - current) if previous else []
+    write_manifest(manifest_path, manifest)
+
+    # Files the previous export had already retired: no current manifest refers to them
+    for name in previous.get('retired', []):
+        if name not in current:
+            try:
+                os.remove(os.path.join(output_dir, name))
+            except FileNotFoundError:
+                pass
+    return manifest, written
+
+
+def database_rows(cursor, batch_size=1000):
+    """The products table as SNAPSHOT_FIELDS dicts in SNAPSHOT_QUERY order"""
+    cursor.execute(SNAPSHOT_QUERY)
+    while True:
+        rows = cursor.fetchmany(batch_size)
+        if not rows:
+            return
+        for row in rows:
+            yield dict(zip(SNAPSHOT_FIELDS, row))
+
+
+def export_snapshot(cursor, output_dir=SNAPSHOT_DIR, page_size=DEFAULT_PAGE_SIZE):
+    """Export the products table and print what changed; returns the manifest"""
+    manifest, written = write_snapshot(database_rows(cursor), output_dir, page_size)
+    shards = sum(len(category['pages']) for category in manifest['categories'])
+    print(f"📦 Catalog snapshot: {manifest['product_count']} products in {shards} shards across "
+          f"{len(manifest['categories'])} categories ({written} new) in {output_dir}")
+    return manifest
+
+
+def snapshot_records(manifest_path):
+    """Yield the product records of every shard a manifest lists, checking each shard's hash"""
+    manifest = load_manifest(manifest_path)
+    if manifest is None:
+        raise FileNotFoundError(f"No snapshot manifest at {manifest_path}")
+    if manifest.get('format') != SNAPSHOT_FORMAT:
+        raise ValueError(f"{manifest_path} is not a format {SNAPSHOT_FORMAT} catalog snapshot")
+    directory = os.path.dirname(manifest_path)
+    for category in manifest['categories']:
+        for page in category['pages']:
+            with open(os.path.join(directory, page['file']), 'rb') as f:
+                data = f.read()
+            if hashlib.sha256(data).hexdigest()[:HASH_LENGTH] != page['file'].rsplit('.', 2)[-2]:
+                raise ValueError(f"Shard {page['file']} does not match its content hash")
+            yield from json.loads(data)
+
+
+def snapshot_products(manifest_path):
+    """Products of a snapshot in the shape normalize_product() returns"""
+    for record in snapshot_records(manifest_path):
+        product = {field: record[field] for field in SNAPSHOT_FIELDS if field != 'id'}
+        product['size_chart'] = product_size_chart(product)
+        yield product
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Export the products table as sharded catalog snapshots")
+    parser.add_argument('--output-dir', default=SNAPSHOT_DIR,
+                        help=f"where shards and {MANIFEST_NAME} go (default: {SNAPSHOT_DIR})")
+    parser.add_argument('--page-size', type=int, default=DEFAULT_PAGE_SIZE,
+                        help=f"products per shard (default: {DEFAULT_PAGE_SIZE})")
+    args = parser.parse_args()
+    if args.page_size < 1:
+        parser.error("--page-size must be at least 1")
+    return args
+
+
+def main():
+    args = parse_args()
+    try:
+        with db_access.transaction() as cursor:
+            export_snapshot(cursor, args.output_dir, args.page_size)
+    finally:
+        db_access.close_pool()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+"""
+Per-category aggregates of the products table, kept current by the importer
+
+Category and collection pages need each category's product count, price range
+and featured/on-sale counts. category_summary holds one precomputed row per
+category so navigation reads a handful of rows instead of running GROUP BY
+over every product. A full reload rebuilds it; a --sync import recomputes only
+the categories its changed and deleted rows moved out of or into, through an
+index on the category, so the GROUP BY covers just those products. That index
+is declared in database/schema.sql (catalog_load.py --setup adds it to an older
+table) rather than created by imports, which would lock products. Products
+edited outside the importer are picked up by the next import that touches
+their category, or by running this file with --rebuild.
+
+Statements that take parameters use $1 placeholders so import_service.py can
+run them through asyncpg as well.
+"""
+
+import argparse
+from collections import namedtuple
+
+import db_access
+
+# Summary key of products without a category
+UNCATEGORIZED_KEY = ''
+
+SUMMARY_COLUMNS = (
+    'category', 'product_count', 'min_price', 'max_price',
+    'featured_count', 'on_sale_count', 'max_sale_percentage', 'updated_at'
+)
+
+CATEGORY_SUMMARY_DDL = (
+    """CREATE TABLE IF NOT EXISTS category_summary (
+        category TEXT PRIMARY KEY,
+        product_count INTEGER NOT NULL,
+        min_price DECIMAL(10,2),
+        max_price DECIMAL(10,2),
+        featured_count INTEGER NOT NULL,
+        on_sale_count INTEGER NOT NULL,
+        max_sale_percentage INTEGER,
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )""",
+)
+
+# One-time setup: lets a refresh aggregate only the products of the categories it recomputes
+CATEGORY_KEY_INDEX_DDL = "CREATE INDEX IF NOT EXISTS idx_products_category_key ON products ((coalesce(category, '')))"
+
+_AGGREGATES = """coalesce(category, ''), count(*), min(price), max(price),
+           count(*) FILTER (WHERE is_featured), count(*) FILTER (WHERE is_on_sale),
+           max(sale_percentage) FILTER (WHERE is_on_sale), CURRENT_TIMESTAMP"""
+
+REBUILD_CATEGORY_SUMMARY = (
+    "DELETE FROM category_summary",
+    f"""INSERT INTO category_summary ({', '.join(SUMMARY_COLUMNS)})
+        SELECT {_AGGREGATES} FROM products GROUP BY 1""",
+)
+
+# Server-side prepared statements, each taking the text[] of summary keys to recompute
+UPSERT_CATEGORY_SUMMARY = (
+    'upsert_category_summary',
+    f"""INSERT INTO category_summary ({', '.join(SUMMARY_COLUMNS)})
+        SELECT {_AGGREGATES} FROM products WHERE coalesce(category, '') = ANY($1::text[]) GROUP BY 1
+        ON CONFLICT (category) DO UPDATE SET
+        {', '.join(f"{column} = EXCLUDED.{column}" for column in SUMMARY_COLUMNS[1:])}"""
+)
+DELETE_EMPTY_CATEGORIES = (
+    'delete_empty_categories',
+    """DELETE FROM category_summary s WHERE s.category = ANY($1::text[])
+        AND NOT EXISTS (SELECT 1 FROM products p WHERE coalesce(p.category, '') = s.category)"""
+)
+
+# Categories the given import keys are stored under, before an upsert moves them
+STORED_CATEGORIES = (
+    'stored_categories',
+    "SELECT DISTINCT coalesce(category, '') FROM products WHERE import_key = ANY($1::text[])"
+)
+
+CategorySummary = namedtuple('CategorySummary', SUMMARY_COLUMNS)
+
+
+def summary_key(category):
+    return category or UNCATEGORIZED_KEY
+
+
+def ensure_category_summary(cursor):
+    """Create the summary table"""
+    for statement in CATEGORY_SUMMARY_DDL:
+        cursor.execute(statement)
+
+
+def rebuild_category_summary(cursor):
+    """Recompute every category from scratch, e.g. after a full reload; returns the number of categories"""
+    for statement in REBUILD_CATEGORY_SUMMARY:
+        cursor.execute(statement)
+    return cursor.rowcount
+
+
+def stored_categories(cursor, keys):
+    """Rows of the summary keys the products under these import keys are stored under"""
+    db_access.prepare(cursor, *STORED_CATEGORIES)
+    db_access.execute_prepared(cursor, STORED_CATEGORIES[0], (keys,))
+    return cursor.fetchall()
+
+
+def refresh_categories(cursor, categories):
+    """Recompute the summary rows of just these categories, dropping those left empty; returns how many"""
+    categories = sorted(categories)
+    if not categories:
+        return 0
+    for statement in (UPSERT_CATEGORY_SUMMARY, DELETE_EMPTY_CATEGORIES):
+        db_access.prepare(cursor, *statement)
+        db_access.execute_prepared(cursor, statement[0], (categories,))
+    return len(categories)
+
+
+def category_summaries(cursor):
+    """Every category's summary, by category name, for category navigation"""
+    cursor.execute(f"SELECT {', '.join(SUMMARY_COLUMNS)} FROM category_summary ORDER BY category")
+    return [CategorySummary(*row) for row in cursor.fetchall()]
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Show the per-category product summary")
+    parser.add_argument('--rebuild', action='store_true',
+                        help="recompute every category from the products table first")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    try:
+        with db_access.transaction() as cursor:
+            if args.rebuild:
+                ensure_category_summary(cursor)
+                print(f"🔄 Rebuilt the summary of {rebuild_category_summary(cursor)} categories")
+            summaries = category_summaries(cursor)
+    finally:
+        db_access.close_pool()
+
+    print(f"📊 {len(summaries)} categories")
+    for summary in summaries:
+        print(f"  {summary.category or '(none)':<30} {summary.product_count:>6} products  "
+              f"${summary.min_price}-${summary.max_price}  "
+              f"{summary.featured_count} featured, {summary.on_sale_count} on sale")
+
+
+if __name__ == '__main__':
+    main()
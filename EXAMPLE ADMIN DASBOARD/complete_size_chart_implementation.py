@@ -4,8 +4,17 @@ Complete size chart implementation for all edit pages
 This script will properly add ALL required components to each edit page
 """
 
+import argparse
 import os
-import re
+
+import instrumentation
+from extract_size_chart_js import BUNDLE_TAG_PREFIX
+from html_injection import InjectionRule, Injector
+from page_patterns import FEATURES_POPULATED, SIZE_CHART_SECTION_START, remove_sections, size_chart_section_end
+from page_writer import write_if_changed
+from precompress import precompress_pages
+from size_chart_presets import presets_js
+from patch_manifest import DEFAULT_MANIFEST, PatchManifest, definition_version
 
 # List of files to update
 EDIT_PAGES = [
@@ -15,22 +24,20 @@ EDIT_PAGES = [
     'pages/product-edit-product-52_dont_be_a_basic_pitch_baseball_shirt_printed_desig.html'
 ]
 
-def add_complete_size_chart_functionality(file_path):
-    """Add complete size chart functionality to an edit page"""
-    print(f"Processing {file_path}...")
-    
-    try:
-        with open(file_path, 'r', encoding='utf-8') as f:
-            content = f.read()
-        
-        # Check if already has size chart
-        if 'Size Chart Configuration' in content:
-            print(f"  ⚠️ Already has size chart section - cleaning up...")
-            # Remove existing size chart sections to start fresh
-            content = re.sub(r'<!-- Size Chart Configuration -->.*?</div>\s*</div>\s*</div>', '', content, flags=re.DOTALL)
-        
-        # 1. Add HTML section before Tags
-        size_chart_html = '''
+# Size chart preset dropdown wiring, added after setupSizeSelection()
+GARMENT_TYPE_SETUP = '''            
+            // Setup size chart preset dropdown
+            const garmentTypeSelect = document.getElementById('garment-type');
+            if (garmentTypeSelect) {
+                garmentTypeSelect.addEventListener('change', function() {
+                    if (this.value !== 'custom') {
+                        applySizeChartPreset(this.value);
+                    }
+                });
+            }'''
+
+# Size chart section, added before Tags
+SIZE_CHART_HTML = '''
                         <!-- Size Chart Configuration -->
                         <div class="space-y-4">
                             <label class="block text-sm font-medium text-text-primary mb-2">Size Chart (inches)</label>
@@ -109,23 +116,9 @@ def add_complete_size_chart_functionality(file_path):
                             </div>
                         </div>
 '''
-        
-        # Insert before Tags section
-        if '<!-- Tags -->' in content:
-            content = content.replace('                        <!-- Tags -->', size_chart_html + '\n                        <!-- Tags -->')
-        else:
-            print(f"  ❌ Could not find Tags section in {file_path}")
-            return False
-        
-        # 2. Add size_chart to formData
-        if 'size_stock: sizeStock,' in content and 'size_chart: getSizeChartData(),' not in content:
-            content = content.replace(
-                'size_stock: sizeStock,',
-                'size_stock: sizeStock,\n                size_chart: getSizeChartData(),'
-            )
-        
-        # 3. Add JavaScript functions before initializeEditPage
-        js_functions = '''
+
+# JavaScript functions, added before initializeEditPage
+SIZE_CHART_JS = '''
         // Size Chart Management Functions
         function getSizeChartData() {
             return {
@@ -153,36 +146,7 @@ def add_complete_size_chart_functionality(file_path):
         }
 
         function applySizeChartPreset(garmentType) {
-            const presets = {
-                'adult-tshirt': {
-                    S: { chest: '18', length: '28' },
-                    M: { chest: '20', length: '29' },
-                    L: { chest: '22', length: '30' },
-                    XL: { chest: '24', length: '31' },
-                    '2XL': { chest: '26', length: '32' }
-                },
-                'adult-hoodie': {
-                    S: { chest: '20', length: '26' },
-                    M: { chest: '22', length: '27' },
-                    L: { chest: '24', length: '28' },
-                    XL: { chest: '26', length: '29' },
-                    '2XL': { chest: '28', length: '30' }
-                },
-                'kids-tshirt': {
-                    S: { chest: '14', length: '19' },
-                    M: { chest: '15', length: '20' },
-                    L: { chest: '16', length: '21' },
-                    XL: { chest: '17', length: '22' },
-                    '2XL': { chest: '18', length: '23' }
-                },
-                'kids-hoodie': {
-                    S: { chest: '15', length: '18' },
-                    M: { chest: '16', length: '19' },
-                    L: { chest: '17', length: '20' },
-                    XL: { chest: '18', length: '21' },
-                    '2XL': { chest: '19', length: '22' }
-                }
-            };
+            const presets = ''' + presets_js('            ') + ''';
 
             const preset = presets[garmentType];
             if (preset) {
@@ -202,16 +166,23 @@ def add_complete_size_chart_functionality(file_path):
                     ? JSON.parse(sizeChartData) 
                     : sizeChartData;
                 
-                Object.keys(sizeChart).forEach(size => {
+                // Precomputed charts are { garmentType, sizes }, older ones just the sizes
+                const sizes = sizeChart.sizes || sizeChart;
+                const garmentTypeSelect = document.getElementById('garment-type');
+                if (sizeChart.garmentType && garmentTypeSelect) {
+                    garmentTypeSelect.value = sizeChart.garmentType;
+                }
+                
+                Object.keys(sizes).forEach(size => {
                     const sizeKey = size === '2XL' ? '2xl' : size.toLowerCase();
                     const chestInput = document.getElementById(`size-${sizeKey}-chest`);
                     const lengthInput = document.getElementById(`size-${sizeKey}-length`);
                     
-                    if (chestInput && sizeChart[size].chest) {
-                        chestInput.value = sizeChart[size].chest;
+                    if (chestInput && sizes[size].chest) {
+                        chestInput.value = sizes[size].chest;
                     }
-                    if (lengthInput && sizeChart[size].length) {
-                        lengthInput.value = sizeChart[size].length;
+                    if (lengthInput && sizes[size].length) {
+                        lengthInput.value = sizes[size].length;
                     }
                 });
             } catch (error) {
@@ -220,60 +191,108 @@ def add_complete_size_chart_functionality(file_path):
         }
 
 '''
+
+SIZE_CHART_RULES = [
+    # 1. Add HTML section before Tags
+    InjectionRule('html', '                        <!-- Tags -->', SIZE_CHART_HTML + '\n', every=True),
+    # 2. Add size_chart to formData
+    InjectionRule('form', 'size_stock: sizeStock,', '\n                size_chart: getSizeChartData(),',
+                  position='after', marker='size_chart: getSizeChartData(),', every=True),
+    # 3. Add JavaScript functions before initializeEditPage, unless they were moved to the shared bundle
+    InjectionRule('js', '        // Initialize after authentication\n        function initializeEditPage()',
+                  SIZE_CHART_JS, marker=('function getSizeChartData()', BUNDLE_TAG_PREFIX)),
+    # 4. Add size chart population to populateForm
+    InjectionRule('populate', FEATURES_POPULATED,
+                  '\n\n            // Size Chart\n            populateSizeChartFromData(productData.size_chart);',
+                  position='after', marker='populateSizeChartFromData(productData.size_chart);', every=True),
+    # 5. Add event listener to initializeEditPage
+    InjectionRule('listener', 'setupSizeSelection();', GARMENT_TYPE_SETUP,
+                  position='after', marker='garmentTypeSelect.addEventListener', every=True),
+]
+
+_injector = Injector(SIZE_CHART_RULES)
+
+# Changes whenever the rules or payloads change, so every page gets re-patched
+PATCH_VERSION = definition_version(SIZE_CHART_RULES)
+
+def add_complete_size_chart_functionality(file_path):
+    """Add complete size chart functionality to an edit page"""
+    metrics = instrumentation.current()
+    print(f"Processing {file_path}...")
+    
+    try:
+        with open(file_path, 'r', encoding='utf-8') as f:
+            content = f.read()
+            metrics.count('bytes_read', os.fstat(f.fileno()).st_size)
+        metrics.count('files')
         
-        if 'function initializeEditPage()' in content and 'function getSizeChartData()' not in content:
-            content = content.replace(
-                '        // Initialize after authentication\n        function initializeEditPage()',
-                js_functions + '        // Initialize after authentication\n        function initializeEditPage()'
-            )
-        
-        # 4. Add size chart population to populateForm
-        if 'document.getElementById(\'feature-soft-touch\').checked = features.soft_touch !== false;' in content:
-            if 'populateSizeChartFromData(productData.size_chart);' not in content:
-                content = content.replace(
-                    'document.getElementById(\'feature-soft-touch\').checked = features.soft_touch !== false;',
-                    'document.getElementById(\'feature-soft-touch\').checked = features.soft_touch !== false;\n\n            // Size Chart\n            populateSizeChartFromData(productData.size_chart);'
-                )
-        
-        # 5. Add event listener to initializeEditPage
-        if 'setupSizeSelection();' in content and 'garmentTypeSelect.addEventListener' not in content:
-            setup_code = '''            
-            // Setup size chart preset dropdown
-            const garmentTypeSelect = document.getElementById('garment-type');
-            if (garmentTypeSelect) {
-                garmentTypeSelect.addEventListener('change', function() {
-                    if (this.value !== 'custom') {
-                        applySizeChartPreset(this.value);
-                    }
-                });
-            }'''
-            
-            content = content.replace(
-                'setupSizeSelection();',
-                'setupSizeSelection();' + setup_code
-            )
+        # Check if already has size chart
+        if 'Size Chart Configuration' in content:
+            print(f"  ⚠️ Already has size chart section - cleaning up...")
+            # Remove existing size chart sections to start fresh
+            with metrics.timer('regex'):
+                content = remove_sections(content, SIZE_CHART_SECTION_START, size_chart_section_end)
         
-        # Save the file
-        with open(file_path, 'w', encoding='utf-8') as f:
-            f.write(content)
+        # Apply every edit in one pass
+        with metrics.timer('regex'):
+            result = _injector.apply(content)
+        if 'html' in result.missing:
+            print(f"  ❌ Could not find Tags section in {file_path}")
+            return False
+        content = result.text
         
-        print(f"  ✅ Successfully updated {file_path}")
+        # Save the file, leaving it untouched if the rebuild produced the same page
+        if write_if_changed(file_path, content):
+            metrics.count('bytes_written', os.path.getsize(file_path))
+            print(f"  ✅ Successfully updated {file_path}")
+        else:
+            print(f"  ✅ Already up to date: {file_path}")
         return True
         
     except Exception as e:
         print(f"  ❌ Error processing {file_path}: {e}")
         return False
 
+def parse_args():
+    parser = argparse.ArgumentParser(description="Rebuild the size chart section and scripts of the listed edit pages")
+    parser.add_argument('--manifest', default=DEFAULT_MANIFEST,
+                        help=f"patch manifest used to skip unchanged pages (default: {DEFAULT_MANIFEST})")
+    parser.add_argument('--force', action='store_true',
+                        help="re-patch every page, even those the manifest lists as up to date")
+    instrumentation.add_arguments(parser)
+    return parser.parse_args()
+
 def main():
     """Process all edit pages"""
+    args = parse_args()
+    metrics = instrumentation.begin('complete_size_chart_implementation', args.progress_interval)
     print("🚀 Completing size chart implementation for all edit pages...")
     
-    success_count = 0
-    for page in EDIT_PAGES:
-        if add_complete_size_chart_functionality(page):
-            success_count += 1
+    manifest = PatchManifest('complete_size_chart', PATCH_VERSION, args.manifest)
+    updated_pages = []
+    skipped_count = 0
+    try:
+        with metrics.stage('patch'):
+            for page in EDIT_PAGES:
+                if not args.force and manifest.is_current(page):
+                    skipped_count += 1
+                    continue
+                if add_complete_size_chart_functionality(page):
+                    manifest.record(page)
+                    updated_pages.append(page)
+                else:
+                    manifest.forget(page)
+    finally:
+        manifest.save()
+    success_count = len(updated_pages)
+    
+    # Refresh the .gz/.br siblings; pages whose content is unchanged keep theirs
+    with metrics.stage('precompress'):
+        precompress_pages(updated_pages)
     
-    print(f"\n✅ Successfully updated {success_count} out of {len(EDIT_PAGES)} edit pages")
+    print(f"\n✅ Successfully updated {success_count} out of {len(EDIT_PAGES)} edit pages "
+          f"({skipped_count} unchanged since last run)")
+    instrumentation.finish(args.metrics_file)
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+"""
+Shared database access for the Python admin scripts
+
+Keeps a process-wide psycopg2 connection pool so repeated imports run from a
+scheduler or a long-lived service reuse warm connections instead of paying for
+a new TLS handshake and backend on every run. Also provides a transaction
+context manager and helpers for server-side prepared statements.
+"""
+
+import os
+import threading
+from contextlib import contextmanager
+
+import psycopg2
+import psycopg2.extensions
+import psycopg2.extras
+import psycopg2.pool
+from dotenv import load_dotenv
+
+# Load environment variables
+load_dotenv()
+
+DEFAULT_MIN_CONNECTIONS = 1
+DEFAULT_MAX_CONNECTIONS = int(os.getenv('DB_POOL_MAX', '4'))
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+class PreparingConnection(psycopg2.extensions.connection):
+    """Connection that remembers which statements it has PREPAREd on the server"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # None means unknown (e.g. after a rollback) and is resynced from the server
+        self.prepared = set()
+
+
+def get_pool(dsn=None, minconn=DEFAULT_MIN_CONNECTIONS, maxconn=DEFAULT_MAX_CONNECTIONS):
+    """Return the shared connection pool, creating it on first use"""
+    global _pool
+    with _pool_lock:
+        if _pool is None or _pool.closed:
+            _pool = psycopg2.pool.ThreadedConnectionPool(
+                minconn, maxconn,
+                dsn or os.getenv('DATABASE_URL'),
+                connection_factory=PreparingConnection
+            )
+        return _pool
+
+
+def close_pool():
+    """Close every pooled connection; the next get_pool() call opens a new pool"""
+    global _pool
+    with _pool_lock:
+        if _pool is not None and not _pool.closed:
+            _pool.closeall()
+        _pool = None
+
+
+@contextmanager
+def connection():
+    """Borrow a connection from the pool, returning it (or discarding it if broken) afterwards"""
+    pool = get_pool()
+    conn = pool.getconn()
+    try:
+        yield conn
+    finally:
+        pool.putconn(conn, close=bool(conn.closed))
+
+
+@contextmanager
+def transaction():
+    """Yield a cursor inside a transaction that commits on success and rolls back on error"""
+    with connection() as conn:
+        cursor = conn.cursor()
+        try:
+            yield cursor
+            conn.commit()
+        except BaseException:
+            if not conn.closed:
+                conn.rollback()
+                conn.prepared = None
+            raise
+        finally:
+            cursor.close()
+
+
+def _prepared_names(cursor):
+    conn = cursor.connection
+    if conn.prepared is None:
+        cursor.execute("SELECT name FROM pg_prepared_statements")
+        conn.prepared = {row[0] for row in cursor.fetchall()}
+    return conn.prepared
+
+
+def prepare(cursor, name, statement):
+    """PREPARE `statement` (using $1, $2, ... placeholders) once per server session"""
+    prepared = _prepared_names(cursor)
+    if name not in prepared:
+        cursor.execute(f"PREPARE {name} AS {statement}")
+        prepared.add(name)
+
+
+def _execute_sql(name, param_count):
+    return f"EXECUTE {name} ({', '.join(['%s'] * param_count)})"
+
+
+def execute_prepared(cursor, name, params):
+    """Run a prepared statement with one set of parameters"""
+    cursor.execute(_execute_sql(name, len(params)), params)
+
+
+def execute_prepared_batch(cursor, name, rows, page_size=100):
+    """Run a prepared statement for many parameter sets, page_size EXECUTEs per round-trip"""
+    rows = list(rows)
+    if rows:
+        psycopg2.extras.execute_batch(cursor, _execute_sql(name, len(rows[0])), rows, page_size=page_size)
@@ -0,0 +1,232 @@
+#!/usr/bin/env python3
+"""
+Move the inlined size chart functions of the edit pages into a shared script
+
+The size chart patchers inline getSizeChartData, applySizeChartPreset (with its
+preset tables) and populateSizeChartFromData into every edit page. This stage
+cuts that block out of each page, writes it once as js/size-chart.<hash>.js
+(named after its content, so browsers can cache it across products and
+indefinitely) and loads it with a <script src> tag placed before the page's
+inline script. Pages patched by different patcher versions end up referencing
+one bundle per distinct version of the code.
+"""
+
+import argparse
+import hashlib
+import os
+import re
+import textwrap
+from collections import Counter
+
+from page_patterns import MAX_TAG_LENGTH
+from page_writer import write_if_changed
+from patch_manifest import DEFAULT_MANIFEST, PatchManifest, definition_version
+from precompress import precompress_pages
+
+PAGES_DIR = 'pages'
+JS_DIR = 'js'
+
+# How the pages (in pages/) reference files in js/
+SCRIPT_URL_PREFIX = '../js/'
+
+# Start of the tag loading a bundle; the patchers treat a page carrying it as
+# already having the size chart functions, so they do not inline them again
+BUNDLE_TAG_PREFIX = f'<script src="{SCRIPT_URL_PREFIX}size-chart.'
+
+SIZE_CHART_FUNCTIONS = ('getSizeChartData', 'applySizeChartPreset', 'populateSizeChartFromData')
+
+# Comment line opening the inlined block, as written by the different patchers
+BLOCK_START = re.compile(r'\n[ \t]*// Size Chart (?:Management )?Functions[ \t]*\n')
+LAST_FUNCTION = re.compile(r'function populateSizeChartFromData\s*\([^()]{0,200}\)\s*\{')
+BUNDLE_TAG = re.compile(re.escape(BUNDLE_TAG_PREFIX) + r'[0-9a-f]+\.js"></script>')
+SCRIPT_OPEN = re.compile(r'<script\b[^<>]{0,%d}>' % MAX_TAG_LENGTH)
+
+# Bump when the way blocks are found or rewritten changes
+EXTRACTION_VERSION = definition_version(BLOCK_START.pattern, LAST_FUNCTION.pattern, SCRIPT_URL_PREFIX, 1)
+
+
+def _skip_quoted(text, index):
+    """Index just past the string/template literal opening at `index`"""
+    quote = text[index]
+    index += 1
+    while index < len(text):
+        char = text[index]
+        if char == '\\':
+            index += 2
+            continue
+        if char == quote:
+            return index + 1
+        index += 1
+    return index
+
+
+def matching_brace(text, index):
+    """Index just past the '}' closing the '{' at `index`, skipping strings and comments; -1 if unbalanced"""
+    depth = 0
+    while index < len(text):
+        char = text[index]
+        if char in '\'"`':
+            index = _skip_quoted(text, index)
+            continue
+        if text.startswith('//', index):
+            index = text.find('\n', index)
+            if index == -1:
+                return -1
+            continue
+        if text.startswith('/*', index):
+            index = text.find('*/', index)
+            if index == -1:
+                return -1
+            index += 2
+            continue
+        if char == '{':
+            depth += 1
+        elif char == '}':
+            depth -= 1
+            if depth == 0:
+                return index + 1
+        index += 1
+    return -1
+
+
+def find_size_chart_block(content):
+    """(start, end) of the inlined size chart functions, or None if the page has none"""
+    start = BLOCK_START.search(content)
+    if not start:
+        return None
+    last = LAST_FUNCTION.search(content, start.end())
+    if not last:
+        return None
+    end = matching_brace(content, last.end() - 1)
+    if end == -1:
+        return None
+    block = content[start.start():end]
+    if not all(f"function {name}" in block for name in SIZE_CHART_FUNCTIONS):
+        return None
+    return start.start(), end
+
+
+def bundle_source(block):
+    """Bundle content for a block: the same code at any indentation gives the same bundle"""
+    return textwrap.dedent(block.strip('\n')).strip() + '\n'
+
+
+def bundle_name(source):
+    return f"size-chart.{hashlib.sha256(source.encode('utf-8')).hexdigest()[:12]}.js"
+
+
+def last_script_open(content, end):
+    """Last <script> opening tag that starts before `end`, found backwards from there"""
+    position = end
+    while True:
+        position = content.rfind('<script', 0, position)
+        if position == -1:
+            return None
+        script_open = SCRIPT_OPEN.match(content, position, end)
+        if script_open:
+            return script_open
+
+
+def extract_from_page(content):
+    """Return (new content, bundle name, bundle source), or None if there is nothing to extract"""
+    span = find_size_chart_block(content)
+    if not span:
+        return None
+    start, end = span
+    source = bundle_source(content[start:end])
+    name = bundle_name(source)
+    tag = f'<script src="{SCRIPT_URL_PREFIX}{name}"></script>'
+
+    # Functions are global declarations, so the bundle just has to run before the inline script
+    script_open = last_script_open(content, start)
+    if script_open is None:
+        return None
+
+    existing_tag = BUNDLE_TAG.search(content)
+    head = content[:script_open.start()]
+    if existing_tag and existing_tag.end() <= script_open.start():
+        # Re-extracting a page that was patched again: point the old tag at the new bundle
+        head = head[:existing_tag.start()] + tag + head[existing_tag.end():]
+    else:
+        indent = head[len(head.rstrip(' \t')):]
+        head = head + tag + '\n' + indent
+    new_content = head + content[script_open.start():start] + content[end:]
+    return new_content, name, source
+
+
+def edit_pages(pages_dir=PAGES_DIR):
+    return sorted(
+        os.path.join(pages_dir, filename) for filename in os.listdir(pages_dir)
+        if filename.startswith('product-edit-product-') and filename.endswith('.html')
+    )
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Move the inlined size chart functions into a shared js/size-chart.<hash>.js")
+    parser.add_argument('--pages-dir', default=PAGES_DIR,
+                        help=f"directory holding the edit pages (default: {PAGES_DIR})")
+    parser.add_argument('--js-dir', default=JS_DIR,
+                        help=f"directory the bundle is written to (default: {JS_DIR})")
+    parser.add_argument('--manifest', default=DEFAULT_MANIFEST,
+                        help=f"patch manifest used to skip unchanged pages (default: {DEFAULT_MANIFEST})")
+    parser.add_argument('--force', action='store_true',
+                        help="check every page, even those the manifest lists as up to date")
+    parser.add_argument('--jobs', type=int, default=1,
+                        help="worker processes precompressing the rewritten pages (default: 1)")
+    parser.add_argument('--no-compress', action='store_true',
+                        help="don't write .gz/.br siblings of the rewritten pages and the bundle")
+    args = parser.parse_args()
+    if args.jobs < 1:
+        parser.error("--jobs must be at least 1")
+    return args
+
+
+def main():
+    """Extract the size chart functions of every edit page into the shared bundle"""
+    args = parse_args()
+    print("🚀 Extracting size chart functions into a shared script...")
+
+    pages = edit_pages(args.pages_dir)
+    manifest = PatchManifest('size_chart_bundle', EXTRACTION_VERSION, args.manifest)
+    results = Counter()
+    bundles = {}
+    rewritten = []
+    try:
+        for page in pages:
+            if not args.force and manifest.is_current(page):
+                results['skipped'] += 1
+                continue
+            with open(page, 'r', encoding='utf-8') as f:
+                content = f.read()
+            extracted = extract_from_page(content)
+            if not extracted:
+                results['unchanged'] += 1
+                manifest.record(page)
+                continue
+            new_content, name, source = extracted
+            if name not in bundles:
+                bundles[name] = source
+                bundle_path = os.path.join(args.js_dir, name)
+                os.makedirs(args.js_dir, exist_ok=True)
+                if write_if_changed(bundle_path, source):
+                    print(f"  ✅ Wrote {bundle_path} ({len(source)} bytes)")
+            write_if_changed(page, new_content)
+            print(f"  ✅ {page}: moved {len(content) - len(new_content)} bytes into {name}")
+            manifest.record(page)
+            rewritten.append(page)
+            results['extracted'] += 1
+    finally:
+        manifest.save()
+
+    if not args.no_compress:
+        precompress_pages(rewritten, args.jobs, os.path.join(args.pages_dir, '.precompressed.json'))
+        precompress_pages([os.path.join(args.js_dir, name) for name in bundles], 1,
+                          os.path.join(args.js_dir, '.precompressed.json'))
+
+    print(f"\n✅ Extracted size chart functions from {results['extracted']} pages "
+          f"into {len(bundles)} bundle(s)")
+    print(f"   No inline size chart code: {results['unchanged']}, unchanged since last run: {results['skipped']}")
+
+
+if __name__ == '__main__':
+    main()
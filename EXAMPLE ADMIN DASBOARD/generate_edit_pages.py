@@ -0,0 +1,290 @@
+#!/usr/bin/env python3
+"""
+Generate the product edit pages from product-edit-template.html
+
+Streams the products table through a server-side cursor and renders one
+pages/product-edit-product-<id>_<slug>.html per product from the shared
+template, so a new edit page feature is added to the template once instead of
+being patched into every page. A manifest records the template version and a
+fingerprint of each product's row: reruns only render and write the pages of
+products that changed (or all of them when the template itself changed), and
+remove pages left behind by renamed products.
+"""
+
+import argparse
+import datetime
+import decimal
+import hashlib
+import html
+import json
+import os
+import re
+from collections import Counter, namedtuple
+
+import psycopg2.extras
+
+import db_access
+from page_writer import write_if_changed
+from patch_manifest import PatchManifest, definition_version
+from precompress import precompress_pages, remove_precompressed
+
+# Both live next to this script, as create_edit_page_for_product.js expects, wherever it is run from
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+TEMPLATE_PAGE = os.path.join(SCRIPT_DIR, 'product-edit-template.html')
+PAGES_DIR = os.path.join(SCRIPT_DIR, 'pages')
+
+# Rows fetched per round-trip from the server-side cursor
+DEFAULT_ITERSIZE = 500
+
+EDIT_PAGE_PREFIX = 'product-edit-product-'
+EDIT_PAGE_NAME = re.compile(re.escape(EDIT_PAGE_PREFIX) + r'(\d+)_.*\.html$')
+
+PLACEHOLDER = re.compile(r'\{\{\s*(\w+)\s*\}\}')
+PLACEHOLDERS = ('product_id', 'product_name', 'product_json')
+
+# Product fields the template's form reads; import bookkeeping such as import_key,
+# content_hash and search_vector stays out of the pages and their fingerprints
+EDIT_PAGE_COLUMNS = (
+    'id', 'name', 'description', 'price', 'original_price', 'category', 'stock_quantity',
+    'low_stock_threshold', 'sale_percentage', 'tags', 'colors', 'sizes', 'specifications', 'features'
+)
+
+PRODUCT_COLUMNS_QUERY = """
+    SELECT attname FROM pg_attribute
+    WHERE attrelid = 'products'::regclass AND attnum > 0 AND NOT attisdropped
+"""
+
+PageTemplate = namedtuple('PageTemplate', ['parts', 'version'])
+
+
+def compile_template(path=TEMPLATE_PAGE):
+    """Split a template into literal text and {{ placeholder }} names, once
+
+    parts alternates literal text (even indexes) and placeholder names (odd
+    indexes), so rendering a page is a single join.
+    """
+    with open(path, 'r', encoding='utf-8') as f:
+        text = f.read()
+    parts = PLACEHOLDER.split(text)
+    unknown = sorted(set(parts[1::2]) - set(PLACEHOLDERS))
+    if unknown:
+        raise ValueError(f"Unknown placeholders in {path}: {', '.join(unknown)}")
+    return PageTemplate(parts, definition_version(text))
+
+
+def render(template, context):
+    """Fill a compiled template with already-escaped placeholder values"""
+    parts = list(template.parts)
+    parts[1::2] = [context[name] for name in template.parts[1::2]]
+    return ''.join(parts)
+
+
+def edit_page_name(product_id, product_name):
+    """File name of a product's edit page, as create_edit_page_for_product.js builds it"""
+    clean_name = re.sub(r'[^a-z0-9\s]', '', product_name.lower())
+    clean_name = re.sub(r'\s+', '_', clean_name)[:50]
+    return f"{EDIT_PAGE_PREFIX}{product_id}_{clean_name}.html"
+
+
+def _json_default(value):
+    if isinstance(value, decimal.Decimal):
+        return float(value)
+    if isinstance(value, (datetime.date, datetime.datetime, datetime.time)):
+        return value.isoformat()
+    return str(value)
+
+
+def product_json(row):
+    """The product's row as JSON, without NULL columns so the template defaults apply"""
+    data = {key: value for key, value in row.items() if value is not None}
+    return json.dumps(data, sort_keys=True, default=_json_default)
+
+
+def product_fingerprint(row_json):
+    """Short hash of a product's row, recorded in the manifest"""
+    return hashlib.sha256(row_json.encode('utf-8')).hexdigest()[:16]
+
+
+def page_context(row, row_json):
+    """Placeholder values for one product, escaped for where they appear in the page"""
+    return {
+        'product_id': str(int(row['id'])),
+        'product_name': html.escape(row['name'] or ''),
+        # Inside a <script> block: keep "</script>" and "<!--" from closing it early
+        'product_json': row_json.replace('<', '\\u003c'),
+    }
+
+
+def edit_page_columns(conn):
+    """The EDIT_PAGE_COLUMNS the products table has; the template defaults cover the rest"""
+    with conn.cursor() as cursor:
+        cursor.execute(PRODUCT_COLUMNS_QUERY)
+        present = {row[0] for row in cursor.fetchall()}
+    return [column for column in EDIT_PAGE_COLUMNS if column in present]
+
+
+def stream_products(ids=None, itersize=DEFAULT_ITERSIZE):
+    """Yield the edit page fields of product rows as dicts through a server-side cursor, ordered by id"""
+    with db_access.connection() as conn:
+        try:
+            select = f"SELECT {', '.join(edit_page_columns(conn))} FROM products"
+            with conn.cursor(name='edit_page_products', cursor_factory=psycopg2.extras.RealDictCursor) as cursor:
+                cursor.itersize = itersize
+                if ids:
+                    cursor.execute(f"{select} WHERE id = ANY(%s) ORDER BY id", (list(ids),))
+                else:
+                    cursor.execute(f"{select} ORDER BY id")
+                yield from cursor
+        finally:
+            # Read-only: end the transaction holding the cursor
+            conn.rollback()
+
+
+def existing_edit_pages(pages_dir=PAGES_DIR):
+    """Edit page file names on disk, grouped by product id"""
+    pages = {}
+    for filename in os.listdir(pages_dir):
+        found = EDIT_PAGE_NAME.match(filename)
+        if found:
+            pages.setdefault(int(found.group(1)), []).append(filename)
+    return pages
+
+
+def remove_page(path, manifest, removed):
+    os.remove(path)
+    manifest.forget(path)
+    removed.append(path)
+
+
+def generate_edit_pages(rows, template, manifest, pages_dir=PAGES_DIR, force=False):
+    """Render the edit page of every row that changed since the last run
+
+    Returns (Counter of outcomes, ids of the products seen, pages written, pages removed).
+    """
+    existing = existing_edit_pages(pages_dir)
+    results = Counter()
+    seen = set()
+    written = []
+    removed = []
+    for row in rows:
+        product_id = int(row['id'])
+        seen.add(product_id)
+        filename = edit_page_name(product_id, row['name'] or '')
+        page = os.path.join(pages_dir, filename)
+
+        # A renamed product leaves its page under the old slug behind
+        for old_filename in existing.get(product_id, []):
+            if old_filename != filename:
+                remove_page(os.path.join(pages_dir, old_filename), manifest, removed)
+                print(f"🗑️ Deleted old edit page: {old_filename}")
+                results['renamed'] += 1
+
+        row_json = product_json(row)
+        fingerprint = product_fingerprint(row_json)
+        if not force and manifest.is_current(page, fingerprint):
+            results['unchanged'] += 1
+            continue
+
+        if write_if_changed(page, render(template, page_context(row, row_json))):
+            print(f"✅ Generated edit page: {page}")
+            results['written'] += 1
+            written.append(page)
+        else:
+            results['identical'] += 1
+        manifest.record(page, fingerprint)
+    return results, seen, written, removed
+
+
+def prune_edit_pages(seen, manifest, pages_dir=PAGES_DIR):
+    """Delete the edit pages of products that are no longer in the table; returns their paths"""
+    removed = []
+    for product_id, filenames in existing_edit_pages(pages_dir).items():
+        if product_id in seen:
+            continue
+        for filename in filenames:
+            remove_page(os.path.join(pages_dir, filename), manifest, removed)
+            print(f"🗑️ Deleted edit page of removed product: {filename}")
+    return removed
+
+
+def parse_ids(value):
+    try:
+        return [int(part) for part in value.split(',') if part.strip()]
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"expected comma-separated product ids, got {value!r}")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Generate the product edit pages from the shared template")
+    parser.add_argument('--template', default=TEMPLATE_PAGE,
+                        help=f"edit page template (default: {TEMPLATE_PAGE})")
+    parser.add_argument('--pages-dir', default=PAGES_DIR,
+                        help=f"directory the edit pages are written to (default: {PAGES_DIR})")
+    parser.add_argument('--manifest',
+                        help="generation manifest (default: .patch_manifest.json in the pages directory)")
+    parser.add_argument('--ids', type=parse_ids,
+                        help="only regenerate these comma-separated product ids")
+    parser.add_argument('--force', action='store_true',
+                        help="render every page, even those the manifest lists as up to date")
+    parser.add_argument('--prune', action='store_true',
+                        help="delete edit pages of products no longer in the products table")
+    parser.add_argument('--itersize', type=int, default=DEFAULT_ITERSIZE,
+                        help=f"rows fetched per database round-trip (default: {DEFAULT_ITERSIZE})")
+    parser.add_argument('--jobs', type=int, default=1,
+                        help="worker processes precompressing the written pages (default: 1)")
+    parser.add_argument('--no-compress', action='store_true',
+                        help="don't write .gz/.br siblings of the written pages")
+    args = parser.parse_args()
+    if args.prune and args.ids:
+        parser.error("--prune needs the whole products table and cannot be combined with --ids")
+    if args.itersize < 1:
+        parser.error("--itersize must be at least 1")
+    if args.jobs < 1:
+        parser.error("--jobs must be at least 1")
+    return args
+
+
+def main():
+    """Generate edit pages for every product that changed"""
+    args = parse_args()
+    print("🚀 Generating product edit pages...")
+
+    try:
+        template = compile_template(args.template)
+    except (OSError, ValueError) as e:
+        print(f"❌ Could not load template {args.template}: {e}")
+        return
+
+    os.makedirs(args.pages_dir, exist_ok=True)
+    manifest_path = args.manifest or os.path.join(args.pages_dir, '.patch_manifest.json')
+    manifest = PatchManifest('edit_pages', template.version, manifest_path)
+    try:
+        results, seen, written, removed = generate_edit_pages(
+            stream_products(args.ids, args.itersize), template, manifest, args.pages_dir, args.force
+        )
+        if args.prune:
+            pruned = prune_edit_pages(seen, manifest, args.pages_dir)
+            results['pruned'] = len(pruned)
+            removed += pruned
+    except psycopg2.Error as e:
+        print(f"❌ Database error while generating edit pages: {e}")
+        return
+    finally:
+        manifest.save()
+        db_access.close_pool()
+    
+    if not args.no_compress:
+        index_path = os.path.join(args.pages_dir, '.precompressed.json')
+        if removed:
+            remove_precompressed(removed, index_path)
+        if written:
+            print(f"\nPrecompressing {len(written)} written pages...")
+            precompress_pages(written, args.jobs, index_path)
+
+    print(f"\n✅ Generated edit pages for {len(seen)} products")
+    print(f"   Written: {results['written']}, unchanged: {results['unchanged'] + results['identical']}, "
+          f"renamed: {results['renamed']}, pruned: {results['pruned']}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+"""
+Single-pass HTML/JS injection engine for the page patchers
+
+A patcher describes its edits as a list of InjectionRule (anchor, payload,
+position, idempotency marker). Injector compiles every anchor and marker of the
+list into one alternation, finds all of them in a single scan of the page and builds
+the patched page with one join, instead of a str.replace/re.sub per edit that
+rescans and copies the whole file each time.
+"""
+
+import re
+from collections import namedtuple
+
+InjectionRule = namedtuple(
+    'InjectionRule',
+    ['name', 'anchor', 'payload', 'position', 'marker', 'group', 'every'],
+    defaults=('before', None, None, False)
+)
+InjectionRule.__doc__ = """One edit to apply to a page
+
+name      label reported back in InjectionResult
+anchor    literal string or compiled regex locating the edit
+payload   text to insert (inserted literally, no backreferences)
+position  'before' or 'after' the anchor, 'replace' it, or 'before-space' to
+          insert ahead of the whitespace run preceding the anchor
+marker    skip the rule if this literal string, or any of a tuple of them, is
+          already in the page
+group     rules sharing a group are alternatives: only the first one (in list
+          order) whose anchor is found is applied
+every     apply at every occurrence of the anchor instead of the first one
+"""
+
+InjectionResult = namedtuple('InjectionResult', ['text', 'applied', 'skipped', 'missing'])
+InjectionResult.__doc__ = """Outcome of Injector.apply
+
+text      the patched page
+applied   names of the rules that were applied
+skipped   names of the rules whose marker was already present
+missing   names of rules (or groups) whose anchor was not found
+"""
+
+POSITIONS = ('before', 'before-space', 'after', 'replace')
+
+
+def _markers(rule):
+    """The literal markers of a rule, whose `marker` is None, a string or a tuple of strings"""
+    if rule.marker is None:
+        return ()
+    if isinstance(rule.marker, str):
+        return (rule.marker,)
+    return tuple(rule.marker)
+
+
+def _source(pattern):
+    if isinstance(pattern, re.Pattern):
+        return pattern.pattern
+    return re.escape(pattern)
+
+
+class Injector:
+    """A compiled rule list, reusable across every page it patches
+
+    The scan uses a plain (?:a)|(?:b)|... alternation so the regex engine can skip
+    ahead on the anchors' first characters; each hit is then attributed to every
+    anchor or marker matching at that offset. Scanning resumes one character
+    after each hit, so overlapping anchors (one rule's anchor inside another's,
+    or several rules sharing an anchor) are all found.
+    """
+
+    def __init__(self, rules):
+        self.rules = list(rules)
+        self.markers = []
+        for rule in self.rules:
+            if rule.position not in POSITIONS:
+                raise ValueError(f"Rule {rule.name!r} has unknown position {rule.position!r}")
+            for marker in _markers(rule):
+                if marker not in self.markers:
+                    self.markers.append(marker)
+        # One alternative per rule anchor, then one per marker, in this order
+        sources = [_source(rule.anchor) for rule in self.rules]
+        sources += [re.escape(marker) for marker in self.markers]
+        self.alternatives = [re.compile(source) for source in sources]
+        self.pattern = re.compile('|'.join(f"(?:{source})" for source in sources))
+
+    def scan(self, text):
+        """One pass over `text`: anchor spans per rule index and the set of markers present"""
+        rule_count = len(self.rules)
+        spans = {}
+        markers = set()
+        search = self.pattern.search
+        found = search(text)
+        while found:
+            start = found.start()
+            for index, alternative in enumerate(self.alternatives):
+                hit = alternative.match(text, start)
+                if not hit:
+                    continue
+                if index >= rule_count:
+                    markers.add(self.markers[index - rule_count])
+                    continue
+                rule_spans = spans.setdefault(index, [])
+                # Keep only non-overlapping matches of one anchor, like finditer
+                if not rule_spans or start >= rule_spans[-1][1]:
+                    rule_spans.append((start, hit.end()))
+            found = search(text, start + 1)
+        return spans, markers
+
+    def apply(self, text):
+        """Patch `text` with every applicable rule"""
+        spans, markers = self.scan(text)
+        applied, skipped, missing = [], [], []
+        settled_groups = set()
+        unresolved_groups = []
+        edits = []
+        for index, rule in enumerate(self.rules):
+            if rule.group is not None and rule.group in settled_groups:
+                continue
+            if any(marker in markers for marker in _markers(rule)):
+                skipped.append(rule.name)
+                if rule.group is not None:
+                    settled_groups.add(rule.group)
+                continue
+            if index not in spans:
+                if rule.group is None:
+                    missing.append(rule.name)
+                elif rule.group not in unresolved_groups:
+                    unresolved_groups.append(rule.group)
+                continue
+            if rule.group is not None:
+                settled_groups.add(rule.group)
+            applied.append(rule.name)
+            for start, end in (spans[index] if rule.every else spans[index][:1]):
+                if rule.position == 'before':
+                    edits.append((start, start, index, rule.payload))
+                elif rule.position == 'before-space':
+                    while start and text[start - 1].isspace():
+                        start -= 1
+                    edits.append((start, start, index, rule.payload))
+                elif rule.position == 'after':
+                    edits.append((end, end, index, rule.payload))
+                else:
+                    edits.append((start, end, index, rule.payload))
+        missing.extend(group for group in unresolved_groups if group not in settled_groups)
+
+        pieces = []
+        position = 0
+        for start, end, _, payload in sorted(edits, key=lambda edit: (edit[0], edit[2])):
+            if start < position:
+                # Overlaps text an earlier 'replace' edit already consumed
+                continue
+            pieces.append(text[position:start])
+            pieces.append(payload)
+            position = end
+        pieces.append(text[position:])
+        return InjectionResult(''.join(pieces), applied, skipped, missing)
+
+
+def inject(text, rules):
+    """Apply `rules` to `text` once; build an Injector to reuse the rules across pages"""
+    return Injector(rules).apply(text)
@@ -0,0 +1,271 @@
+#!/usr/bin/env python3
+"""
+Resized and WebP derivatives of the product images
+
+Product cards used to download every full-size original. This stage writes,
+for each source image, JPEG (or PNG, for images with transparency) thumbnails
+at THUMBNAIL_WIDTHS and WebP variants at those widths and at full size, named
+after the source's content hash so products sharing an image share its files.
+
+Work is spread over a process pool, and an index next to the derivatives maps
+each source (by size and mtime, then by SHA-256) to its finished variants:
+unchanged images are never decoded again, and a source that was only touched
+or copied is recognized by its hash. The importer's --images stage records the
+dimensions and byte sizes of each image and its variants in product_images.
+
+Derivatives go under the image root, the directory product image_url paths are
+relative to, and their URLs are relative to it as well, wherever the tool runs.
+"""
+
+import argparse
+import io
+import json
+import os
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+
+from PIL import Image, ImageOps
+
+from page_writer import atomic_write_bytes, write_if_changed
+from patch_manifest import definition_version, file_digest
+
+DERIVATIVES_DIR = 'image_derivatives'
+INDEX_NAME = '.index.json'
+INDEX_FORMAT = 2
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.webp', '.gif')
+
+THUMBNAIL_WIDTHS = (320, 640)
+JPEG_QUALITY = 82
+WEBP_QUALITY = 80
+
+# Changes whenever the variants produced for a source would change
+DERIVATIVE_VERSION = definition_version(THUMBNAIL_WIDTHS, JPEG_QUALITY, WEBP_QUALITY, 1)
+
+ImageInfo = namedtuple('ImageInfo', ['sha256', 'width', 'height', 'byte_size', 'variants'])
+ImageInfo.__doc__ = """Source image and its derivatives
+
+variants  list of {url, format, width, height, bytes} dicts, smallest first; url is
+          relative to the image root
+"""
+
+
+def _encode(image, image_format):
+    buffer = io.BytesIO()
+    if image_format == 'webp':
+        image.save(buffer, 'WEBP', quality=WEBP_QUALITY)
+    elif image_format == 'png':
+        image.save(buffer, 'PNG', optimize=True)
+    else:
+        image.convert('RGB').save(buffer, 'JPEG', quality=JPEG_QUALITY, optimize=True, progressive=True)
+    return buffer.getvalue()
+
+
+def derive_image(source, digest, output_dir=DERIVATIVES_DIR, image_root='.'):
+    """Worker: write the variants of one source image; returns its ImageInfo as a dict"""
+    with Image.open(source) as opened:
+        image = ImageOps.exif_transpose(opened)
+        image.load()
+    width, height = image.size
+    has_alpha = image.mode in ('RGBA', 'LA', 'PA') or 'transparency' in image.info
+    thumbnail_format = 'png' if has_alpha else 'jpeg'
+    if image.mode not in ('RGB', 'RGBA'):
+        image = image.convert('RGBA' if has_alpha else 'RGB')
+
+    os.makedirs(output_dir, exist_ok=True)
+    variants = []
+    targets = [(w, fmt) for w in THUMBNAIL_WIDTHS if w < width for fmt in (thumbnail_format, 'webp')]
+    targets.append((width, 'webp'))
+    for target_width, image_format in targets:
+        if target_width == width:
+            resized = image
+        else:
+            resized = image.resize((target_width, max(1, round(height * target_width / width))), Image.LANCZOS)
+        data = _encode(resized, image_format)
+        extension = 'jpg' if image_format == 'jpeg' else image_format
+        path = os.path.join(output_dir, f"{digest[:16]}-{target_width}w.{extension}")
+        atomic_write_bytes(path, data)
+        variants.append({
+            'url': os.path.relpath(path, image_root).replace(os.sep, '/'),
+            'format': image_format,
+            'width': resized.size[0],
+            'height': resized.size[1],
+            'bytes': len(data),
+        })
+    return ImageInfo(digest, width, height, os.path.getsize(source), variants)._asdict()
+
+
+class DerivativeIndex:
+    """Sources already processed, and the variants of every content hash, for DERIVATIVE_VERSION"""
+
+    def __init__(self, output_dir=DERIVATIVES_DIR, image_root='.'):
+        self.path = os.path.join(output_dir, INDEX_NAME)
+        self.image_root = image_root
+        self.sources = {}
+        self.images = {}
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            if data.get('format') == INDEX_FORMAT and data.get('version') == DERIVATIVE_VERSION:
+                self.sources = data.get('sources', {})
+                self.images = data.get('images', {})
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError) as e:
+            print(f"⚠️ Ignoring unreadable image index {self.path}: {e}")
+        self.dirty = False
+
+    def digest(self, source):
+        """Content hash of `source`, re-read only when its size or mtime changed"""
+        stat = os.stat(source)
+        entry = self.sources.get(source)
+        if entry and entry['size'] == stat.st_size and entry['mtime_ns'] == stat.st_mtime_ns:
+            return entry['sha256']
+        digest = file_digest(source)
+        self.sources[source] = {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns, 'sha256': digest}
+        self.dirty = True
+        return digest
+
+    def lookup(self, digest):
+        """ImageInfo of a content hash whose variants all still exist, else None"""
+        record = self.images.get(digest)
+        if not record or not all(os.path.exists(os.path.join(self.image_root, variant['url']))
+                                 for variant in record['variants']):
+            return None
+        return ImageInfo(**record)
+
+    def store(self, info):
+        self.images[info['sha256']] = info
+        self.dirty = True
+
+    def save(self):
+        if not self.dirty:
+            return
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        write_if_changed(self.path, json.dumps({
+            'format': INDEX_FORMAT, 'version': DERIVATIVE_VERSION,
+            'sources': self.sources, 'images': self.images,
+        }, indent=1, sort_keys=True))
+        self.dirty = False
+
+
+class ImageDeriver:
+    """Schedules derivative work as image URLs come in, on a process pool started on first use
+
+    submit() can be called while the rest of an import is still running;
+    results() waits for the pool and returns image URL -> ImageInfo. A relative
+    `output_dir` is taken relative to `image_root`, which must contain it.
+    """
+
+    def __init__(self, image_root='.', output_dir=DERIVATIVES_DIR, jobs=None):
+        self.image_root = image_root
+        self.output_dir = os.path.join(image_root, output_dir)
+        if os.path.relpath(self.output_dir, image_root).split(os.sep)[0] == os.pardir:
+            raise ValueError(f"derivatives in {self.output_dir} would not be served from the image root {image_root}")
+        self.jobs = jobs
+        self.index = DerivativeIndex(self.output_dir, image_root)
+        self.infos = {}
+        self.pending = {}
+        self.missing = set()
+        self.cached = 0
+        self._by_digest = {}
+        self._pool = None
+
+    def source_path(self, image_url):
+        return os.path.join(self.image_root, image_url.lstrip('/'))
+
+    def submit(self, image_url):
+        if not image_url or image_url in self.infos or image_url in self.pending or image_url in self.missing:
+            return
+        source = self.source_path(image_url)
+        if not source.lower().endswith(IMAGE_EXTENSIONS) or not os.path.isfile(source):
+            self.missing.add(image_url)
+            return
+        digest = self.index.digest(source)
+        info = self.index.lookup(digest)
+        if info:
+            self.infos[image_url] = info
+            self.cached += 1
+            return
+        # Several URLs with the same content share one job
+        future = self._by_digest.get(digest)
+        if future is None:
+            if self._pool is None:
+                self._pool = ProcessPoolExecutor(max_workers=self.jobs)
+            future = self._pool.submit(derive_image, source, digest, self.output_dir, self.image_root)
+            self._by_digest[digest] = future
+        self.pending[image_url] = future
+
+    def submit_products(self, products):
+        for product in products:
+            self.submit(product.get('image_url'))
+
+    def results(self):
+        """Wait for every scheduled image; image URL -> ImageInfo of those that could be processed"""
+        try:
+            for image_url, future in self.pending.items():
+                try:
+                    info = future.result()
+                except Exception as e:
+                    print(f"  ❌ Could not process {image_url}: {e}")
+                    continue
+                self.index.store(info)
+                self.infos[image_url] = ImageInfo(**info)
+            self.pending = {}
+        finally:
+            self.close()
+            self.index.save()
+        return self.infos
+
+    @property
+    def processed(self):
+        return len(self._by_digest)
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
+
+
+def source_images(directory):
+    return sorted(
+        os.path.join(directory, filename) for filename in os.listdir(directory)
+        if filename.lower().endswith(IMAGE_EXTENSIONS)
+    )
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Write thumbnails and WebP variants of a directory of images")
+    parser.add_argument('directory', help="directory holding the source images")
+    parser.add_argument('--image-root', default='.',
+                        help="directory the site serves images from; variant URLs are relative to it "
+                             "(default: current directory)")
+    parser.add_argument('--output-dir', default=DERIVATIVES_DIR,
+                        help=f"where derivatives and their index go, under the image root (default: {DERIVATIVES_DIR})")
+    parser.add_argument('--jobs', type=int, default=None,
+                        help="worker processes (default: CPU count)")
+    args = parser.parse_args()
+    if args.jobs is not None and args.jobs < 1:
+        parser.error("--jobs must be at least 1")
+    return args
+
+
+def main():
+    """Derive every image of a directory, e.g. HOT_WHEELS_IMAGES"""
+    args = parse_args()
+    images = source_images(args.directory)
+    print(f"🚀 Deriving {len(images)} images from {args.directory} into "
+          f"{os.path.join(args.image_root, args.output_dir)}...")
+    deriver = ImageDeriver(args.image_root, args.output_dir, args.jobs)
+    for image in images:
+        deriver.submit(os.path.relpath(image, args.image_root))
+    infos = deriver.results()
+    source_bytes = sum(info.byte_size for info in infos.values())
+    smallest_bytes = sum(info.variants[0]['bytes'] for info in infos.values())
+    print(f"\n✅ {len(infos)} images: {deriver.processed} processed, {deriver.cached} unchanged")
+    if infos:
+        print(f"   Originals {source_bytes / 1024 / 1024:.1f} MB, smallest variants {smallest_bytes / 1024 / 1024:.1f} MB")
+
+
+if __name__ == '__main__':
+    main()
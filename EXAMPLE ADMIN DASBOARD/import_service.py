@@ -0,0 +1,562 @@
+#!/usr/bin/env python3
+"""
+Catalog import service for the admin dashboard
+
+Runs the add_all_products.py import as a background job of a small asyncio HTTP
+service, so a reload no longer needs a blocking terminal and never occupies a
+web worker for its duration:
+
+  POST /imports              start an import: {"catalog": "products", "mode": "bulk"|"sync",
+                             "sources": [...]}; 409 while that catalog is already importing,
+                             400 for --swap reloads and --images, which stay CLI-only
+  GET  /imports              recent jobs
+  GET  /imports/<id>         one job's state and progress, for polling
+  GET  /imports/<id>/events  the same as server-sent events until the job ends
+
+The catalog pipeline parses in its background thread while asyncpg loads the
+previous batch. One import per catalog runs at a time: the service refuses a
+second job itself, and every load takes the same Postgres advisory lock as
+add_all_products.py, so a CLI run or a second service instance can't overlap it.
+Both importers take their statements and --sync bookkeeping from catalog_load.
+"""
+
+import argparse
+import asyncio
+import hmac
+import itertools
+import json
+import os
+import signal
+import time
+from collections import OrderedDict
+from decimal import Decimal
+from urllib.parse import parse_qs, urlsplit
+
+import asyncpg
+from dotenv import load_dotenv
+
+import instrumentation
+from catalog_load import (
+    ACQUIRE_IMPORT_LOCK, ADOPT_UNKEYED_ROWS, ANALYZE_PRODUCTS, CLEAR_PRODUCTS, DELETE_REMOVED_PRODUCTS,
+    DELETE_UNKEYED_PRODUCTS, HAS_UNKEYED_ROWS, IMPORT_KEY_INDEX, IMPORT_KEY_INDEX_EXISTS, IMPORT_LOCK,
+    MISSING_LOAD_COLUMNS, MISSING_SYNC_COLUMNS, PRODUCT_COLUMNS, STORED_HASHES, UPSERT_PRODUCT, ProductSync,
+    hashes_by_key, product_row, setup_hint
+)
+from catalog_pipeline import (
+    DEFAULT_BATCH_SIZE, DEFAULT_QUEUE_SIZE, SHOP_PAGE, catalog_batches, multi_source_batches
+)
+from catalog_search import REFRESH_SEARCH_VECTORS, SEARCH_VECTOR_EXISTS, SETUP_HINT
+from catalog_snapshot import DEFAULT_PAGE_SIZE, SNAPSHOT_DIR, SNAPSHOT_QUERY, write_snapshot
+from category_summary import (
+    CATEGORY_SUMMARY_DDL, DELETE_EMPTY_CATEGORIES, REBUILD_CATEGORY_SUMMARY, STORED_CATEGORIES,
+    UPSERT_CATEGORY_SUMMARY
+)
+
+# Load environment variables
+load_dotenv()
+
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 8765
+
+# Catalogs the service can import, with the listing pages they are read from by default.
+# Every catalog load replaces or syncs the products table under IMPORT_LOCK.
+CATALOGS = {'products': [SHOP_PAGE]}
+CATALOG_LOCKS = {'products': IMPORT_LOCK}
+
+MODES = ('bulk', 'sync')
+
+# Import options add_all_products.py has and the service does not: asked for, they are
+# refused rather than ignored
+CLI_ONLY = {
+    'swap': "swap reloads (add_all_products.py --swap)",
+    'images': "image derivatives (add_all_products.py --images)",
+}
+REQUEST_FIELDS = ('catalog', 'mode', 'sources')
+
+# Directory request sources must live in
+SOURCE_ROOT = 'pages'
+
+# Finished jobs kept for GET /imports
+MAX_FINISHED_JOBS = 20
+
+MAX_BODY_BYTES = 64 * 1024
+
+# Seconds between SSE keep-alive comments while a job reports nothing new
+SSE_KEEPALIVE = 15.0
+
+TERMINAL_STATES = ('succeeded', 'failed', 'busy')
+
+HTTP_REASONS = {
+    200: 'OK', 202: 'Accepted', 204: 'No Content', 400: 'Bad Request', 401: 'Unauthorized',
+    404: 'Not Found', 405: 'Method Not Allowed', 409: 'Conflict', 413: 'Payload Too Large',
+    500: 'Internal Server Error',
+}
+
+
+class RequestError(Exception):
+    """An HTTP error answered with a JSON {"error": ...} body"""
+
+    def __init__(self, status, message, **extra):
+        super().__init__(message)
+        self.status = status
+        self.extra = extra
+
+
+class ImportJob:
+    """One import run, with the progress the endpoints report"""
+
+    def __init__(self, job_id, catalog, mode, sources):
+        self.id = job_id
+        self.catalog = catalog
+        self.mode = mode
+        self.sources = sources
+        self.state = 'queued'
+        self.error = None
+        self.created = time.time()
+        self.finished = None
+        self.metrics = instrumentation.Metrics(f"import_service:{catalog}")
+        self.task = None
+        self._updated = asyncio.Event()
+
+    def notify(self):
+        """Wake every SSE stream waiting on this job"""
+        self._updated.set()
+        self._updated = asyncio.Event()
+
+    async def wait_for_update(self, timeout):
+        try:
+            await asyncio.wait_for(self._updated.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+
+    @property
+    def done(self):
+        return self.state in TERMINAL_STATES
+
+    def snapshot(self):
+        summary = self.metrics.summary()
+        return {
+            'id': self.id,
+            'catalog': self.catalog,
+            'mode': self.mode,
+            'sources': self.sources,
+            'state': self.state,
+            'error': self.error,
+            'created': self.created,
+            'finished': self.finished,
+            'elapsed_seconds': round((self.finished or time.time()) - self.created, 3),
+            'counters': summary['counters'],
+            'rates': summary['rates'],
+            'stages': summary['stages'],
+        }
+
+
+def _record(product):
+    """COPY/executemany record for a product; floats go to the numeric columns as Decimal"""
+    return tuple(Decimal(repr(value)) if isinstance(value, float) else value for value in product_row(product))
+
+
+async def next_batch(batches):
+    """Next pipeline batch without blocking the event loop; None when the catalog is exhausted or closed"""
+    return await asyncio.to_thread(next, batches, None)
+
+
+async def prepare_products_table(conn):
+    """Check the columns every load fills, as add_products_to_database does, and create the summary table"""
+    if not await conn.fetchval(SEARCH_VECTOR_EXISTS):
+        raise RuntimeError(SETUP_HINT)
+    missing = [f"{row[0]} column" for row in await conn.fetch(MISSING_LOAD_COLUMNS)]
+    if missing:
+        raise RuntimeError(setup_hint(missing))
+    for statement in CATEGORY_SUMMARY_DDL:
+        await conn.execute(statement)
+
+
+async def refresh_search_index(conn, job):
+    """Re-tokenize the rows this job inserted or changed, like add_all_products.refresh_search_index"""
+    with job.metrics.stage('search index'):
+        status = await conn.execute(REFRESH_SEARCH_VECTORS)
+    job.metrics.count('rows_search_indexed', int(status.split()[-1]))
+    job.notify()
+
+
+async def update_category_summary(conn, job, categories=None):
+    """Recompute the category_summary rows of `categories`, or all of them, like add_all_products"""
+    with job.metrics.stage('category summary'):
+        if categories is None:
+            for statement in REBUILD_CATEGORY_SUMMARY:
+                status = await conn.execute(statement)
+            count = int(status.split()[-1])
+        else:
+            categories = sorted(categories)
+            if categories:
+                await conn.execute(UPSERT_CATEGORY_SUMMARY[1], categories)
+                await conn.execute(DELETE_EMPTY_CATEGORIES[1], categories)
+            count = len(categories)
+    job.metrics.count('categories_summarized', count)
+    job.notify()
+
+
+async def load_bulk(conn, batches, job):
+    """Replace the products table, one COPY per batch"""
+    metrics = job.metrics
+    await prepare_products_table(conn)
+    await conn.execute(CLEAR_PRODUCTS)
+    while True:
+        with metrics.stage('parse wait'):
+            batch = await next_batch(batches)
+        if batch is None:
+            break
+        with metrics.stage('load'):
+            await conn.copy_records_to_table('products', records=[_record(product) for product in batch],
+                                             columns=PRODUCT_COLUMNS)
+        metrics.count('rows', len(batch))
+        metrics.count('batches')
+        job.notify()
+    await conn.execute(ANALYZE_PRODUCTS)
+    await refresh_search_index(conn, job)
+    await update_category_summary(conn, job)
+
+
+async def load_sync(conn, batches, job):
+    """Upsert changed products and delete removed ones, like add_all_products.py --sync"""
+    metrics = job.metrics
+    await prepare_products_table(conn)
+    missing = [f"{row[0]} column" for row in await conn.fetch(MISSING_SYNC_COLUMNS)]
+    if not await conn.fetchval(IMPORT_KEY_INDEX_EXISTS):
+        missing.append(IMPORT_KEY_INDEX)
+    if missing:
+        raise RuntimeError(setup_hint(missing))
+    sync = ProductSync(hashes_by_key(await conn.fetch(STORED_HASHES)), await conn.fetchval(HAS_UNKEYED_ROWS))
+    while True:
+        with metrics.stage('parse wait'):
+            batch = await next_batch(batches)
+        if batch is None:
+            break
+        with metrics.stage('load'):
+            keyed, changed = sync.diff(batch)
+            if sync.adopt and keyed:
+                status = await conn.execute(ADOPT_UNKEYED_ROWS[1], *ProductSync.adopt_params(keyed))
+                metrics.count('rows_adopted', int(status.split()[-1]))
+            if changed:
+                sync.record_categories(await conn.fetch(STORED_CATEGORIES[1], ProductSync.changed_keys(changed)))
+                await conn.executemany(UPSERT_PRODUCT[1], ProductSync.upsert_rows(changed, _record))
+        metrics.count('rows', len(batch))
+        metrics.count('rows_upserted', len(changed))
+        metrics.count('batches')
+        job.notify()
+
+    metrics.count('duplicates_skipped', sync.duplicates)
+    removed = sync.removed_keys()
+    if removed:
+        sync.record_deleted(await conn.fetch(DELETE_REMOVED_PRODUCTS[1], removed))
+    sync.record_deleted(await conn.fetch(DELETE_UNKEYED_PRODUCTS))
+    metrics.count('rows_deleted', sync.deleted)
+    await refresh_search_index(conn, job)
+    await update_category_summary(conn, job, sync.categories)
+
+
+LOADERS = {'bulk': load_bulk, 'sync': load_sync}
+
+
+class ImportService:
+    """Job registry and HTTP front end"""
+
+    def __init__(self, pool, batch_size=DEFAULT_BATCH_SIZE, queue_size=DEFAULT_QUEUE_SIZE,
+                 token=None, allow_origin=None, progress_interval=instrumentation.DEFAULT_PROGRESS_INTERVAL,
+                 metrics_file=None, source_root=SOURCE_ROOT, snapshot_dir=SNAPSHOT_DIR,
+                 page_size=DEFAULT_PAGE_SIZE):
+        self.pool = pool
+        self.batch_size = batch_size
+        self.queue_size = queue_size
+        self.token = token
+        self.allow_origin = allow_origin
+        self.progress_interval = progress_interval
+        self.metrics_file = metrics_file
+        self.source_root = os.path.realpath(source_root)
+        self.snapshot_dir = snapshot_dir
+        self.page_size = page_size
+        self.jobs = OrderedDict()
+        self.running = {}
+        self._ids = itertools.count(1)
+
+    # Jobs
+
+    def resolve_sources(self, catalog, sources):
+        """Request sources as paths inside the source root; the catalog's defaults if none are given"""
+        if sources is None:
+            return list(CATALOGS[catalog])
+        if not isinstance(sources, list) or not sources or not all(isinstance(s, str) for s in sources):
+            raise RequestError(400, "sources must be a non-empty list of listing page or manifest paths")
+        resolved = []
+        for source in sources:
+            path = os.path.realpath(source)
+            if (os.path.commonpath([path, self.source_root]) != self.source_root
+                    or not path.endswith(('.html', '.json'))):
+                raise RequestError(400, f"source {source!r} is not an .html page or snapshot manifest "
+                                        f"under {SOURCE_ROOT}/")
+            if not os.path.isfile(path):
+                raise RequestError(400, f"source {source!r} does not exist")
+            resolved.append(source)
+        return resolved
+
+    def start_import(self, request):
+        catalog = request.get('catalog', 'products')
+        if catalog not in CATALOGS:
+            raise RequestError(400, f"unknown catalog {catalog!r}", catalogs=sorted(CATALOGS))
+        mode = request.get('mode', 'bulk')
+        unsupported = [label for option, label in CLI_ONLY.items() if option == mode or option in request]
+        if unsupported:
+            raise RequestError(400, f"{' and '.join(unsupported)} only run from the command line")
+        if mode not in MODES:
+            raise RequestError(400, f"mode must be one of {', '.join(MODES)}")
+        unknown = sorted(set(request) - set(REQUEST_FIELDS))
+        if unknown:
+            raise RequestError(400, f"unknown field(s) {', '.join(unknown)}", fields=list(REQUEST_FIELDS))
+        sources = self.resolve_sources(catalog, request.get('sources'))
+
+        running = self.running.get(catalog)
+        if running:
+            raise RequestError(409, f"an import of {catalog} is already running", job=running.snapshot())
+
+        job = ImportJob(next(self._ids), catalog, mode, sources)
+        self.jobs[job.id] = job
+        self.running[catalog] = job
+        job.task = asyncio.create_task(self.run_import(job))
+        self._forget_old_jobs()
+        return job
+
+    def _forget_old_jobs(self):
+        finished = [job_id for job_id, job in self.jobs.items() if job.done]
+        for job_id in finished[:max(0, len(finished) - MAX_FINISHED_JOBS)]:
+            del self.jobs[job_id]
+
+    def open_batches(self, sources):
+        if len(sources) > 1:
+            return multi_source_batches(sources, self.batch_size, self.queue_size)
+        return catalog_batches(sources[0], self.batch_size, self.queue_size)
+
+    async def run_import(self, job):
+        job.state = 'running'
+        job.notify()
+        batches = None
+        try:
+            batches = await asyncio.to_thread(self.open_batches, job.sources)
+            async with self.pool.acquire() as conn:
+                async with conn.transaction():
+                    acquired = await conn.fetchval(ACQUIRE_IMPORT_LOCK[1], CATALOG_LOCKS[job.catalog])
+                    if not acquired:
+                        job.state = 'busy'
+                        job.error = f"another import of {job.catalog} is running (CLI or another service)"
+                        return
+                    await LOADERS[job.mode](conn, batches, job)
+                if self.snapshot_dir:
+                    await self.export_snapshot(conn, job)
+            job.state = 'succeeded'
+        except asyncio.CancelledError:
+            job.state = 'failed'
+            job.error = 'cancelled'
+            raise
+        except Exception as e:
+            job.state = 'failed'
+            job.error = f"{type(e).__name__}: {e}"
+        finally:
+            if batches is not None:
+                # Stops and joins the pipeline thread; a next_batch() this job was
+                # cancelled in the middle of returns None instead of racing the close
+                await asyncio.to_thread(batches.close)
+            job.finished = time.time()
+            self.running.pop(job.catalog, None)
+            job.notify()
+            print(f"{'✅' if job.state == 'succeeded' else '❌'} Import {job.id} ({job.catalog}, {job.mode}) "
+                  f"{job.state}{': ' + job.error if job.error else ''} - {job.metrics.summary_line()}")
+            if self.metrics_file:
+                job.metrics.write(self.metrics_file)
+
+    async def export_snapshot(self, conn, job):
+        """Export the committed catalog as catalog_snapshot shards, writing them off the event loop"""
+        with job.metrics.stage('snapshot'):
+            rows = [dict(row) for row in await conn.fetch(SNAPSHOT_QUERY)]
+            _, written = await asyncio.to_thread(write_snapshot, rows, self.snapshot_dir, self.page_size)
+        job.metrics.count('snapshot_shards_written', written)
+        job.notify()
+
+    def job(self, job_id):
+        try:
+            return self.jobs[int(job_id)]
+        except (KeyError, ValueError):
+            raise RequestError(404, f"no import {job_id}")
+
+    # HTTP
+
+    def _headers(self, status, content_type, extra=()):
+        lines = [f"HTTP/1.1 {status} {HTTP_REASONS.get(status, '')}", f"Content-Type: {content_type}",
+                 'Cache-Control: no-store', 'Connection: close']
+        if self.allow_origin:
+            lines += [f"Access-Control-Allow-Origin: {self.allow_origin}",
+                      'Access-Control-Allow-Headers: Authorization, Content-Type',
+                      'Access-Control-Allow-Methods: GET, POST, OPTIONS']
+        lines += list(extra)
+        return ('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1')
+
+    async def send_json(self, writer, status, payload):
+        body = json.dumps(payload).encode('utf-8')
+        writer.write(self._headers(status, 'application/json', [f"Content-Length: {len(body)}"]) + body)
+        await writer.drain()
+
+    def check_token(self, headers, query):
+        """Bearer token from the Authorization header, or ?token= for EventSource, which can't set headers"""
+        if not self.token:
+            return
+        supplied = headers.get('authorization', '')
+        supplied = supplied[len('Bearer '):] if supplied.startswith('Bearer ') else query.get('token', [''])[0]
+        if not hmac.compare_digest(supplied.encode('utf-8'), self.token.encode('utf-8')):
+            raise RequestError(401, "missing or wrong token")
+
+    async def stream_events(self, writer, job):
+        """Server-sent events: a progress event at most every progress_interval, then the final state"""
+        writer.write(self._headers(200, 'text/event-stream'))
+        await writer.drain()
+        while True:
+            event = 'done' if job.done else 'progress'
+            writer.write(f"event: {event}\ndata: {json.dumps(job.snapshot())}\n\n".encode('utf-8'))
+            await writer.drain()
+            if job.done:
+                return
+            started = time.monotonic()
+            await job.wait_for_update(SSE_KEEPALIVE)
+            if not job.done:
+                if time.monotonic() - started >= SSE_KEEPALIVE:
+                    writer.write(b": keep-alive\n\n")
+                    await writer.drain()
+                    continue
+                await asyncio.sleep(max(0.0, self.progress_interval - (time.monotonic() - started)))
+
+    async def route(self, method, target, headers, body, writer):
+        query = parse_qs(target.query)
+        parts = [part for part in target.path.split('/') if part]
+        if method == 'OPTIONS':
+            writer.write(self._headers(204, 'text/plain'))
+            return
+        if not parts or parts[0] != 'imports' or len(parts) > 3 or (len(parts) == 3 and parts[2] != 'events'):
+            raise RequestError(404, f"no route {target.path}")
+        self.check_token(headers, query)
+
+        if len(parts) == 1:
+            if method == 'POST':
+                try:
+                    request = json.loads(body or b'{}')
+                except ValueError:
+                    raise RequestError(400, "body must be JSON")
+                if not isinstance(request, dict):
+                    raise RequestError(400, "body must be a JSON object")
+                job = self.start_import(request)
+                await self.send_json(writer, 202, job.snapshot())
+            elif method == 'GET':
+                await self.send_json(writer, 200, {'imports': [job.snapshot() for job in reversed(self.jobs.values())]})
+            else:
+                raise RequestError(405, f"{method} not allowed on /imports")
+            return
+
+        if method != 'GET':
+            raise RequestError(405, f"{method} not allowed on {target.path}")
+        job = self.job(parts[1])
+        if len(parts) == 3:
+            await self.stream_events(writer, job)
+        else:
+            await self.send_json(writer, 200, job.snapshot())
+
+    async def handle(self, reader, writer):
+        """Serve one HTTP/1.1 request per connection"""
+        try:
+            try:
+                request_line = (await reader.readline()).decode('latin-1').rstrip('\r\n')
+                method, target, _ = request_line.split(' ', 2)
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    name, _, value = line.decode('latin-1').partition(':')
+                    headers[name.strip().lower()] = value.strip()
+                length = int(headers.get('content-length') or 0)
+                if length > MAX_BODY_BYTES:
+                    raise RequestError(413, f"body larger than {MAX_BODY_BYTES} bytes")
+                body = await reader.readexactly(length) if length else b''
+                await self.route(method.upper(), urlsplit(target), headers, body, writer)
+            except (ValueError, asyncio.IncompleteReadError):
+                raise RequestError(400, "malformed request")
+        except RequestError as e:
+            await self.send_json(writer, e.status, {'error': str(e), **e.extra})
+        except ConnectionError:
+            pass
+        except Exception as e:
+            await self.send_json(writer, 500, {'error': f"{type(e).__name__}: {e}"})
+        finally:
+            try:
+                await writer.drain()
+                writer.close()
+            except ConnectionError:
+                pass
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="HTTP service running catalog imports in the background")
+    parser.add_argument('--host', default=DEFAULT_HOST, help=f"address to listen on (default: {DEFAULT_HOST})")
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT, help=f"port to listen on (default: {DEFAULT_PORT})")
+    parser.add_argument('--allow-origin',
+                        help="Access-Control-Allow-Origin for a dashboard served from another origin")
+    parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE,
+                        help=f"rows per pipeline batch and COPY (default: {DEFAULT_BATCH_SIZE})")
+    parser.add_argument('--queue-size', type=int, default=DEFAULT_QUEUE_SIZE,
+                        help=f"batches buffered between the parser and the loader (default: {DEFAULT_QUEUE_SIZE})")
+    parser.add_argument('--snapshot-dir', default=SNAPSHOT_DIR,
+                        help=f"where each import exports the catalog snapshot (default: {SNAPSHOT_DIR})")
+    parser.add_argument('--no-snapshot', action='store_true',
+                        help="do not export a catalog snapshot after imports")
+    parser.add_argument('--page-size', type=int, default=DEFAULT_PAGE_SIZE,
+                        help=f"products per snapshot shard (default: {DEFAULT_PAGE_SIZE})")
+    instrumentation.add_arguments(parser)
+    args = parser.parse_args()
+    if args.batch_size < 1:
+        parser.error("--batch-size must be at least 1")
+    if args.queue_size < 1:
+        parser.error("--queue-size must be at least 1")
+    if args.page_size < 1:
+        parser.error("--page-size must be at least 1")
+    return args
+
+
+async def serve(args):
+    pool = await asyncpg.create_pool(os.getenv('DATABASE_URL'), min_size=1,
+                                     max_size=int(os.getenv('DB_POOL_MAX', '4')))
+    service = ImportService(
+        pool, args.batch_size, args.queue_size,
+        token=os.getenv('IMPORT_SERVICE_TOKEN'), allow_origin=args.allow_origin,
+        progress_interval=args.progress_interval, metrics_file=args.metrics_file,
+        snapshot_dir=None if args.no_snapshot else args.snapshot_dir, page_size=args.page_size
+    )
+    server = await asyncio.start_server(service.handle, args.host, args.port)
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(signum, stop.set)
+
+    print(f"🚀 Import service listening on http://{args.host}:{args.port}/imports")
+    if not service.token:
+        print("⚠️ IMPORT_SERVICE_TOKEN is not set; anyone who can reach the port can start imports")
+    async with server:
+        await stop.wait()
+    print("Shutting down; running imports are rolled back")
+    for job in list(service.running.values()):
+        job.task.cancel()
+    await asyncio.gather(*(job.task for job in service.jobs.values() if job.task), return_exceptions=True)
+    await pool.close()
+
+
+def main():
+    asyncio.run(serve(parse_args()))
+
+
+if __name__ == '__main__':
+    main()
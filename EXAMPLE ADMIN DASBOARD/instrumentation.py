@@ -0,0 +1,202 @@
+#!/usr/bin/env python3
+"""
+Timing and counters for the admin scripts
+
+Each script keeps one process-wide Metrics (like db_access keeps one pool):
+stage wall times, counters such as rows, files, bytes_read and bytes_written,
+and accumulated regex time. Console progress is throttled to one summary line
+every few seconds instead of a print per item, and at the end of a run the
+metrics can be appended as a JSON line or written as a Prometheus textfile
+(for node_exporter's textfile collector).
+"""
+
+import datetime
+import json
+import re
+import sys
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+from page_writer import atomic_write_bytes
+
+# Seconds between two progress lines
+DEFAULT_PROGRESS_INTERVAL = 2.0
+
+PROMETHEUS_PREFIX = 'admin_script'
+
+_UNITS = {'bytes_read': 'read', 'bytes_written': 'written'}
+
+
+def _format_bytes(count):
+    for unit in ('B', 'KB', 'MB', 'GB'):
+        if count < 1024 or unit == 'GB':
+            return f"{count:,.0f} {unit}" if unit == 'B' else f"{count:,.1f} {unit}"
+        count /= 1024
+
+
+class Metrics:
+    """Stage timings and counters of one script run"""
+
+    def __init__(self, script, progress_interval=DEFAULT_PROGRESS_INTERVAL, stream=None):
+        self.script = script
+        self.progress_interval = progress_interval
+        self.stream = stream
+        self.started_at = time.time()
+        self.started = time.perf_counter()
+        self.stages = Counter()
+        self.counters = Counter()
+        self._last_progress = self.started
+
+    @contextmanager
+    def stage(self, name):
+        """Add the wall time of the block to stage `name`"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stages[name] += time.perf_counter() - start
+
+    @contextmanager
+    def timer(self, name):
+        """Add the time spent in the block to the `<name>_seconds` counter (e.g. regex_seconds)"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.counters[f"{name}_seconds"] += time.perf_counter() - start
+
+    def count(self, name, amount=1):
+        self.counters[name] += amount
+
+    def merge(self, counters):
+        """Add counters collected elsewhere (e.g. in a worker process)"""
+        self.counters.update(counters)
+
+    def elapsed(self):
+        return time.perf_counter() - self.started
+
+    def progress(self, counter, label, total=None):
+        """Print `counter` so far and its rate, at most once per progress interval"""
+        now = time.perf_counter()
+        if now - self._last_progress < self.progress_interval:
+            return
+        self._last_progress = now
+        done = self.counters[counter]
+        rate = done / (now - self.started) if now > self.started else 0
+        of_total = f"/{total:,}" if total is not None else ''
+        print(f"  … {done:,}{of_total} {label} ({rate:,.0f}/s)", file=self.stream or sys.stdout, flush=True)
+
+    def summary(self):
+        """The run as a JSON-serializable dict"""
+        elapsed = self.elapsed()
+        counters = {name: round(value, 6) if isinstance(value, float) else value
+                    for name, value in sorted(self.counters.items())}
+        rates = {
+            f"{name}_per_second": round(value / elapsed, 2)
+            for name, value in counters.items()
+            if elapsed and not name.endswith('_seconds')
+        }
+        return {
+            'script': self.script,
+            'started': datetime.datetime.fromtimestamp(self.started_at, datetime.timezone.utc).isoformat(timespec='seconds'),
+            'elapsed_seconds': round(elapsed, 6),
+            'stages': {name: round(seconds, 6) for name, seconds in self.stages.items()},
+            'counters': counters,
+            'rates': rates,
+        }
+
+    def summary_line(self):
+        """One human-readable line with the totals"""
+        elapsed = self.elapsed()
+        parts = []
+        for name, value in sorted(self.counters.items()):
+            if name in _UNITS:
+                parts.append(f"{_format_bytes(value)} {_UNITS[name]}")
+            elif name.endswith('_seconds'):
+                parts.append(f"{name[:-len('_seconds')]} {value:.2f}s")
+            else:
+                rate = f" ({value / elapsed:,.0f}/s)" if elapsed else ''
+                parts.append(f"{value:,} {name.replace('_', ' ')}{rate}")
+        stages = ', '.join(f"{name} {seconds:.2f}s" for name, seconds in self.stages.items())
+        line = f"📊 {elapsed:.2f}s: {', '.join(parts) or 'no counters'}"
+        return f"{line} [{stages}]" if stages else line
+
+    def write_jsonl(self, path):
+        """Append the run as one JSON line"""
+        with open(path, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(self.summary(), sort_keys=True) + '\n')
+
+    def prometheus_text(self):
+        summary = self.summary()
+        labels = f'script="{self.script}"'
+        lines = [
+            f"# HELP {PROMETHEUS_PREFIX}_last_run_timestamp_seconds Start time of the last run",
+            f"# TYPE {PROMETHEUS_PREFIX}_last_run_timestamp_seconds gauge",
+            f"{PROMETHEUS_PREFIX}_last_run_timestamp_seconds{{{labels}}} {self.started_at:.3f}",
+            f"# HELP {PROMETHEUS_PREFIX}_duration_seconds Wall time of the last run",
+            f"# TYPE {PROMETHEUS_PREFIX}_duration_seconds gauge",
+            f"{PROMETHEUS_PREFIX}_duration_seconds{{{labels}}} {summary['elapsed_seconds']}",
+            f"# HELP {PROMETHEUS_PREFIX}_stage_seconds Wall time per stage of the last run",
+            f"# TYPE {PROMETHEUS_PREFIX}_stage_seconds gauge",
+        ]
+        for name, seconds in summary['stages'].items():
+            lines.append(f'{PROMETHEUS_PREFIX}_stage_seconds{{{labels},stage="{name}"}} {seconds}')
+        for name, value in summary['counters'].items():
+            metric = f"{PROMETHEUS_PREFIX}_{re.sub(r'[^a-zA-Z0-9_]', '_', name)}"
+            lines.append(f"# TYPE {metric} gauge")
+            lines.append(f"{metric}{{{labels}}} {value}")
+        return '\n'.join(lines) + '\n'
+
+    def write_prometheus(self, path):
+        """Replace a Prometheus textfile atomically, as the textfile collector requires"""
+        atomic_write_bytes(path, self.prometheus_text().encode('utf-8'))
+
+    def write(self, path):
+        """Write to `path`: Prometheus textfile for *.prom, otherwise an appended JSON line"""
+        if path.endswith('.prom'):
+            self.write_prometheus(path)
+        else:
+            self.write_jsonl(path)
+
+
+_current = Metrics('admin-script')
+
+
+def current():
+    """The process-wide Metrics that code records into"""
+    return _current
+
+
+def begin(script, progress_interval=DEFAULT_PROGRESS_INTERVAL):
+    """Start a fresh process-wide Metrics for `script`"""
+    global _current
+    _current = Metrics(script, progress_interval)
+    return _current
+
+
+@contextmanager
+def scoped(script=None):
+    """Record into a temporary Metrics (e.g. one page in a worker), restoring the previous one after"""
+    global _current
+    previous = _current
+    _current = Metrics(script or previous.script, previous.progress_interval)
+    try:
+        yield _current
+    finally:
+        _current = previous
+
+
+def finish(metrics_file=None):
+    """Print the summary line and write the metrics file, if one was requested"""
+    print(_current.summary_line())
+    if metrics_file:
+        _current.write(metrics_file)
+
+
+def add_arguments(parser):
+    """--metrics-file and --progress-interval, shared by the scripts"""
+    parser.add_argument('--metrics-file',
+                        help="write run metrics here: Prometheus textfile if it ends in .prom, else appended JSON lines")
+    parser.add_argument('--progress-interval', type=float, default=DEFAULT_PROGRESS_INTERVAL,
+                        help=f"seconds between progress lines (default: {DEFAULT_PROGRESS_INTERVAL})")
@@ -0,0 +1,294 @@
+#!/usr/bin/env python3
+"""
+Streaming parser for JavaScript array/object literals embedded in HTML pages
+
+Reads the page in fixed-size chunks and yields the objects of an array such as
+`const allProducts = [...]` one at a time, so memory stays flat and parse time is
+linear in the size of the page. Keys may appear in any order, may be bare
+identifiers or quoted, and strings may use ', " or ` with backslash escapes.
+"""
+
+import re
+
+DEFAULT_CHUNK_SIZE = 64 * 1024
+
+# How much of the previous chunk to keep while searching for the array marker,
+# so a marker split across two chunks is still found
+MARKER_LOOKBEHIND = 256
+
+_WHITESPACE = re.compile(r'[\s\ufeff]*')
+_NUMBER = re.compile(r'[-+]?(?:0[xX][0-9a-fA-F]+|(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?)')
+_IDENTIFIER = re.compile(r'[A-Za-z_$][\w$]*')
+_STRING_STOPS = {quote: re.compile('[\\\\' + quote + ']') for quote in '\'"`'}
+_SIMPLE_ESCAPES = {
+    'n': '\n', 't': '\t', 'r': '\r', 'b': '\b', 'f': '\f', 'v': '\v', '0': '\0',
+}
+_KEYWORDS = {'true': True, 'false': False, 'null': None, 'undefined': None}
+
+
+class JSLiteralError(ValueError):
+    """Raised when the literal being parsed is not valid JavaScript"""
+
+
+def array_marker(name):
+    """Regex matching `const|let|var <name> = [`"""
+    return re.compile(r'(?:const|let|var)\s+' + re.escape(name) + r'\s*=\s*\[')
+
+
+class _Reader:
+    """Chunked character reader over a text file handle"""
+
+    def __init__(self, handle, chunk_size=DEFAULT_CHUNK_SIZE):
+        self.handle = handle
+        self.chunk_size = chunk_size
+        self.buf = ''
+        self.pos = 0
+        self.chars_read = 0
+
+    def fill(self):
+        """Append the next chunk, dropping everything already consumed"""
+        chunk = self.handle.read(self.chunk_size)
+        if not chunk:
+            return False
+        self.chars_read += len(chunk)
+        self.buf = self.buf[self.pos:] + chunk
+        self.pos = 0
+        return True
+
+    def ensure(self, count):
+        """Make sure at least `count` unread characters are buffered, if the file has them"""
+        while len(self.buf) - self.pos < count:
+            if not self.fill():
+                return False
+        return True
+
+    def peek(self):
+        if self.pos >= len(self.buf) and not self.fill():
+            return ''
+        return self.buf[self.pos]
+
+    def next(self):
+        char = self.peek()
+        if not char:
+            raise JSLiteralError("Unexpected end of input")
+        self.pos += 1
+        return char
+
+    def expect(self, char):
+        found = self.next()
+        if found != char:
+            raise JSLiteralError(f"Expected {char!r} but found {found!r} near offset {self.offset()}")
+
+    def offset(self):
+        return self.chars_read - (len(self.buf) - self.pos)
+
+    def match(self, pattern, min_buffer=64):
+        """Match a short token at the current position"""
+        self.ensure(min_buffer)
+        found = pattern.match(self.buf, self.pos)
+        if found:
+            self.pos = found.end()
+        return found
+
+    def skip_whitespace(self):
+        """Skip whitespace and // or /* */ comments"""
+        while True:
+            self.pos = _WHITESPACE.match(self.buf, self.pos).end()
+            # Whitespace may continue, or a '/' may open a comment, in the next chunk
+            if self.pos >= len(self.buf) - 1 and self.fill():
+                continue
+            if self.buf.startswith('//', self.pos):
+                self._skip_until('\n', 2)
+            elif self.buf.startswith('/*', self.pos):
+                self._skip_until('*/', 2)
+            else:
+                return
+
+    def _skip_until(self, terminator, start):
+        self.pos += start
+        while True:
+            index = self.buf.find(terminator, self.pos)
+            if index != -1:
+                self.pos = index + len(terminator)
+                return
+            self.pos = max(self.pos, len(self.buf) - len(terminator) + 1)
+            if not self.fill():
+                self.pos = len(self.buf)
+                return
+
+    def seek_marker(self, marker):
+        """Advance past the first match of `marker`; False if the file ends first"""
+        while True:
+            found = marker.search(self.buf, self.pos)
+            if found and found.end() < len(self.buf):
+                self.pos = found.end()
+                return True
+            self.pos = max(self.pos, len(self.buf) - MARKER_LOOKBEHIND)
+            if not self.fill():
+                if found:
+                    self.pos = found.end()
+                    return True
+                return False
+
+
+def _read_string(reader, quote):
+    """Read a quoted string; the opening quote has already been consumed"""
+    stops = _STRING_STOPS[quote]
+    parts = []
+    while True:
+        found = stops.search(reader.buf, reader.pos)
+        if not found:
+            parts.append(reader.buf[reader.pos:])
+            reader.pos = len(reader.buf)
+            if not reader.fill():
+                raise JSLiteralError("Unterminated string literal")
+            continue
+        parts.append(reader.buf[reader.pos:found.start()])
+        reader.pos = found.end()
+        if found.group() == quote:
+            return ''.join(parts)
+        parts.append(_read_escape(reader))
+
+
+def _read_escape(reader):
+    """Decode the escape sequence following a backslash"""
+    char = reader.next()
+    if char in _SIMPLE_ESCAPES:
+        return _SIMPLE_ESCAPES[char]
+    if char == '\r':
+        if reader.peek() == '\n':
+            reader.pos += 1
+        return ''
+    if char in '\n\u2028\u2029':
+        return ''
+    if char == 'x':
+        return chr(_read_hex(reader, 2))
+    if char == 'u':
+        if reader.peek() == '{':
+            reader.pos += 1
+            reader.ensure(8)
+            end = reader.buf.find('}', reader.pos)
+            if end == -1:
+                raise JSLiteralError("Unterminated \\u{...} escape")
+            code = int(reader.buf[reader.pos:end], 16)
+            reader.pos = end + 1
+            return chr(code)
+        code = _read_hex(reader, 4)
+        # Recombine UTF-16 surrogate pairs written as two \u escapes
+        if 0xD800 <= code <= 0xDBFF and reader.ensure(6) and reader.buf.startswith('\\u', reader.pos):
+            low = int(reader.buf[reader.pos + 2:reader.pos + 6], 16)
+            if 0xDC00 <= low <= 0xDFFF:
+                reader.pos += 6
+                return chr(0x10000 + ((code - 0xD800) << 10) + (low - 0xDC00))
+        return chr(code)
+    return char
+
+
+def _read_hex(reader, length):
+    if not reader.ensure(length):
+        raise JSLiteralError("Truncated escape sequence")
+    digits = reader.buf[reader.pos:reader.pos + length]
+    reader.pos += length
+    try:
+        return int(digits, 16)
+    except ValueError:
+        raise JSLiteralError(f"Invalid escape sequence \\{digits}") from None
+
+
+def _number(text):
+    if text.lstrip('+-')[:2] in ('0x', '0X'):
+        return int(text, 16)
+    value = float(text)
+    return int(value) if value.is_integer() and not any(c in text for c in '.eE') else value
+
+
+def read_value(reader):
+    """Parse one JavaScript literal value at the current position"""
+    reader.skip_whitespace()
+    char = reader.peek()
+    if char == '{':
+        return read_object(reader)
+    if char == '[':
+        return read_array(reader)
+    if char in ('\'', '"', '`'):
+        reader.pos += 1
+        return _read_string(reader, char)
+    number = reader.match(_NUMBER)
+    if number:
+        return _number(number.group())
+    identifier = reader.match(_IDENTIFIER)
+    if identifier:
+        word = identifier.group()
+        return _KEYWORDS.get(word, word)
+    raise JSLiteralError(f"Unexpected {char or 'end of input'!r} near offset {reader.offset()}")
+
+
+def _read_key(reader):
+    char = reader.peek()
+    if char in ('\'', '"', '`'):
+        reader.pos += 1
+        return _read_string(reader, char)
+    token = reader.match(_IDENTIFIER) or reader.match(_NUMBER)
+    if not token:
+        raise JSLiteralError(f"Expected property name near offset {reader.offset()}")
+    return token.group()
+
+
+def read_object(reader):
+    """Parse an object literal into a dict"""
+    reader.expect('{')
+    result = {}
+    while True:
+        reader.skip_whitespace()
+        if reader.peek() == '}':
+            reader.pos += 1
+            return result
+        key = _read_key(reader)
+        reader.skip_whitespace()
+        reader.expect(':')
+        result[key] = read_value(reader)
+        reader.skip_whitespace()
+        separator = reader.next()
+        if separator == '}':
+            return result
+        if separator != ',':
+            raise JSLiteralError(f"Expected ',' or '}}' near offset {reader.offset()}")
+
+
+def read_array(reader):
+    """Parse an array literal into a list"""
+    reader.expect('[')
+    return list(_iter_elements(reader))
+
+
+def _iter_elements(reader):
+    """Yield the elements of an array whose opening bracket was already consumed"""
+    while True:
+        reader.skip_whitespace()
+        char = reader.peek()
+        if char == ']':
+            reader.pos += 1
+            return
+        if char == ',':
+            reader.pos += 1
+            continue
+        yield read_value(reader)
+        reader.skip_whitespace()
+        separator = reader.next()
+        if separator == ']':
+            return
+        if separator != ',':
+            raise JSLiteralError(f"Expected ',' or ']' near offset {reader.offset()}")
+
+
+def iter_array_objects(handle, name='allProducts', chunk_size=DEFAULT_CHUNK_SIZE):
+    """Yield each object of the `<name> = [...]` array found in an open text file
+
+    Non-object elements are skipped. Yields nothing if the array is not present.
+    """
+    reader = _Reader(handle, chunk_size)
+    if not reader.seek_marker(array_marker(name)):
+        return
+    for element in _iter_elements(reader):
+        if isinstance(element, dict):
+            yield element
@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+"""
+Compiled patterns the page patchers run over whole edit pages
+
+Every pattern starts with a literal, so a failed attempt costs a few characters,
+and every variable-length run after that literal is bounded or stops at the
+next occurrence of the literal's own delimiter. The previous unbounded runs
+(`<[^>]*>Tags</`, `formData = {[^}]*`, `populateForm(...) {[^}]*`, and
+`<!-- Size Chart Configuration -->.*?</div>...`) restarted from every anchor
+and rescanned the rest of the page when their terminator was missing, which is
+quadratic on large inline scripts; benchmark_page_patterns.py checks that each
+one now scales linearly up to 1 MB pages. populateForm is found by the literal
+statement that fills in its feature checkboxes instead, since its body nests
+blocks of its own.
+"""
+
+import re
+
+# Longest opening tag in front of a "Tags" label
+MAX_TAG_LENGTH = 500
+
+# Longest run of an object literal or function body searched for its closing brace
+MAX_BLOCK_LENGTH = 10_000
+
+# Closing script tag of the page, where the JavaScript is appended
+SCRIPT_END = re.compile(r'</script>\s*</body>')
+
+# The Tags section of an edit page: its comment, or an element labelled "Tags"
+TAGS_SECTION = re.compile(r'<!-- Tags -->|<[^<>]{0,%d}>Tags</' % MAX_TAG_LENGTH)
+
+# Last member of a `formData = {...}` literal, whose members may hold flat objects of their own
+# (the edit pages' specifications and features), up to any trailing comma before its closing brace
+FORM_DATA_BODY = re.compile(
+    r'formData\s*=\s*\{(?:[^{}]|\{[^{}]{0,%d}\}){0,%d}?(?=,?\s*\})' % (MAX_BLOCK_LENGTH, MAX_BLOCK_LENGTH)
+)
+
+# Last statement populateForm runs for the feature checkboxes, after which the size chart is loaded
+FEATURES_POPULATED = "document.getElementById('feature-soft-touch').checked = features.soft_touch !== false;"
+
+# A previously injected size chart section: this comment and the <div> element right after it
+SIZE_CHART_SECTION_START = '<!-- Size Chart Configuration -->'
+
+_DIV_TAG = re.compile(r'<div\b|</div>')
+
+# Longest gap between a section's comment and the opening tag of its element
+MAX_SECTION_GAP = 200
+
+
+def size_chart_section_end(text, position):
+    """Index just past the </div> matching the <div> that opens at most MAX_SECTION_GAP
+    whitespace characters after `position`; -1 if there is none or it never closes
+
+    The patchers' sections nest several levels of <div>, so their end is found by
+    counting tags rather than by a fixed run of closing tags.
+    """
+    opening = _DIV_TAG.search(text, position, position + MAX_SECTION_GAP + len('<div'))
+    if not opening or opening.group() != '<div' or text[position:opening.start()].strip():
+        return -1
+    depth = 0
+    for tag in _DIV_TAG.finditer(text, opening.start()):
+        depth += 1 if tag.group() == '<div' else -1
+        if depth == 0:
+            return tag.end()
+    return -1
+
+
+def _skip_blanks_back(text, index):
+    while index and text[index - 1] in ' \t':
+        index -= 1
+    return index
+
+
+def _skip_blanks(text, index):
+    while index < len(text) and text[index] in ' \t':
+        index += 1
+    return index
+
+
+def _section_lines_start(text, index):
+    """Start of the line a section at `index` begins, and of one blank line before it; `index` if text precedes it"""
+    start = _skip_blanks_back(text, index)
+    if start and text[start - 1] != '\n':
+        return index
+    if start:
+        blank = _skip_blanks_back(text, start - 1)
+        if blank and text[blank - 1] == '\n':
+            return blank
+    return start
+
+
+def _section_lines_end(text, index):
+    """End of the line a section ends at `index`, and of one blank line after it; `index` if text follows it"""
+    end = _skip_blanks(text, index)
+    if end == len(text):
+        return end
+    if text[end] != '\n':
+        return index
+    blank = _skip_blanks(text, end + 1)
+    if blank < len(text) and text[blank] == '\n':
+        return blank + 1
+    return end + 1
+
+
+def remove_sections(text, start, find_end):
+    """Remove every `start` ... find_end(text, after start) span of `text`
+
+    A section on lines of its own goes with those lines and with at most one
+    blank line on each side, the ones a patcher adds around the section it
+    inserts, so removing a section gives back the page as it was before. Each
+    character is scanned once: the end is searched from the start it belongs to,
+    and once a section does not close no later one is removed either.
+    """
+    pieces = []
+    position = 0
+    while True:
+        begin = text.find(start, position)
+        if begin == -1:
+            break
+        end = find_end(text, begin + len(start))
+        if end == -1:
+            break
+        pieces.append(text[position:max(position, _section_lines_start(text, begin))])
+        position = _section_lines_end(text, end)
+    if not pieces:
+        return text
+    pieces.append(text[position:])
+    return ''.join(pieces)
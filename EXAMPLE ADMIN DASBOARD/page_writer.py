@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+"""
+Atomic, skip-if-identical writes for generated and patched pages
+
+express.static derives ETag/Last-Modified from each file's size and mtime, so
+rewriting a page with the same bytes still invalidates every browser and CDN
+cache of it. write_if_changed() leaves identical files untouched, and writes
+real changes to a temp file in the same directory which is fsynced and then
+os.replace()d over the page, so the server never serves a half-written file.
+"""
+
+import os
+import tempfile
+
+# Mode of newly created pages (before the umask), matching a plain open(path, 'w')
+DEFAULT_MODE = 0o666
+
+
+def _process_umask():
+    """The umask, read without changing it where the kernel reports it
+
+    Elsewhere it is read once, at import, by setting and restoring it; the umask
+    is process-wide, so doing that during a write could give files another
+    thread creates meanwhile mode 0.
+    """
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('Umask:'):
+                    return int(line.split()[1], 8)
+    except OSError:
+        pass
+    mask = os.umask(0)
+    os.umask(mask)
+    return mask
+
+
+UMASK = _process_umask()
+
+
+def read_bytes(path):
+    """File content, or None if it does not exist"""
+    try:
+        with open(path, 'rb') as f:
+            return f.read()
+    except FileNotFoundError:
+        return None
+
+
+def atomic_write_bytes(path, data):
+    """Replace `path` with `data` through an fsynced temp file, keeping the old file's mode"""
+    directory = os.path.dirname(os.path.abspath(path))
+    try:
+        mode = os.stat(path).st_mode & 0o7777
+    except FileNotFoundError:
+        mode = DEFAULT_MODE & ~UMASK
+
+    fd, temp_path = tempfile.mkstemp(prefix='.' + os.path.basename(path) + '.', suffix='.tmp', dir=directory)
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.chmod(temp_path, mode)
+        os.replace(temp_path, path)
+    except BaseException:
+        try:
+            os.unlink(temp_path)
+        except FileNotFoundError:
+            pass
+        raise
+
+    # Make the rename itself durable
+    try:
+        dir_fd = os.open(directory, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(dir_fd)
+    except OSError:
+        pass
+    finally:
+        os.close(dir_fd)
+
+
+def write_if_changed(path, content, encoding='utf-8'):
+    """Atomically write `content` to `path` unless the file already holds exactly those bytes
+
+    Returns True if the file was written.
+    """
+    data = content.encode(encoding) if isinstance(content, str) else content
+    if read_bytes(path) == data:
+        return False
+    atomic_write_bytes(path, data)
+    return True
@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+"""
+Persistent manifest of pages already patched by the page patchers
+
+Records each patched page's size, mtime, content hash and the version of the
+patch definition applied to it, in a small JSON file next to the pages. Reruns
+only stat the pages: a page whose size and mtime still match its entry, for the
+same patch version, is skipped without being opened. A page whose stat changed
+is hashed, and skipped too if its content turns out to be identical.
+"""
+
+import hashlib
+import json
+import os
+
+from page_writer import write_if_changed
+
+DEFAULT_MANIFEST = 'pages/.patch_manifest.json'
+
+MANIFEST_FORMAT = 1
+
+
+def definition_version(*parts):
+    """Short hash identifying a patch definition (rules, payloads, ...)"""
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(repr(part).encode('utf-8'))
+        digest.update(b'\0')
+    return digest.hexdigest()[:16]
+
+
+def file_digest(path):
+    """SHA-256 of a file's content"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class PatchManifest:
+    """The entries of one patcher (`patch_name`) in a manifest file
+
+    Each patcher keeps its own section, so several patchers can share the file.
+    """
+
+    def __init__(self, patch_name, version, path=DEFAULT_MANIFEST):
+        self.patch_name = patch_name
+        self.version = version
+        self.path = path
+        self.sections = {}
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            if data.get('format') == MANIFEST_FORMAT:
+                self.sections = data.get('patches', {})
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError) as e:
+            print(f"⚠️ Ignoring unreadable patch manifest {path}: {e}")
+        self.entries = self.sections.setdefault(patch_name, {})
+        self.dirty = False
+
+    def is_current(self, page, source=None):
+        """True if `page` was patched with this version and has not changed since
+
+        `source` fingerprints whatever else the page was built from (e.g. the
+        product row of a generated page); it must match the recorded one too.
+        """
+        entry = self.entries.get(page)
+        if not entry or entry.get('version') != self.version or entry.get('source') != source:
+            return False
+        try:
+            stat = os.stat(page)
+        except OSError:
+            return False
+        if stat.st_size == entry['size'] and stat.st_mtime_ns == entry['mtime_ns']:
+            return True
+        # Touched or rewritten: only the content decides
+        if stat.st_size != entry['size'] or file_digest(page) != entry['sha256']:
+            return False
+        entry['mtime_ns'] = stat.st_mtime_ns
+        self.dirty = True
+        return True
+
+    def record(self, page, source=None):
+        """Remember `page` as patched with this version (and `source`), in its current state"""
+        stat = os.stat(page)
+        self.entries[page] = {
+            'size': stat.st_size,
+            'mtime_ns': stat.st_mtime_ns,
+            'sha256': file_digest(page),
+            'version': self.version,
+        }
+        if source is not None:
+            self.entries[page]['source'] = source
+        self.dirty = True
+
+    def forget(self, page):
+        if self.entries.pop(page, None) is not None:
+            self.dirty = True
+
+    def save(self):
+        """Write the manifest if anything changed, replacing the old file atomically"""
+        if not self.dirty:
+            return
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        write_if_changed(self.path, json.dumps({'format': MANIFEST_FORMAT, 'patches': self.sections},
+                                               indent=1, sort_keys=True))
+        self.dirty = False
@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+"""
+Precompressed .gz/.br siblings for patched and generated pages
+
+Each page gets `<page>.<hash>.gz` and `<page>.<hash>.br` next to it, named after
+the hash of the page content, so a server can send the precompressed bytes
+(and cache them as immutable) instead of compressing on every request. The
+index in pages/.precompressed.json maps each page, by its path relative to the
+index's directory, to the truncated content hash in its siblings' names and to
+the siblings themselves; siblings of an older version of a page are removed
+when it is recompressed.
+
+Brotli output needs the optional `brotli` package; without it only .gz is
+written.
+"""
+
+import gzip
+import hashlib
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from page_writer import atomic_write_bytes, write_if_changed
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+DEFAULT_INDEX = 'pages/.precompressed.json'
+
+GZIP_LEVEL = 9
+BROTLI_QUALITY = 11
+
+# Hex digits of the content hash used in sibling names
+HASH_LENGTH = 12
+
+
+def compressors():
+    """encoding -> (sibling suffix, compress function), brotli only when installed"""
+    available = {'gzip': ('.gz', lambda data: gzip.compress(data, GZIP_LEVEL, mtime=0))}
+    if brotli is not None:
+        available['br'] = ('.br', lambda data: brotli.compress(data, quality=BROTLI_QUALITY))
+    return available
+
+
+def compress_page(path):
+    """Worker: write the hashed .gz/.br siblings of one page
+
+    Returns (path, digest, {encoding: sibling file name}).
+    """
+    with open(path, 'rb') as f:
+        data = f.read()
+    digest = hashlib.sha256(data).hexdigest()[:HASH_LENGTH]
+    siblings = {}
+    for encoding, (suffix, compress) in compressors().items():
+        sibling = f"{path}.{digest}{suffix}"
+        if not os.path.exists(sibling):
+            atomic_write_bytes(sibling, compress(data))
+        siblings[encoding] = os.path.basename(sibling)
+    return path, digest, siblings
+
+
+def load_index(index_path=DEFAULT_INDEX):
+    try:
+        with open(index_path, 'r', encoding='utf-8') as f:
+            index = json.load(f)
+    except FileNotFoundError:
+        return {}
+    except (OSError, ValueError) as e:
+        print(f"⚠️ Rebuilding unreadable precompression index {index_path}: {e}")
+        return {}
+    # Older indexes called the truncated hash `sha256`
+    for entry in index.values():
+        if 'sha256' in entry:
+            entry['digest'] = entry.pop('sha256')
+    return index
+
+
+def _remove_siblings(path, entry, keep=()):
+    directory = os.path.dirname(path)
+    for sibling in entry.get('files', {}).values():
+        if sibling in keep:
+            continue
+        try:
+            os.remove(os.path.join(directory, sibling))
+        except FileNotFoundError:
+            pass
+
+
+def _index_key(path, index_path):
+    """The page's path relative to the index's directory, so same-named pages in different directories stay apart"""
+    relative = os.path.relpath(path, os.path.dirname(index_path) or '.')
+    return relative.replace(os.sep, '/')
+
+
+def precompress_pages(paths, jobs=1, index_path=DEFAULT_INDEX):
+    """Compress the given (rewritten) pages, `jobs` at a time, and update the index
+
+    Only the pages passed in are touched; returns how many were compressed.
+    """
+    paths = list(dict.fromkeys(paths))
+    if not paths:
+        return 0
+    if brotli is None:
+        print("⚠️ brotli is not installed; writing .gz siblings only")
+
+    if jobs <= 1:
+        results = map(compress_page, paths)
+        pool = None
+    else:
+        pool = ProcessPoolExecutor(max_workers=jobs)
+        results = pool.map(compress_page, paths, chunksize=max(1, len(paths) // (jobs * 8)))
+
+    index = load_index(index_path)
+    count = 0
+    try:
+        for path, digest, siblings in results:
+            key = _index_key(path, index_path)
+            previous = index.get(key)
+            if previous:
+                _remove_siblings(path, previous, keep=set(siblings.values()))
+            index[key] = {'digest': digest, 'files': siblings}
+            count += 1
+    finally:
+        if pool is not None:
+            pool.shutdown()
+        save_index(index, index_path)
+    return count
+
+
+def remove_precompressed(paths, index_path=DEFAULT_INDEX):
+    """Drop the siblings and index entries of pages that were deleted"""
+    index = load_index(index_path)
+    for path in paths:
+        entry = index.pop(_index_key(path, index_path), None)
+        if entry:
+            _remove_siblings(path, entry)
+    save_index(index, index_path)
+
+
+def save_index(index, index_path=DEFAULT_INDEX):
+    os.makedirs(os.path.dirname(index_path) or '.', exist_ok=True)
+    write_if_changed(index_path, json.dumps(index, indent=1, sort_keys=True))
@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+"""
+Size chart presets, loaded once from size_chart_presets.json
+
+The preset table used to be a JavaScript literal pasted into every patcher
+payload. It now lives in one data file: the patchers render the presets object
+of applySizeChartPreset from it, and the importer stores each product's
+ready-made size_chart JSON (garment type picked from the product's name and
+tags) so pages no longer work it out on load.
+"""
+
+import json
+import os
+import re
+from functools import lru_cache
+
+PRESETS_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'size_chart_presets.json')
+
+_WORD = re.compile(r'[a-z0-9]+')
+
+
+@lru_cache(maxsize=None)
+def load_presets(path=PRESETS_FILE):
+    """The parsed preset file, validated; read once per process"""
+    with open(path, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    sizes = data['sizes']
+    for garment_type, preset in data['presets'].items():
+        missing = [size for size in sizes if size not in preset['sizes']]
+        if missing:
+            raise ValueError(f"Preset {garment_type!r} in {path} has no measurements for {', '.join(missing)}")
+    if data['default_garment_type'] not in data['presets']:
+        raise ValueError(f"Default garment type {data['default_garment_type']!r} is not a preset in {path}")
+    return data
+
+
+@lru_cache(maxsize=None)
+def _matching_order(path=PRESETS_FILE):
+    """(garment type, keyword sets) pairs, most specific preset first"""
+    presets = load_presets(path)['presets']
+    order = [
+        (garment_type, [frozenset(group) for group in preset['keywords']])
+        for garment_type, preset in presets.items() if preset['keywords']
+    ]
+    return sorted(order, key=lambda item: -len(item[1]))
+
+
+def garment_type_for(product, path=PRESETS_FILE):
+    """Preset matching a product: every keyword group of the preset must hit a word of its name or tags"""
+    text = ' '.join([product.get('name') or ''] + [str(tag) for tag in product.get('tags') or []])
+    words = set(_WORD.findall(text.lower()))
+    for garment_type, groups in _matching_order(path):
+        if all(group & words for group in groups):
+            return garment_type
+    return load_presets(path)['default_garment_type']
+
+
+def preset_size_chart(garment_type, path=PRESETS_FILE):
+    """size_chart value for a garment type, in the shape getSizeChartData() submits"""
+    data = load_presets(path)
+    preset = data['presets'][garment_type]['sizes']
+    return {
+        'garmentType': garment_type,
+        'sizes': {size: dict(preset[size]) for size in data['sizes']},
+    }
+
+
+@lru_cache(maxsize=None)
+def size_chart_json(garment_type, path=PRESETS_FILE):
+    """Serialized size_chart for a garment type; products of one type share the string"""
+    return json.dumps(preset_size_chart(garment_type, path), separators=(',', ':'))
+
+
+def product_size_chart(product, path=PRESETS_FILE):
+    """Precomputed size_chart JSON for a product"""
+    return size_chart_json(garment_type_for(product, path), path)
+
+
+def presets_js(indent='', path=PRESETS_FILE):
+    """The presets as a JavaScript object literal, continuation lines prefixed with `indent`"""
+    data = load_presets(path)
+    lines = ['{']
+    garment_types = list(data['presets'])
+    for garment_type in garment_types:
+        preset = data['presets'][garment_type]['sizes']
+        lines.append(f"    {json.dumps(garment_type)}: {{")
+        for size in data['sizes']:
+            separator = ',' if size != data['sizes'][-1] else ''
+            lines.append(f"        {json.dumps(size)}: {json.dumps(preset[size])}{separator}")
+        lines.append('    },' if garment_type != garment_types[-1] else '    }')
+    lines.append('}')
+    return ('\n' + indent).join(lines)
@@ -0,0 +1,173 @@
+#!/usr/bin/env python3
+"""
+Full table reloads through a staging table swapped in at the end
+
+Reloading products in place (DELETE, then COPY) maintains every secondary index
+row by row, leaves the old rows behind as dead tuples and keeps the planner on
+the statistics of the old catalog. A staged reload instead:
+
+  1. creates `<table>_staging` LIKE the table but without indexes, and gives it
+     the table's triggers so rows load exactly as before;
+  2. lets the caller fill it (COPY updates no index);
+  3. builds every index in one pass each and adds the table's outgoing foreign
+     keys;
+  4. in the same transaction: deletes the old rows other tables reference (so
+     their ON DELETE actions run as with a plain reload), hands the table's SERIAL
+     sequences to the staging table, drops the old table, renames the staging
+     table and its indexes to the original names, re-adds incoming foreign keys
+     and ANALYZEs it.
+
+The staging table is an ordinary logged table: an UNLOGGED one would have to be
+made LOGGED before the swap, which rewrites it and WAL-logs every row anyway.
+With wal_level = minimal, rows COPYed into a table created in the same
+transaction skip the WAL regardless; otherwise they are logged once.
+
+Steps 1-3 take only ACCESS SHARE on the table, as long as the caller has not
+altered it earlier in the transaction, so readers keep seeing the old table
+while the copy loads and indexes. Step 4 takes the exclusive lock (waiting at
+most SWAP_LOCK_TIMEOUT for readers), which then lasts until the caller
+commits, so whatever runs after swap_in() should be short. Tables used by
+views, identity columns, row security policies and grants to other roles are
+not carried over, so reloads of such tables should stay in place.
+"""
+
+import re
+from collections import namedtuple
+
+STAGING_SUFFIX = '_staging'
+
+# Memory for each index build of the staged table
+INDEX_BUILD_MEMORY = '256MB'
+
+# Longest wait for readers to release the table before the swap gives up
+SWAP_LOCK_TIMEOUT = '10s'
+
+TableDefinition = namedtuple('TableDefinition', ['indexes', 'foreign_keys', 'referencing', 'triggers', 'sequences'])
+TableDefinition.__doc__ = """What a staged copy of a table has to rebuild
+
+indexes      (index name, CREATE INDEX statement, and the name, type and definition of
+             the constraint it backs, or None)
+foreign_keys (constraint name, definition) of the table's own references to other tables
+referencing  (table, constraint name, definition, whether it is a self-reference, referencing
+             columns, referenced columns) of foreign keys pointing at the table
+triggers     (trigger name, CREATE TRIGGER statement)
+sequences    (sequence, column) owned by the table's SERIAL columns
+"""
+
+INDEXES = """
+    SELECT i.relname, pg_get_indexdef(x.indexrelid), c.conname, c.contype, pg_get_constraintdef(c.oid)
+    FROM pg_index x
+    JOIN pg_class i ON i.oid = x.indexrelid
+    LEFT JOIN pg_constraint c
+           ON c.conindid = x.indexrelid AND c.conrelid = x.indrelid AND c.contype IN ('p', 'u', 'x')
+    WHERE x.indrelid = %s::regclass
+    ORDER BY x.indisprimary DESC, i.relname
+"""
+FOREIGN_KEYS = """
+    SELECT conname, pg_get_constraintdef(oid) FROM pg_constraint
+    WHERE conrelid = %s::regclass AND contype = 'f' AND confrelid <> conrelid
+"""
+REFERENCING = """
+    SELECT c.conrelid::regclass::text, c.conname, pg_get_constraintdef(c.oid), c.conrelid = c.confrelid,
+           (SELECT string_agg(quote_ident(a.attname), ', ' ORDER BY k.n)
+            FROM unnest(c.conkey) WITH ORDINALITY k(attnum, n)
+            JOIN pg_attribute a ON a.attrelid = c.conrelid AND a.attnum = k.attnum),
+           (SELECT string_agg(quote_ident(a.attname), ', ' ORDER BY k.n)
+            FROM unnest(c.confkey) WITH ORDINALITY k(attnum, n)
+            JOIN pg_attribute a ON a.attrelid = c.confrelid AND a.attnum = k.attnum)
+    FROM pg_constraint c
+    WHERE c.confrelid = %s::regclass AND c.contype = 'f'
+"""
+TRIGGERS = "SELECT tgname, pg_get_triggerdef(oid) FROM pg_trigger WHERE tgrelid = %s::regclass AND NOT tgisinternal"
+SEQUENCES = """
+    SELECT s.oid::regclass::text, a.attname FROM pg_depend d
+    JOIN pg_class s ON s.oid = d.objid AND s.relkind = 'S'
+    JOIN pg_attribute a ON a.attrelid = d.refobjid AND a.attnum = d.refobjsubid
+    WHERE d.refobjid = %s::regclass AND d.deptype = 'a'
+"""
+DEPENDENT_VIEWS = """
+    SELECT DISTINCT r.ev_class::regclass::text FROM pg_depend d
+    JOIN pg_rewrite r ON r.oid = d.objid
+    WHERE d.refobjid = %s::regclass AND r.ev_class <> %s::regclass
+"""
+
+_INDEX_NAME = re.compile(r'^CREATE (UNIQUE )?INDEX \S+ ON ')
+
+
+def _retarget(statement, table, staging):
+    """A CREATE INDEX/TRIGGER statement of `table` rewritten to act on `staging`"""
+    pattern = re.compile(r' ON (ONLY )?(?:[\w$"]+\.)?' + re.escape(table) + r' ')
+    return pattern.sub(lambda m: f" ON {m.group(1) or ''}{staging} ", statement, count=1)
+
+
+def describe_table(cursor, table):
+    """The TableDefinition of `table`; refuses tables that views depend on"""
+    cursor.execute(DEPENDENT_VIEWS, (table, table))
+    views = [row[0] for row in cursor.fetchall()]
+    if views:
+        raise RuntimeError(f"{table} is used by {', '.join(views)}; reload it in place instead")
+    definition = []
+    for query in (INDEXES, FOREIGN_KEYS, REFERENCING, TRIGGERS, SEQUENCES):
+        cursor.execute(query, (table,))
+        definition.append(cursor.fetchall())
+    return TableDefinition(*definition)
+
+
+def create_staging_table(cursor, table, definition):
+    """Create the index-free staging copy of `table` with its triggers; returns its name"""
+    staging = table + STAGING_SUFFIX
+    cursor.execute(f"CREATE TABLE {staging} (LIKE {table} INCLUDING ALL EXCLUDING INDEXES)")
+    for _, statement in definition.triggers:
+        cursor.execute(_retarget(statement, table, staging))
+    return staging
+
+
+def _staging_index_name(staging, number):
+    return f"{staging}_idx{number}"
+
+
+def build_indexes(cursor, table, staging, definition):
+    """Build the loaded staging table's indexes and outgoing foreign keys"""
+    cursor.execute(f"SET LOCAL maintenance_work_mem = '{INDEX_BUILD_MEMORY}'")
+    for number, (_, statement, _, constraint_type, _) in enumerate(definition.indexes):
+        if constraint_type == 'x':
+            # Exclusion constraints cannot adopt an index; swap_in() re-adds them whole
+            continue
+        statement = _INDEX_NAME.sub(
+            lambda m: f"CREATE {m.group(1) or ''}INDEX {_staging_index_name(staging, number)} ON ", statement)
+        cursor.execute(_retarget(statement, table, staging))
+    for name, constraint in definition.foreign_keys:
+        cursor.execute(f'ALTER TABLE {staging} ADD CONSTRAINT "{name}" {constraint}')
+
+
+def swap_in(cursor, table, staging, definition):
+    """Replace `table` with the finished staging table under one short exclusive lock, then ANALYZE it"""
+    for referencing_table, _, _, self_reference, columns, referenced in definition.referencing:
+        # Fire the ON DELETE actions of referencing tables as an in-place reload would; only
+        # referenced rows have any, and self-references leave with the old table
+        if not self_reference:
+            cursor.execute(f"DELETE FROM {table} WHERE ({referenced}) IN "
+                           f"(SELECT {columns} FROM {referencing_table})")
+    cursor.execute(f"SET LOCAL lock_timeout = '{SWAP_LOCK_TIMEOUT}'")
+    cursor.execute(f"LOCK TABLE {table} IN ACCESS EXCLUSIVE MODE")
+    for referencing_table, name, *_ in definition.referencing:
+        cursor.execute(f'ALTER TABLE {referencing_table} DROP CONSTRAINT "{name}"')
+    for sequence, column in definition.sequences:
+        cursor.execute(f'ALTER SEQUENCE {sequence} OWNED BY {staging}."{column}"')
+    cursor.execute(f"DROP TABLE {table}")
+    cursor.execute(f"ALTER TABLE {staging} RENAME TO {table}")
+
+    for number, (index_name, _, constraint_name, constraint_type, constraint) in enumerate(definition.indexes):
+        staged_index = _staging_index_name(staging, number)
+        if constraint_type in ('p', 'u'):
+            kind = 'PRIMARY KEY' if constraint_type == 'p' else 'UNIQUE'
+            timing = ''.join(clause for clause in (' DEFERRABLE', ' INITIALLY DEFERRED') if clause in constraint)
+            cursor.execute(f'ALTER TABLE {table} ADD CONSTRAINT "{constraint_name}" {kind} '
+                           f'USING INDEX {staged_index}{timing}')
+        elif constraint_type == 'x':
+            cursor.execute(f'ALTER TABLE {table} ADD CONSTRAINT "{constraint_name}" {constraint}')
+        else:
+            cursor.execute(f'ALTER INDEX {staged_index} RENAME TO "{index_name}"')
+    for referencing_table, name, constraint, *_ in definition.referencing:
+        cursor.execute(f'ALTER TABLE {referencing_table} ADD CONSTRAINT "{name}" {constraint}')
+    cursor.execute(f"ANALYZE {table}")
@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+"""
+Rebuilding a page with complete_size_chart_implementation.py must be idempotent
+
+Run with: python -m unittest test_complete_size_chart_implementation
+"""
+
+import contextlib
+import io
+import os
+import tempfile
+import unittest
+
+from complete_size_chart_implementation import add_complete_size_chart_functionality
+from page_patterns import SIZE_CHART_SECTION_START, remove_sections, size_chart_section_end
+
+# The parts of an edit page the patcher's rules anchor on
+EDIT_PAGE = """<!DOCTYPE html>
+<html>
+<body>
+    <form id="edit-product-form">
+        <div class="space-y-6">
+                        <div>
+                            <label for="product-name">Name</label>
+                            <input type="text" id="product-name">
+                        </div>
+
+                        <!-- Tags -->
+                        <div>
+                            <label for="product-tags">Tags</label>
+                            <input type="text" id="product-tags">
+                        </div>
+        </div>
+    </form>
+    <script>
+        function populateForm(productData) {
+            const features = productData.features || {};
+            document.getElementById('feature-soft-touch').checked = features.soft_touch !== false;
+        }
+
+        function collectFormData() {
+            const formData = {
+                name: document.getElementById('product-name').value,
+                size_stock: sizeStock,
+            };
+            return formData;
+        }
+
+        // Initialize after authentication
+        function initializeEditPage() {
+            setupSizeSelection();
+        }
+    </script>
+</body>
+</html>
+"""
+
+
+class CompleteSizeChartTest(unittest.TestCase):
+
+    def setUp(self):
+        handle, self.path = tempfile.mkstemp(suffix='.html')
+        with os.fdopen(handle, 'w', encoding='utf-8') as f:
+            f.write(EDIT_PAGE)
+
+    def tearDown(self):
+        os.unlink(self.path)
+
+    def patch(self):
+        with contextlib.redirect_stdout(io.StringIO()):
+            self.assertTrue(add_complete_size_chart_functionality(self.path))
+        with open(self.path, 'r', encoding='utf-8') as f:
+            return f.read()
+
+    def test_second_run_leaves_page_unchanged(self):
+        first = self.patch()
+        self.assertIn(SIZE_CHART_SECTION_START, first)
+        self.assertEqual(self.patch(), first)
+
+    def test_patched_page_keeps_its_divs_balanced(self):
+        for _ in range(2):
+            page = self.patch()
+        self.assertEqual(page.count('<div'), page.count('</div>'))
+
+    def test_removing_the_section_restores_the_page(self):
+        page = self.patch()
+        restored = remove_sections(page, SIZE_CHART_SECTION_START, size_chart_section_end)
+        self.assertEqual(restored.split('<script>')[0], EDIT_PAGE.split('<script>')[0])
+
+
+if __name__ == '__main__':
+    unittest.main()
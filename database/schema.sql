@@ -1,6 +1,9 @@
 -- Hot Wheels Velocity Database Schema
 -- PostgreSQL Database Tables for eCommerce Platform
 
+-- Trigram matching for partial product name search (catalog_search.py)
+CREATE EXTENSION IF NOT EXISTS pg_trgm WITH SCHEMA public;
+
 -- Users table for authentication and profiles
 CREATE TABLE IF NOT EXISTS users (
     id VARCHAR(255) PRIMARY KEY,
@@ -88,6 +91,16 @@ CREATE TABLE IF NOT EXISTS products (
     original_packaging BOOLEAN DEFAULT FALSE,
     certified_authentic BOOLEAN DEFAULT FALSE,
     
+    -- add_all_products.py --sync bookkeeping: the source identity and content hash of each imported row
+    import_key VARCHAR(255),
+    content_hash CHAR(64),
+    
+    -- Size chart for the product's garment type, precomputed by add_all_products.py
+    size_chart JSONB,
+    
+    -- Weighted full-text document, refreshed by add_all_products.py (catalog_search.py)
+    search_vector TSVECTOR,
+    
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
     updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
 );
@@ -107,7 +120,25 @@ CREATE TABLE IF NOT EXISTS product_images (
     alt_text VARCHAR(255),
     sort_order INTEGER DEFAULT 0,
     is_primary BOOLEAN DEFAULT FALSE,
-    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    -- Source image and its derivatives, recorded by add_all_products.py --images
+    width INTEGER,
+    height INTEGER,
+    byte_size INTEGER,
+    content_hash CHAR(64),
+    variants JSONB
+);
+
+-- Per-category product aggregates, kept current by add_all_products.py ('' = uncategorized)
+CREATE TABLE IF NOT EXISTS category_summary (
+    category TEXT PRIMARY KEY,
+    product_count INTEGER NOT NULL,
+    min_price DECIMAL(10,2),
+    max_price DECIMAL(10,2),
+    featured_count INTEGER NOT NULL,
+    on_sale_count INTEGER NOT NULL,
+    max_sale_percentage INTEGER,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
 );
 
 -- Homepage listings for featured and exclusive collections
@@ -354,6 +385,19 @@ CREATE INDEX IF NOT EXISTS idx_users_email ON users(email);
 CREATE INDEX IF NOT EXISTS idx_products_sku ON products(sku);
 CREATE INDEX IF NOT EXISTS idx_products_slug ON products(slug);
 CREATE INDEX IF NOT EXISTS idx_products_active ON products(is_active);
+CREATE UNIQUE INDEX IF NOT EXISTS idx_products_import_key ON products (import_key);
+CREATE INDEX IF NOT EXISTS idx_products_search_vector ON products USING GIN (search_vector);
+CREATE INDEX IF NOT EXISTS idx_products_name_trgm ON products USING GIN (name public.gin_trgm_ops);
+CREATE INDEX IF NOT EXISTS idx_products_search_stale ON products (id) WHERE search_vector IS NULL;
+-- category_summary refreshes aggregate only the categories they recompute; products
+-- tables created without the importer's category column are left without it
+DO $$
+BEGIN
+    IF EXISTS (SELECT 1 FROM information_schema.columns
+               WHERE table_name = 'products' AND column_name = 'category' AND table_schema = current_schema()) THEN
+        CREATE INDEX IF NOT EXISTS idx_products_category_key ON products ((coalesce(category, '')));
+    END IF;
+END $$;
 CREATE INDEX IF NOT EXISTS idx_cart_items_user_id ON cart_items(user_id);
 CREATE INDEX IF NOT EXISTS idx_cart_items_session_id ON cart_items(session_id);
 CREATE INDEX IF NOT EXISTS idx_orders_user_id ON orders(user_id);